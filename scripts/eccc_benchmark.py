@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_benchmark.py
+Description: Measure the speed of get_canadian_weather_observations.py and keep
+ the results over time.
+
+Notes: 'startup' runs the script in new processes, with a local station list
+ so nothing is downloaded, and measures the import time and the time until the
+ first line printed by --info and --dry-run. 'planning' times in this process,
+ without network, each phase preparing a download of every station (daily and
+ hourly) for synthetic station lists of increasing size, and prints the time
+ per station of each size to check that the planning stays near-linear. Each
+ measure is the median of several runs. With --history, the results are
+ appended to a JSON lines file and compared with the previous results of the
+ same benchmark and parameters.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+import contextlib
+import subprocess
+
+import eccc_inventory
+
+DEFAULT_REPEAT = 5
+DEFAULT_PLANNING_STATIONS = [10000, 100000]
+
+# Phases of the planning, in the order they are run
+lPlanningPhase = ["load_station_list", "fetch_requested_stations", "set_interval_date", \
+                  "create_url", "create_directories"]
+
+SCRIPT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+SCRIPT_PATH = os.path.join(SCRIPT_DIRECTORY, "get_canadian_weather_observations.py")
+
+def write_station_list(sPath, nStation, nSeed=0):
+   """
+   Write a synthetic station list with the layout of the ECCC file (4 lines before
+   the stations). Station ID start at 1, every station reports up to this year.
+   """
+
+   rand = random.Random(nSeed)
+   lProvince = sorted(eccc_inventory.dProvEN.keys())
+   nLastYear = datetime.datetime.now().year
+   with open(sPath, 'w', newline='') as fileList:
+      fileList.write('"Modified Date","' + datetime.date.today().isoformat() + '"\n')
+      fileList.write('"Synthetic station list"\n')
+      fileList.write('"Written by eccc_benchmark.py"\n')
+      fileList.write(",".join(['"' + sColumn + '"' for sColumn in eccc_inventory.COLUMN_TITLE_EN]) + "\n")
+      for nStation in range(1, nStation + 1):
+         nFirstYear = rand.randint(1900, nLastYear - 1)
+         sHourly = ["", ""]
+         if rand.random() < 0.3:
+            sHourly = [str(max(nFirstYear, 1953)), str(nLastYear)]
+         fLatitude = rand.uniform(42.0, 82.0)
+         fLongitude = rand.uniform(-141.0, -52.0)
+         lRow = ["STATION " + str(nStation), rand.choice(lProvince), "%07d" % nStation, \
+                 str(nStation), "", "", "%.2f" % fLatitude, "%.2f" % fLongitude, \
+                 str(int(fLatitude * 1e7)), str(int(fLongitude * 1e7)), "10", \
+                 str(nFirstYear), str(nLastYear)] + sHourly + \
+                [str(nFirstYear), str(nLastYear), str(nFirstYear), str(min(nLastYear, 2007))]
+         fileList.write(",".join(['"' + sValue + '"' for sValue in lRow]) + "\n")
+
+def run_command(lArgument):
+   """
+   Run get_canadian_weather_observations.py in a new process.
+
+   OUTPUT
+   [fFirstOutput, fTotal]: seconds until the first line printed and until the end.
+   """
+
+   timeStart = time.perf_counter()
+   process = subprocess.Popen([sys.executable, SCRIPT_PATH] + lArgument, cwd=SCRIPT_DIRECTORY, \
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+   process.stdout.readline()
+   fFirstOutput = time.perf_counter() - timeStart
+   process.communicate()
+   fTotal = time.perf_counter() - timeStart
+
+   return [fFirstOutput, fTotal]
+
+def measure_import():
+   """
+   Seconds to import get_canadian_weather_observations in a new process.
+   """
+
+   sCode = "import time; t = time.perf_counter(); import get_canadian_weather_observations; " + \
+           "print(time.perf_counter() - t)"
+   sOutput = subprocess.check_output([sys.executable, "-c", sCode], cwd=SCRIPT_DIRECTORY)
+
+   return float(sOutput.decode().strip().splitlines()[-1])
+
+def median(lValue):
+   lValue = sorted(lValue)
+   return lValue[len(lValue) // 2]
+
+def benchmark_startup(sStationPath, nRepeat=DEFAULT_REPEAT):
+   """
+   Measure the startup of the planning commands.
+
+   OUTPUT
+   dResult: median seconds of "import", "info_first_output", "info_total",
+    "dry_run_first_output" and "dry_run_total".
+   """
+
+   sStation = eccc_inventory.read_station_rows(sStationPath)[0]["Station ID"].strip()
+   dSample = {}
+   with tempfile.TemporaryDirectory() as sOutputDirectory:
+      lInfo = ["--info", "-S", sStationPath, sStation]
+      lDryRun = ["--dry-run", "--daily", "-S", sStationPath, "-o", sOutputDirectory, sStation]
+      for i in range(nRepeat):
+         dSample.setdefault("import", []).append(measure_import())
+         for (sCommand, lArgument) in [("info", lInfo), ("dry_run", lDryRun)]:
+            [fFirstOutput, fTotal] = run_command(lArgument)
+            dSample.setdefault(sCommand + "_first_output", []).append(fFirstOutput)
+            dSample.setdefault(sCommand + "_total", []).append(fTotal)
+
+   return dict((sMeasure, median(lSample)) for (sMeasure, lSample) in dSample.items())
+
+def reset_station_list(moduleScript):
+   """
+   Empty the station dictionnaries of get_canadian_weather_observations, filled by
+   load_station_list.
+   """
+
+   moduleScript.dStationList.clear()
+   moduleScript.dStationAirport.clear()
+   for lStation in moduleScript.dProvTerrList.values():
+      del lStation[:]
+
+def benchmark_planning(sStationPath, sStartDate, sEndDate, nRepeat=DEFAULT_REPEAT):
+   """
+   Time the planning of the daily and hourly files of all the stations (requested by
+   province and territory) between sStartDate and sEndDate. Nothing is downloaded
+   nor created. The messages of the script are discarded.
+
+   OUTPUT
+   dResult: median seconds of each phase of lPlanningPhase, and "files", the number
+    of files planned.
+   """
+
+   import get_canadian_weather_observations as moduleScript
+
+   moduleScript.set_language("en")
+   moduleScript.nGlobalVerbosity = moduleScript.NORMAL
+   dObsPeriod = { "hourly" : True, "daily" : True, "monthly" : False, "climate" : False }
+
+   dSample = {}
+   nFiles = 0
+   with tempfile.TemporaryDirectory() as sOutputDirectory, \
+        open(os.devnull, 'w') as fileNull, contextlib.redirect_stdout(fileNull):
+      lDateRequested = moduleScript.check_input_dates([None, sStartDate, sEndDate])
+      for i in range(nRepeat):
+         reset_station_list(moduleScript)
+         lTime = [time.perf_counter()]
+         moduleScript.load_station_list(sStationPath)
+         lTime.append(time.perf_counter())
+         lStation = moduleScript.fetch_requested_stations(moduleScript.lProvTerrCode)
+         lTime.append(time.perf_counter())
+         dStationDates = moduleScript.set_interval_date(lStation, dObsPeriod, lDateRequested)
+         lTime.append(time.perf_counter())
+         lUrlPath = moduleScript.create_url(dStationDates, sOutputDirectory, False, "en", "csv", False)
+         lTime.append(time.perf_counter())
+         moduleScript.create_directories([lItem[1] for lItem in lUrlPath], True)
+         lTime.append(time.perf_counter())
+         for j in range(len(lPlanningPhase)):
+            dSample.setdefault(lPlanningPhase[j], []).append(lTime[j + 1] - lTime[j])
+         nFiles = len(lUrlPath)
+         del lUrlPath, dStationDates, lStation
+      reset_station_list(moduleScript)
+
+   dResult = dict((sMeasure, median(lSample)) for (sMeasure, lSample) in dSample.items())
+   dResult["files"] = nFiles
+
+   return dResult
+
+def format_scaling(lStation, lResult):
+   """
+   Microseconds per station of each phase, for each number of stations. A value growing
+   with the number of stations shows a phase that is not linear.
+   """
+
+   lLine = ["%-24s " % "us per station" + " ".join(["%12d" % nStation for nStation in lStation])]
+   for sMeasure in lPlanningPhase:
+      lLine.append("%-24s " % sMeasure + \
+                   " ".join(["%12.2f" % (1e6 * dResult[sMeasure] / nStation) \
+                             for (nStation, dResult) in zip(lStation, lResult)]))
+
+   return "\n".join(lLine)
+
+def get_revision():
+   """
+   Git commit of the scripts, None if unknown.
+   """
+
+   try:
+      sOutput = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], \
+                                        cwd=SCRIPT_DIRECTORY, stderr=subprocess.DEVNULL)
+   except (OSError, subprocess.CalledProcessError):
+      return None
+
+   return sOutput.decode().strip()
+
+def read_previous(sHistoryPath, sBenchmark, dParameter):
+   """
+   Last results of the same benchmark with the same parameters in the history, None if none.
+   """
+
+   dPrevious = None
+   if sHistoryPath is None or not os.path.exists(sHistoryPath):
+      return dPrevious
+
+   with open(sHistoryPath, 'r') as fileHistory:
+      for sLine in fileHistory:
+         if sLine.strip() == "":
+            continue
+         dRecord = json.loads(sLine)
+         if dRecord["benchmark"] == sBenchmark and dRecord["parameters"] == dParameter:
+            dPrevious = dRecord
+
+   return dPrevious
+
+def append_history(sHistoryPath, sBenchmark, dParameter, dResult):
+   """
+   Append the results to the history (JSON lines).
+   """
+
+   dRecord = { "benchmark" : sBenchmark, \
+               "time" : datetime.datetime.now().isoformat(timespec="seconds"), \
+               "revision" : get_revision(), \
+               "python" : sys.version.split()[0], \
+               "parameters" : dParameter, \
+               "results" : dResult }
+   with open(sHistoryPath, 'a') as fileHistory:
+      fileHistory.write(json.dumps(dRecord) + "\n")
+
+def format_results(dResult, dPrevious=None):
+   """
+   One line per measure, with the change since the previous results.
+   """
+
+   lLine = []
+   for sMeasure in sorted(dResult.keys()):
+      if sMeasure == "files": # Size of the plan, not a time
+         lLine.append("%-24s %10d" % (sMeasure, dResult[sMeasure]))
+         continue
+      sLine = "%-24s %10.4f s" % (sMeasure, dResult[sMeasure])
+      if dPrevious is not None and dPrevious["results"].get(sMeasure):
+         fPrevious = dPrevious["results"][sMeasure]
+         sLine = sLine + "   previous %10.4f s (%+.0f%%, %s)" % \
+                 (fPrevious, 100.0 * (dResult[sMeasure] - fPrevious) / fPrevious, \
+                  dPrevious["revision"] or dPrevious["time"])
+      lLine.append(sLine)
+
+   return "\n".join(lLine)
+
+############################################################
+# eccc_benchmark in Command line
+#
+
+def get_command_line():
+   """
+   Parse the command line and perform all the checks.
+   """
+
+   parser = argparse.ArgumentParser(prog='eccc_benchmark.py', \
+                                    description="Measure the speed of get_canadian_weather_observations.py and keep the results over time.")
+   parser.add_argument("--history", dest="HistoryPath", metavar=("PATH"), default=None, \
+                       help="Append the results to PATH (JSON lines) and compare them with the previous ones.",\
+                       action="store", type=str)
+   parser.add_argument("--repeat", "-r", dest="Repeat", default=DEFAULT_REPEAT, \
+                       help="Number of runs of each measure, the median is kept. Default is %d." % DEFAULT_REPEAT,\
+                       action="store", type=int)
+   subparsers = parser.add_subparsers(dest="Command", required=True)
+
+   parserStartup = subparsers.add_parser("startup", help="Import time and time to the first output of --info and --dry-run.")
+   parserStartup.add_argument("--station-file", "-S", dest="StationPath", default=None, \
+                              help="Station list used. Default is a synthetic list of 10000 stations.",\
+                              action="store", type=str)
+
+   parserPlanning = subparsers.add_parser("planning", help="Time of each phase planning the downloads, for synthetic station lists of increasing size.")
+   parserPlanning.add_argument("--stations", dest="StationCount", metavar=("N"), nargs="+", \
+                               default=DEFAULT_PLANNING_STATIONS, \
+                               help="Number of stations of each synthetic list, for example '10000 100000 1000000'. Default is %s. About 1 GB of memory is used per 200000 stations and year of hourly files." % " ".join([str(n) for n in DEFAULT_PLANNING_STATIONS]),\
+                               action="store", type=int)
+   parserPlanning.add_argument("--start-date", "-e", dest="StartDate", metavar=("YYYY[-MM]"), \
+                               default=None, \
+                               help="First month or year planned. Default is the first month of last year.",\
+                               action="store", type=str)
+   parserPlanning.add_argument("--end-date", "-f", dest="EndDate", metavar=("YYYY[-MM]"), \
+                               default=None, \
+                               help="Last month or year planned. Default is the last month of last year.",\
+                               action="store", type=str)
+
+   options = parser.parse_args()
+
+   if options.Repeat < 1:
+      print ("Error: '--repeat' must be at least 1. Exiting.")
+      exit(2)
+   if options.Command == "planning":
+      if len([nStation for nStation in options.StationCount if nStation < 1]) > 0:
+         print ("Error: '--stations' must be at least 1. Exiting.")
+         exit(2)
+      sLastYear = str(datetime.datetime.now().year - 1)
+      if options.StartDate is None:
+         options.StartDate = sLastYear + "-01"
+      if options.EndDate is None:
+         options.EndDate = sLastYear + "-12"
+   elif options.StationPath is not None and not os.path.exists(options.StationPath):
+      print ("Error: file '%s' does not exist. Exiting." % (options.StationPath))
+      exit(2)
+
+   return options
+
+def main(tOptions):
+   if tOptions.Command == "planning":
+      main_planning(tOptions)
+      return
+
+   with tempfile.TemporaryDirectory() as sTemporaryDirectory:
+      if tOptions.Command == "startup":
+         sStationPath = tOptions.StationPath
+         dParameter = { "station_file" : sStationPath }
+         if sStationPath is None:
+            sStationPath = os.path.join(sTemporaryDirectory, "station_list.csv")
+            write_station_list(sStationPath, 10000)
+            dParameter = { "stations" : 10000 }
+         dResult = benchmark_startup(sStationPath, tOptions.Repeat)
+
+   dPrevious = read_previous(tOptions.HistoryPath, tOptions.Command, dParameter)
+   print (format_results(dResult, dPrevious))
+   if tOptions.HistoryPath is not None:
+      append_history(tOptions.HistoryPath, tOptions.Command, dParameter, dResult)
+
+def main_planning(tOptions):
+   """
+   Run the planning benchmark for each number of stations. Each one has its own record
+   in the history.
+   """
+
+   lResult = []
+   with tempfile.TemporaryDirectory() as sTemporaryDirectory:
+      for nStation in tOptions.StationCount:
+         sStationPath = os.path.join(sTemporaryDirectory, "station_list.csv")
+         write_station_list(sStationPath, nStation)
+         dResult = benchmark_planning(sStationPath, tOptions.StartDate, tOptions.EndDate, \
+                                      tOptions.Repeat)
+         lResult.append(dResult)
+
+         dParameter = { "stations" : nStation, \
+                        "start_date" : tOptions.StartDate, \
+                        "end_date" : tOptions.EndDate }
+         dPrevious = read_previous(tOptions.HistoryPath, tOptions.Command, dParameter)
+         print ("%d stations, %s to %s" % (nStation, tOptions.StartDate, tOptions.EndDate))
+         print (format_results(dResult, dPrevious))
+         if tOptions.HistoryPath is not None:
+            append_history(tOptions.HistoryPath, tOptions.Command, dParameter, dResult)
+
+   print (format_scaling(tOptions.StationCount, lResult))
+
+
+if __name__ == "__main__":
+
+   tOptions = get_command_line()
+   main(tOptions)
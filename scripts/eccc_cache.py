@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_cache.py
+Description: On-disk cache of the HTTP responses (station list and observation
+ files), shared by get_canadian_weather_observations.py and the R scripts.
+
+Notes: An entry is two files named after the hash of the normalised URL: the
+ body (.data) and its metadata (.json: URL, headers, time stored). The URL is
+ normalised by sorting its parameters and dropping the dummy Year and Month of
+ the monthly and almanac requests. An entry expires after the TTL of its
+ timeframe, or after CLOSED_PERIOD_TTL if its month (hourly) or year (daily)
+ was already over when it was stored. The cache is kept under its size budget
+ by removing the least recently used entries. Files are written to a temporary
+ name then renamed, so several processes can share the same cache.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import datetime
+import tempfile
+import urllib.error
+import urllib.parse
+
+import eccc_manifest
+
+# Seconds an entry can be used, by timeframe of the request ("other" is the station list)
+dTimeFrameTTL = { "hourly" : 3600, \
+                  "daily" : 6 * 3600, \
+                  "monthly" : 7 * 86400, \
+                  "climate" : 30 * 86400, \
+                  "other" : 86400 }
+# Entry of a month or year that was over when it was stored
+CLOSED_PERIOD_TTL = 365 * 86400
+
+DEFAULT_SIZE_MB = 1000
+
+# Headers kept with the body
+lKeptHeader = ["Content-Disposition", "Content-Type"]
+
+def normalize_url(sURL):
+   """
+   URL used as the key of the cache: lower case scheme and host, sorted parameters,
+   without the dummy Year and Month of the monthly (3) and almanac (4) requests.
+   """
+
+   tURL = urllib.parse.urlsplit(sURL)
+   lQuery = urllib.parse.parse_qsl(tURL.query, keep_blank_values=True)
+   dQuery = dict(lQuery)
+   if dQuery.get("timeframe") in ["3", "4"]:
+      lQuery = [(sKey, sValue) for (sKey, sValue) in lQuery if sKey not in ["Year", "Month"]]
+
+   return urllib.parse.urlunsplit((tURL.scheme.lower(), tURL.netloc.lower(), tURL.path, \
+                                   urllib.parse.urlencode(sorted(lQuery)), ""))
+
+def get_entry_path(sCacheDirectory, sURL):
+   """
+   Path of an entry without its extension.
+   """
+
+   return os.path.join(sCacheDirectory, hashlib.sha1(normalize_url(sURL).encode()).hexdigest())
+
+def get_ttl(sURL, fStored):
+   """
+   Seconds an entry stored at fStored (time.time()) can be used.
+   """
+
+   dRequest = eccc_manifest.parse_url_request(sURL)
+   sTimeFrame = dRequest.get("timeframe")
+   if sTimeFrame not in dTimeFrameTTL:
+      return dTimeFrameTTL["other"]
+
+   # Observations of a month (hourly) or a year (daily) that was over do not change anymore
+   timeStored = datetime.datetime.fromtimestamp(fStored)
+   if sTimeFrame == "hourly" and dRequest["year"].isdigit() and dRequest["month"].isdigit() and \
+      (int(dRequest["year"]), int(dRequest["month"])) < (timeStored.year, timeStored.month):
+      return CLOSED_PERIOD_TTL
+   elif sTimeFrame == "daily" and dRequest["year"].isdigit() and \
+      int(dRequest["year"]) < timeStored.year:
+      return CLOSED_PERIOD_TTL
+
+   return dTimeFrameTTL[sTimeFrame]
+
+def write_atomic(sPath, content):
+   """
+   Write bytes to a temporary file, then rename it to sPath.
+   """
+
+   (nFile, sTemporaryPath) = tempfile.mkstemp(dir=os.path.dirname(sPath), suffix=".tmp")
+   with os.fdopen(nFile, "wb") as fileTemporary:
+      fileTemporary.write(content)
+   os.replace(sTemporaryPath, sPath)
+
+def lookup(sCacheDirectory, sURL):
+   """
+   Find a valid entry. The entry is marked as used for the LRU eviction.
+
+   OUTPUT
+   [dHeader, content] or None if there is no valid entry.
+   """
+
+   sEntryPath = get_entry_path(sCacheDirectory, sURL)
+   try:
+      with open(sEntryPath + ".json", "r") as fileMetadata:
+         dMetadata = json.load(fileMetadata)
+      if time.time() > dMetadata["stored"] + get_ttl(sURL, dMetadata["stored"]):
+         return None
+      with open(sEntryPath + ".data", "rb") as fileData:
+         content = fileData.read()
+      os.utime(sEntryPath + ".json")
+   except (OSError, ValueError, KeyError):
+      # No entry, or removed by another process
+      return None
+
+   return [dMetadata["headers"], content]
+
+def store(sCacheDirectory, sURL, dHeader, content):
+   """
+   Save a response in the cache. The body is written before the metadata, so an
+   entry is only found once it is complete.
+   """
+
+   if not os.path.isdir(sCacheDirectory):
+      os.makedirs(sCacheDirectory, exist_ok=True)
+   sEntryPath = get_entry_path(sCacheDirectory, sURL)
+   write_atomic(sEntryPath + ".data", content)
+   write_atomic(sEntryPath + ".json", json.dumps({ "url" : sURL, \
+                                                   "key" : normalize_url(sURL), \
+                                                   "headers" : dHeader, \
+                                                   "bytes" : len(content), \
+                                                   "stored" : time.time() }).encode())
+
+def fetch(sURL, sCacheDirectory=None):
+   """
+   Get a URL from the cache, or from the web site (and save it in the cache).
+
+   INPUT
+   sURL: URL to get
+   sCacheDirectory: directory of the cache. If None, the URL is always downloaded.
+
+   OUTPUT
+   [dHeader, content, bHit]: the headers of lKeptHeader, the body and True if it was
+    found in the cache.
+   """
+
+   if sCacheDirectory is not None:
+      lEntry = lookup(sCacheDirectory, sURL)
+      if lEntry is not None:
+         return lEntry + [True]
+
+   # Imported here since it is slow to import and not needed when everything is in the cache
+   import urllib.request
+
+   httpResponse = urllib.request.urlopen(sURL)
+   content = httpResponse.read()
+   dHeader = {}
+   for sHeader in lKeptHeader:
+      if httpResponse.headers.get(sHeader) is not None:
+         dHeader[sHeader] = httpResponse.headers.get(sHeader)
+
+   if sCacheDirectory is not None:
+      store(sCacheDirectory, sURL, dHeader, content)
+
+   return [dHeader, content, False]
+
+def evict(sCacheDirectory, nMaxBytes):
+   """
+   Remove the expired entries, then the least recently used ones until the cache
+   is smaller than nMaxBytes.
+
+   OUTPUT
+   [nRemoved, nBytes]: number of entries removed and size of the cache after.
+   """
+
+   if not os.path.isdir(sCacheDirectory):
+      return [0, 0]
+
+   fNow = time.time()
+   lEntry = []
+   lRemove = []
+   for sFilename in os.listdir(sCacheDirectory):
+      if not sFilename.endswith(".json"):
+         continue
+      sEntryPath = os.path.join(sCacheDirectory, sFilename[0:-len(".json")])
+      try:
+         with open(sEntryPath + ".json", "r") as fileMetadata:
+            dMetadata = json.load(fileMetadata)
+         fUsed = os.path.getmtime(sEntryPath + ".json")
+      except (OSError, ValueError):
+         continue
+      if fNow > dMetadata["stored"] + get_ttl(dMetadata["url"], dMetadata["stored"]):
+         lRemove.append(sEntryPath)
+      else:
+         lEntry.append((fUsed, dMetadata["bytes"], sEntryPath))
+
+   # Most recently used first, the others are removed once the budget is reached
+   nBytes = 0
+   for (fUsed, nEntryBytes, sEntryPath) in sorted(lEntry, reverse=True):
+      if nBytes + nEntryBytes > nMaxBytes:
+         lRemove.append(sEntryPath)
+      else:
+         nBytes = nBytes + nEntryBytes
+
+   for sEntryPath in lRemove:
+      for sExtension in [".json", ".data"]:
+         try:
+            os.remove(sEntryPath + sExtension)
+         except OSError:
+            pass
+
+   return [len(lRemove), nBytes]
+
+############################################################
+# eccc_cache in Command line
+#
+
+def get_command_line():
+   """
+   Parse the command line and perform all the checks.
+   """
+
+   parser = argparse.ArgumentParser(prog='eccc_cache.py', \
+                                    description="Get a URL through the HTTP cache of get_canadian_weather_observations.py, for the R scripts.")
+   parser.add_argument("URL", metavar="URL", nargs="?", default=None, \
+                       help="URL to get.", action="store", type=str)
+   parser.add_argument("--cache", "-c", dest="CacheDirectory", required=True, \
+                       help="Directory of the cache.", action="store", type=str)
+   parser.add_argument("--output", "-o", dest="OutputPath", default=None, \
+                       help="File where the body is written. Default is the standard output.",\
+                       action="store", type=str)
+   parser.add_argument("--cache-size", dest="CacheSize", metavar=("MB"), default=DEFAULT_SIZE_MB, \
+                       help="Size budget of the cache in megabytes. Default is %d." % DEFAULT_SIZE_MB,\
+                       action="store", type=float)
+
+   options = parser.parse_args()
+
+   return options
+
+def main(tOptions):
+   if tOptions.URL is not None:
+      try:
+         [dHeader, content, bHit] = fetch(tOptions.URL, tOptions.CacheDirectory)
+      except urllib.error.URLError as error:
+         print ("Error: cannot get '%s': %s. Exiting." % (tOptions.URL, error), file=sys.stderr)
+         exit(9)
+      if tOptions.OutputPath is None:
+         sys.stdout.buffer.write(content)
+      else:
+         with open(tOptions.OutputPath, "wb") as fileOutput:
+            fileOutput.write(content)
+
+   # Without URL, only the eviction is done
+   evict(tOptions.CacheDirectory, tOptions.CacheSize * 1e6)
+
+
+if __name__ == "__main__":
+
+   tOptions = get_command_line()
+   main(tOptions)
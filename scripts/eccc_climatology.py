@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_climatology.py
+Description: Build the representative precipitation year of every station
+ (ecclimate.precip_representative_year) from the downloaded daily files.
+
+Notes: Same table as scripts/interpolate/00_reset_rep_annual_dbase.R: for each
+ station and month-day, the mean and the number of non missing 'Total Precip'
+ values over the whole record. As in R, only the month-days having at least one
+ row in the daily files are written, with NA as mean when none of their rows has
+ a value. The daily files are read once, adding each value to a running sum and
+ count for its station and day of year. Only the stations whose daily files
+ changed since the previous build are read again; the others are copied from
+ the previous output. The XML files are read like the CSV files, with
+ eccc_xml.iter_table.
+"""
+
+import os
+import csv
+import json
+import hashlib
+import argparse
+
+import eccc_xml
+import eccc_manifest
+
+OUTPUT_COLUMNS = ["index", "mean_total_precip", "n_total_precip", "station_name", "ec_station_id"]
+
+# Column names in the English and French daily files
+lDateColumn = ["Date/Time", "Date/Heure"]
+lPrecipColumn = ["Total Precip (mm)", "Précip. totale (mm)"]
+lNameColumn = ["Station Name", "Nom de la Station"]
+
+# Month-day index of a leap year, in calendar order ('1-1', '1-2', ..., '2-29', ...)
+lDayIndex = [str(nMonth) + "-" + str(nDay) \
+             for (nMonth, nDays) in enumerate([31,29,31,30,31,30,31,31,30,31,30,31], 1) \
+             for nDay in range(1, nDays + 1)]
+dDayPosition = dict((sIndex, i) for (i, sIndex) in enumerate(lDayIndex))
+
+def find_column(lHeader, lName):
+   """
+   Position of the first column of lHeader found in lName, None if there is none.
+   """
+
+   for sName in lName:
+      if sName in lHeader:
+         return lHeader.index(sName)
+   return None
+
+def accumulate_file(sPath, lSum, lCount, lRowCount):
+   """
+   Add the precipitation of one daily file, CSV or XML, to the running sums and
+   counts, and its rows with a valid date to lRowCount, value or not.
+
+   OUTPUT
+   sName: station name found in the file, None if the file has no row.
+   """
+
+   sName = None
+   # XML files are read with the columns of the English CSV files
+   reader = eccc_xml.iter_table(sPath)
+   lHeader = next(reader, None)
+   if lHeader is None:
+      return sName
+   nDate = find_column(lHeader, lDateColumn)
+   nPrecip = find_column(lHeader, lPrecipColumn)
+   nName = find_column(lHeader, lNameColumn)
+   if nDate is None or nPrecip is None:
+      return sName
+
+   for row in reader:
+      if len(row) <= max(nDate, nPrecip):
+         continue
+      if nName is not None and sName is None:
+         sName = row[nName]
+      # Date is YYYY-MM-DD. Rows without a valid date are skipped, like the NA dates in R.
+      sDate = row[nDate].strip()
+      if len(sDate) < 10 or not sDate[5:7].isdigit() or not sDate[8:10].isdigit():
+         continue
+      i = dDayPosition.get(str(int(sDate[5:7])) + "-" + str(int(sDate[8:10])))
+      if i is None:
+         continue
+      lRowCount[i] += 1
+      sValue = row[nPrecip].strip()
+      if sValue == "":
+         continue
+      try:
+         fValue = float(sValue)
+      except ValueError:
+         continue
+      lSum[i] += fValue
+      lCount[i] += 1
+
+   return sName
+
+def get_fingerprint(lPath):
+   """
+   Hash of the name, size and modification time of the files of a station.
+   """
+
+   hashStation = hashlib.sha1()
+   for sPath in sorted(lPath):
+      tStat = os.stat(sPath)
+      hashStation.update((os.path.basename(sPath) + ":" + str(tStat.st_size) + ":" + \
+                          str(tStat.st_mtime_ns) + "\n").encode())
+
+   return hashStation.hexdigest()
+
+def build_station(sStation, lPath):
+   """
+   Representative year of one station.
+
+   OUTPUT
+   lRow: one row per month-day found in the files, with the columns of OUTPUT_COLUMNS,
+    empty list if the station has no precipitation value at all.
+   """
+
+   lSum = [0.0] * len(lDayIndex)
+   lCount = [0] * len(lDayIndex)
+   lRowCount = [0] * len(lDayIndex)
+   sName = None
+   for sPath in sorted(lPath):
+      sFileName = accumulate_file(sPath, lSum, lCount, lRowCount)
+      if sName is None:
+         sName = sFileName
+
+   # No precipitation data at all: the station is skipped
+   if sum(lCount) == 0:
+      return []
+
+   lRow = []
+   for (i, sIndex) in enumerate(lDayIndex):
+      if lRowCount[i] == 0:
+         continue
+      if lCount[i] > 0:
+         sMean = repr(lSum[i] / lCount[i])
+      else:
+         sMean = "NA"
+      lRow.append({ "index" : sIndex, \
+                    "mean_total_precip" : sMean, \
+                    "n_total_precip" : lCount[i], \
+                    "station_name" : sName, \
+                    "ec_station_id" : sStation })
+
+   return lRow
+
+def read_output(sPath):
+   """
+   Read a previous output, grouped by station.
+   """
+
+   dRow = {}
+   if not os.path.exists(sPath):
+      return dRow
+
+   with open(sPath, 'r') as fileOutput:
+      for row in csv.DictReader(fileOutput):
+         dRow.setdefault(row["ec_station_id"], []).append(row)
+
+   return dRow
+
+def build_climatology(lFile, dPreviousRow, dPreviousFingerprint):
+   """
+   Build the representative year of every station having daily files.
+
+   INPUT
+   lFile: list of (station, path) of the daily files (eccc_manifest.list_downloaded_files)
+   dPreviousRow: rows of the previous output, by station
+   dPreviousFingerprint: fingerprints of the previous build, by station
+
+   OUTPUT
+   [lRow, dFingerprint, lRebuilt]: all the rows, the fingerprints of this build and the
+    list of the stations that were read again.
+   """
+
+   dPath = {}
+   for (sStation, sPath) in lFile:
+      dPath.setdefault(sStation, []).append(sPath)
+
+   lRow = []
+   dFingerprint = {}
+   lRebuilt = []
+   for sStation in sorted(dPath.keys()):
+      dFingerprint[sStation] = get_fingerprint(dPath[sStation])
+      if dFingerprint[sStation] == dPreviousFingerprint.get(sStation):
+         lRow.extend(dPreviousRow.get(sStation, []))
+      else:
+         lRow.extend(build_station(sStation, dPath[sStation]))
+         lRebuilt.append(sStation)
+
+   return [lRow, dFingerprint, lRebuilt]
+
+############################################################
+# eccc_climatology in Command line
+#
+
+def get_command_line():
+   """
+   Parse the command line and perform all the checks.
+   """
+
+   parser = argparse.ArgumentParser(prog='eccc_climatology.py', \
+                                    description="Build the representative precipitation year of every station from the downloaded daily files.")
+   parser.add_argument("--input-directory", "-i", dest="InputDirectory", required=True, \
+                       help="Output directory of get_canadian_weather_observations.py (<station>/daily/*.csv or *.xml).",\
+                       action="store", type=str)
+   parser.add_argument("--manifest", dest="ManifestPath", metavar=("PATH"), \
+                       help="Find the daily files in this manifest instead of listing the directory. Required for files downloaded with --no-tree.",\
+                       action="store", type=str, default=None)
+   parser.add_argument("--lang", "-l", dest="Language", choices=["auto","en","fr"], default="auto", \
+                       help="Language of the files read when both were downloaded (--lang en,fr). Default is 'auto': the language downloaded, or 'en' when both were.",\
+                       action="store", type=str)
+   parser.add_argument("--output", "-o", dest="OutputPath", required=True, \
+                       help="CSV of the representative years. If it exists, the stations whose files did not change are copied from it.",\
+                       action="store", type=str)
+   parser.add_argument("--full", dest="Full", \
+                       help="Ignore the previous build and read every station again.",\
+                       action="store_true", default=False)
+
+   options = parser.parse_args()
+
+   if not os.path.isdir(options.InputDirectory):
+      print ("Error: '%s' is not a directory. Exiting." % (options.InputDirectory))
+      exit(2)
+
+   return options
+
+def main(tOptions):
+   lFile = eccc_manifest.list_downloaded_files(tOptions.InputDirectory, "daily", tOptions.ManifestPath, \
+                                               tOptions.Language)
+
+   # Fingerprints of the previous build are saved next to the output
+   sStatePath = tOptions.OutputPath + ".state.json"
+   dPreviousRow = {}
+   dPreviousFingerprint = {}
+   if not tOptions.Full and os.path.exists(sStatePath):
+      dPreviousRow = read_output(tOptions.OutputPath)
+      with open(sStatePath, 'r') as fileState:
+         dPreviousFingerprint = json.load(fileState)["fingerprint"]
+
+   [lRow, dFingerprint, lRebuilt] = build_climatology(lFile, dPreviousRow, dPreviousFingerprint)
+
+   with open(tOptions.OutputPath, 'w', newline='') as fileOutput:
+      writer = csv.DictWriter(fileOutput, fieldnames=OUTPUT_COLUMNS)
+      writer.writeheader()
+      writer.writerows(lRow)
+   with open(sStatePath, 'w') as fileState:
+      json.dump({ "fingerprint" : dFingerprint }, fileState)
+
+   print ("Stations: " + str(len(dFingerprint)) + ", rebuilt: " + str(len(lRebuilt)) + \
+          ", files: " + str(len(lFile)))
+
+
+if __name__ == "__main__":
+
+   tOptions = get_command_line()
+   main(tOptions)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_interpolate.py
+Description: Fill the missing daily values of many stations at once, using the
+ weighted mean of their neighbours.
+
+Notes: Same value as calc_intp_val in scripts/interpolate/help_funcs.R:
+ sum(weight * value) / sum(weight) over the neighbours having a value on that
+ day. Instead of one join per missing day, all the targets and all the days are
+ computed with two products of the sparse weight matrix (targets x stations)
+ with the value matrix (stations x days): one with the values (0 when missing)
+ and one with the availability mask.
+
+ The weight table is read as in 01_interpolate_station_data.R, for the table of
+ create_active_weights_dbase.R: the active station (active_station) is filled
+ from its neighbours (station_id), whose completeness weights the correlation.
+
+ Unlike 01_interpolate_station_data.R, which only fills the rows of the daily
+ table, every day between the start and end dates is returned: the days without
+ any row for a target are filled like its missing values.
+"""
+
+import os
+import csv
+import datetime
+import argparse
+
+# From numpy: https://pypi.org/project/numpy/
+import numpy
+# From scipy: https://pypi.org/project/scipy/
+from scipy import sparse
+
+import eccc_weights
+
+# As in 01_interpolate_station_data.R: only positive weights, best 100 neighbours
+DEFAULT_NEIGHBOURS = 100
+
+def read_daily_values(sPath, sStationColumn="ec_station_id", sDateColumn="datetime", \
+                      sValueColumn="total_precip", timeStart=None, timeEnd=None):
+   """
+   Read daily values from a long CSV table (one row per station and day), like an
+   export of ecclimate.daily.
+
+   OUTPUT
+   dValue: dictionnary with (station, date) as key and the value (NaN if missing).
+   """
+
+   dValue = {}
+   with open(sPath, 'r') as fileDaily:
+      for row in csv.DictReader(fileDaily):
+         timeDate = datetime.date.fromisoformat(row[sDateColumn].strip()[0:10])
+         if (timeStart is not None and timeDate < timeStart) or \
+            (timeEnd is not None and timeDate > timeEnd):
+            continue
+         sValue = row[sValueColumn]
+         if sValue is None or sValue.strip() in ["", "NA", "NaN"]:
+            fValue = numpy.nan
+         else:
+            fValue = float(sValue)
+         dValue[(row[sStationColumn].strip(), timeDate)] = fValue
+
+   return dValue
+
+def build_value_matrix(dValue, lStation, lDate):
+   """
+   Station x date matrix of the values, NaN where there is no value.
+   """
+
+   dStationIndex = dict((sStation, i) for (i, sStation) in enumerate(lStation))
+   dDateIndex = dict((timeDate, i) for (i, timeDate) in enumerate(lDate))
+   arrValue = numpy.full((len(lStation), len(lDate)), numpy.nan)
+   for ((sStation, timeDate), fValue) in dValue.items():
+      if sStation in dStationIndex and timeDate in dDateIndex:
+         arrValue[dStationIndex[sStation], dDateIndex[timeDate]] = fValue
+
+   return arrValue
+
+def read_weight_table(sPath, sTargetColumn="active_station", sSourceColumn="station_id", \
+                      sWeightColumn="comp_weight", nNeighbours=DEFAULT_NEIGHBOURS):
+   """
+   Read the pairwise weights (climate.precip_pairwise_weights or eccc_weights.py output).
+   Only the positive weights are kept, and the nNeighbours best for each target.
+
+   INPUT
+   sTargetColumn: column of the station filled. The pairwise table has a row for each
+    active station and each of its neighbours: the active stations are filled.
+   sSourceColumn: column of the neighbour whose values are used.
+
+   OUTPUT
+   dWeight: dictionnary with the target station as key and a list of
+    (source station, weight) as value, by decreasing weight.
+   """
+
+   dWeight = {}
+   with open(sPath, 'r') as fileWeight:
+      for row in csv.DictReader(fileWeight):
+         sWeight = row[sWeightColumn]
+         if sWeight in ["", "NA", None] or float(sWeight) <= 0:
+            continue
+         sTarget = row[sTargetColumn].strip()
+         if sTarget not in dWeight:
+            dWeight[sTarget] = []
+         dWeight[sTarget].append((row[sSourceColumn].strip(), float(sWeight)))
+
+   for sTarget in dWeight:
+      dWeight[sTarget] = sorted(dWeight[sTarget], key=lambda t: -t[1])[0:nNeighbours]
+
+   return dWeight
+
+def build_weight_matrix(dWeight, lTarget, lStation):
+   """
+   Sparse target x station matrix of the weights.
+   """
+
+   dStationIndex = dict((sStation, i) for (i, sStation) in enumerate(lStation))
+   lRow = []
+   lColumn = []
+   lData = []
+   for (i, sTarget) in enumerate(lTarget):
+      for (sSource, fWeight) in dWeight.get(sTarget, []):
+         # A station is never used to fill itself
+         if sSource in dStationIndex and sSource != sTarget:
+            lRow.append(i)
+            lColumn.append(dStationIndex[sSource])
+            lData.append(fWeight)
+
+   return sparse.csr_matrix((lData, (lRow, lColumn)), shape=(len(lTarget), len(lStation)))
+
+def interpolate(matWeight, arrValue):
+   """
+   Weighted mean of the available values, for every target and every day.
+
+   INPUT
+   matWeight: sparse target x station weight matrix
+   arrValue: station x date value matrix, NaN when missing
+
+   OUTPUT
+   arrInterpolated: target x date matrix, NaN when no neighbour has a value.
+   """
+
+   arrAvailable = ~numpy.isnan(arrValue)
+   arrSum = matWeight @ numpy.where(arrAvailable, arrValue, 0.0)
+   arrWeightSum = matWeight @ arrAvailable.astype(float)
+
+   with numpy.errstate(invalid="ignore", divide="ignore"):
+      arrInterpolated = numpy.where(arrWeightSum > 0, arrSum / arrWeightSum, numpy.nan)
+
+   return arrInterpolated
+
+def fill_gaps(dValue, dWeight, lTarget, timeStart, timeEnd):
+   """
+   Fill the missing values of the targets between timeStart and timeEnd.
+
+   Every day of the period is returned for each target, including the days
+   without any row in the input, which are filled like the missing values.
+
+   OUTPUT
+   lRow: list of dictionnaries with keys ec_station_id, datetime, total_precip,
+    og_total_precip and precip_intp_flag ('recorded' or 'interpolated'), like
+    the output of 01_interpolate_station_data.R.
+   """
+
+   lDate = [timeStart + datetime.timedelta(days=i) for i in range((timeEnd - timeStart).days + 1)]
+   setStation = set(sStation for (sStation, _) in dValue.keys())
+   lStation = sorted(setStation | set(lTarget))
+   dStationIndex = dict((sStation, i) for (i, sStation) in enumerate(lStation))
+
+   arrValue = build_value_matrix(dValue, lStation, lDate)
+   matWeight = build_weight_matrix(dWeight, lTarget, lStation)
+   arrInterpolated = interpolate(matWeight, arrValue)
+
+   lRow = []
+   for (i, sTarget) in enumerate(lTarget):
+      arrOriginal = arrValue[dStationIndex[sTarget]]
+      for (j, timeDate) in enumerate(lDate):
+         fOriginal = arrOriginal[j]
+         if numpy.isnan(fOriginal):
+            fValue = arrInterpolated[i, j]
+            sFlag = "interpolated"
+         else:
+            fValue = fOriginal
+            sFlag = "recorded"
+         lRow.append({ "ec_station_id" : sTarget, \
+                       "datetime" : timeDate.isoformat(), \
+                       "total_precip" : eccc_weights.format_value(fValue), \
+                       "og_total_precip" : eccc_weights.format_value(fOriginal), \
+                       "precip_intp_flag" : sFlag })
+
+   return lRow
+
+############################################################
+# eccc_interpolate in Command line
+#
+
+def get_command_line():
+   """
+   Parse the command line and perform all the checks.
+   """
+
+   parser = argparse.ArgumentParser(prog='eccc_interpolate.py', \
+                                    description="Fill the missing daily precipitation of the target stations with the weighted mean of their neighbours.")
+   parser.add_argument("Target", metavar="Station", nargs="*", \
+                       help="Station ID(s) to fill. Default is every active station of the weight table.",\
+                       action="store", type=str)
+   parser.add_argument("--daily", "-d", dest="DailyPath", required=True, \
+                       help="CSV with one row per station and day (columns ec_station_id, datetime, total_precip).",\
+                       action="store", type=str)
+   parser.add_argument("--weights", "-w", dest="WeightPath", required=True, \
+                       help="CSV of the pairwise weights (climate.precip_pairwise_weights or eccc_weights.py output).",\
+                       action="store", type=str)
+   parser.add_argument("--start-date", "-e", dest="StartDate", metavar=("YYYY-MM-DD"), required=True, \
+                       help="First day to fill.", action="store", type=str)
+   parser.add_argument("--end-date", "-f", dest="EndDate", metavar=("YYYY-MM-DD"), required=True, \
+                       help="Last day to fill.", action="store", type=str)
+   parser.add_argument("--output", "-o", dest="OutputPath", required=True, \
+                       help="CSV where the filled values are written.", action="store", type=str)
+   parser.add_argument("--neighbours", "-k", dest="Neighbours", \
+                       help="Number of neighbours with the best weight used for each target. Default is %d." % DEFAULT_NEIGHBOURS,\
+                       action="store", type=int, default=DEFAULT_NEIGHBOURS)
+
+   options = parser.parse_args()
+
+   for sPath in [options.DailyPath, options.WeightPath]:
+      if not os.path.exists(sPath):
+         print ("Error: file '%s' does not exist. Exiting." % (sPath))
+         exit(2)
+   try:
+      options.StartDate = datetime.date.fromisoformat(options.StartDate)
+      options.EndDate = datetime.date.fromisoformat(options.EndDate)
+   except ValueError:
+      print ("Error: dates must be of format 'YYYY-MM-DD'. Exiting.")
+      exit(3)
+   if options.StartDate > options.EndDate:
+      print ("Error: start date is after end date. Exiting.")
+      exit(4)
+
+   return options
+
+def main(tOptions):
+   dWeight = read_weight_table(tOptions.WeightPath, nNeighbours=tOptions.Neighbours)
+   lTarget = tOptions.Target
+   if len(lTarget) == 0:
+      lTarget = sorted(dWeight.keys())
+
+   dValue = read_daily_values(tOptions.DailyPath, timeStart=tOptions.StartDate, \
+                              timeEnd=tOptions.EndDate)
+   lRow = fill_gaps(dValue, dWeight, lTarget, tOptions.StartDate, tOptions.EndDate)
+
+   with open(tOptions.OutputPath, 'w', newline='') as fileOutput:
+      writer = csv.DictWriter(fileOutput, fieldnames=["ec_station_id", "datetime", "total_precip", \
+                                                      "og_total_precip", "precip_intp_flag"])
+      writer.writeheader()
+      writer.writerows(lRow)
+
+   nInterpolated = len([row for row in lRow if row["precip_intp_flag"] == "interpolated"])
+   print ("Targets: " + str(len(lTarget)) + ", days: " + \
+          str((tOptions.EndDate - tOptions.StartDate).days + 1) + \
+          ", values interpolated: " + str(nInterpolated))
+
+
+if __name__ == "__main__":
+
+   tOptions = get_command_line()
+   main(tOptions)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_inventory.py
+Description: Read the ECCC station inventory (station list CSV) outside of
+ get_canadian_weather_observations.py.
+
+Notes: Works with the file downloaded from ECCC (3 lines before the header)
+ and with the station lists written by the R scripts (header on the first line),
+ in English or in French, since the columns are read by position.
+"""
+
+import os
+import csv
+import datetime
+
+# CSV file station list
+COLUMN_TITLE_EN=["Name","Province","Climate ID","Station ID","WMO ID","TC ID",\
+                 "Latitude (Decimal Degrees)","Longitude (Decimal Degrees)",\
+                 "Latitude","Longitude","Elevation (m)","First Year","Last Year",\
+                 "HLY First Year","HLY Last Year","DLY First Year","DLY Last Year",\
+                 "MLY First Year","MLY Last Year"]
+
+# Province and territory names in the station list, in French and English
+dProvFR = { "ALBERTA" : "AB", \
+            "COLOMBIE-BRITANNIQUE" : "BC" , \
+            "MANITOBA" : "MB", \
+            "NOUVEAU-BRUNSWICK" : "NB", \
+            "TERRE-NEUVE" : "NL", \
+            "NOUVELLE-ECOSSE" : "NS", \
+            "TERRITOIRES DU NORD-OUEST" : "NT", \
+            "NUNAVUT" : "NU", \
+            "ONTARIO" : "ON", \
+            "ILE DU PRINCE-EDOUARD" : "PE", \
+            "QUEBEC" : "QC", \
+            "SASKATCHEWAN" : "SK", \
+            "YUKON" : "YT"  }
+dProvEN = { "ALBERTA" : "AB" , \
+            "BRITISH COLUMBIA" : "BC", \
+            "MANITOBA" : "MB", \
+            "NEW BRUNSWICK" : "NB", \
+            "NEWFOUNDLAND" : "NL", \
+            "NOVA SCOTIA" : "NS", \
+            "NORTHWEST TERRITORIES" : "NT", \
+            "NUNAVUT" : "NU", \
+            "ONTARIO" : "ON", \
+            "PRINCE EDWARD ISLAND" : "PE", \
+            "QUEBEC" : "QC", \
+            "SASKATCHEWAN" : "SK", \
+            "YUKON TERRITORY" : "YT"  }
+
+def get_province_code(row):
+   """
+   Two-letter code of the province/territory of a station, None if unknown.
+   """
+
+   sProvTerr = (row["Province"] or "").strip()
+   return dProvEN.get(sProvTerr, dProvFR.get(sProvTerr))
+
+def read_station_rows(sPath):
+   """
+   Read all the stations of a station list CSV.
+
+   OUTPUT
+   lRow: list of dictionnaries with the keys of COLUMN_TITLE_EN, in the order of the file.
+   """
+
+   lRow = []
+   with open(sPath, 'r') as fileList:
+      for row in csv.DictReader(fileList, fieldnames=COLUMN_TITLE_EN):
+         # Skip everything before the first station (modification date, header, ...)
+         sStation = row["Station ID"]
+         if sStation is None or not sStation.strip().isdigit():
+            continue
+         lRow.append(row)
+
+   return lRow
+
+def is_active(row, nYear=None):
+   """
+   A station is active if it reported daily values since nYear (default: last year).
+   This is the rule used by the interpolation R scripts ('DLY Last Year' >= year).
+   """
+
+   if nYear is None:
+      nYear = datetime.datetime.now().year - 1
+   sLastYear = (row["DLY Last Year"] or "").strip()
+
+   return sLastYear.isdigit() and int(sLastYear) >= nYear
+
+def read_station_ids(sPath):
+   """
+   Read a file with one station ID per line, or a CSV with the station ID in the first
+   column. Lines that are not a station ID, like a header, are ignored.
+
+   OUTPUT
+   setStation: set of station ID as strings.
+   """
+
+   setStation = set()
+   if not os.path.exists(sPath):
+      return setStation
+
+   with open(sPath, 'r') as fileStation:
+      for row in csv.reader(fileStation):
+         if len(row) > 0 and row[0].strip().isdigit():
+            setStation.add(row[0].strip())
+
+   return setStation
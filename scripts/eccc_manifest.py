@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_manifest.py
+Description: Read, write and merge the download manifests produced by
+ get_canadian_weather_observations.py.
+
+Notes: A manifest is a JSON-lines file with one record per file planned or
+ downloaded. Records are appended, so a manifest also keeps the history of
+ previous runs (file sizes, download time) for the same output directory.
+"""
+
+import os
+import sys
+import json
+import datetime
+import urllib.parse
+
+import eccc_storage
+
+# Timeframe codes used in the ECCC bulk data URL
+dTimeFrame = { "1" : "hourly", \
+               "2" : "daily", \
+               "3" : "monthly", \
+               "4" : "climate" }
+
+def parse_url_request(sURL):
+   """
+   Extract the request parameters from an ECCC bulk data URL.
+
+   INPUT
+   sURL: URL created by get_simple_url, get_daily_url or get_hourly_url
+
+   OUTPUT
+   dRequest: dictionnary with keys "station", "timeframe", "year", "month",
+    "format" and "lang"
+   """
+
+   tParsed = urllib.parse.urlparse(sURL)
+   dQuery = urllib.parse.parse_qs(tParsed.query)
+
+   if tParsed.path.endswith("_f.html"):
+      sLang = "fr"
+   else:
+      sLang = "en"
+
+   dRequest = { "station" : dQuery.get("stationID", [""])[0], \
+                "timeframe" : dTimeFrame.get(dQuery.get("timeframe", [""])[0]), \
+                "year" : dQuery.get("Year", [""])[0], \
+                "month" : dQuery.get("Month", [""])[0], \
+                "format" : dQuery.get("format", [""])[0], \
+                "lang" : sLang }
+
+   # Year and month are dummy values for the files covering the whole period
+   if dRequest["timeframe"] in ["monthly", "climate"]:
+      dRequest["year"] = None
+      dRequest["month"] = None
+   elif dRequest["timeframe"] == "daily":
+      dRequest["month"] = None
+
+   return dRequest
+
+def create_record(sURL, sDirectory, sFilename=None, nBytes=None, fElapsed=None, \
+                  sStatus="downloaded", sShard=None, sSha256=None, sChange=None):
+   """
+   Build one manifest record for a file.
+
+   sChange is "new", "changed" or "unchanged" compared to the file previously on disk.
+   """
+
+   dRecord = parse_url_request(sURL)
+   dRecord["url"] = sURL
+   dRecord["directory"] = sDirectory
+   dRecord["filename"] = sFilename
+   dRecord["bytes"] = nBytes
+   dRecord["elapsed"] = fElapsed
+   dRecord["status"] = sStatus
+   dRecord["shard"] = sShard
+   dRecord["sha256"] = sSha256
+   dRecord["change"] = sChange
+   dRecord["time"] = datetime.datetime.now().isoformat(timespec="seconds")
+
+   return dRecord
+
+def write_records(sPath, lRecord):
+   """
+   Append the records to the manifest located at sPath.
+   """
+
+   if sPath is None or len(lRecord) == 0:
+      return
+
+   sDirectory = os.path.dirname(sPath)
+   if sDirectory != "" and not os.path.isdir(sDirectory):
+      os.makedirs(sDirectory)
+
+   with open(sPath, "a") as fManifest:
+      for dRecord in lRecord:
+         fManifest.write(json.dumps(dRecord) + "\n")
+
+def get_period(dRecord):
+   """
+   Period covered by the file of a record: 'YYYY-MM' for hourly, 'YYYY' for daily
+   and 'all' for the files covering the whole period of the station.
+   """
+
+   if dRecord.get("month") is not None:
+      return dRecord["year"] + "-" + dRecord["month"]
+   elif dRecord.get("year") is not None:
+      return dRecord["year"]
+   else:
+      return "all"
+
+def create_change(dRecord):
+   """
+   Build the change feed entry of a downloaded file from its manifest record.
+   """
+
+   sPath = None
+   if dRecord.get("filename") is not None:
+      sPath = dRecord["directory"] + "/" + dRecord["filename"]
+
+   return { "station" : dRecord.get("station"), \
+            "timeframe" : dRecord.get("timeframe"), \
+            "period" : get_period(dRecord), \
+            "path" : sPath, \
+            "change" : dRecord.get("change"), \
+            "bytes" : dRecord.get("bytes"), \
+            "sha256" : dRecord.get("sha256"), \
+            "time" : dRecord.get("time") }
+
+def read_manifest(sPath):
+   """
+   Read all the records of a manifest. Lines that cannot be parsed are skipped.
+
+   OUTPUT
+   lRecord: list of dictionnaries, in the order they were written.
+   """
+
+   lRecord = []
+   if sPath is None or not os.path.exists(sPath):
+      return lRecord
+
+   with open(sPath, "r") as fManifest:
+      for sLine in fManifest:
+         sLine = sLine.strip()
+         if len(sLine) == 0:
+            continue
+         try:
+            lRecord.append(json.loads(sLine))
+         except ValueError:
+            continue
+
+   return lRecord
+
+def latest_records(lRecord):
+   """
+   Keep only the most recent record for every URL. A "downloaded" record is kept over
+   the later "planned" (--dry-run) or "skipped" (time limit, budget) records of the same
+   URL, since the file downloaded is still there: those only stand for the URLs that
+   were never downloaded.
+   """
+
+   dLatest = {}
+   for dRecord in lRecord:
+      dPrevious = dLatest.get(dRecord["url"])
+      if dPrevious is None or dRecord.get("status") == "downloaded" or \
+         dPrevious.get("status") != "downloaded":
+         dLatest[dRecord["url"]] = dRecord
+
+   return list(dLatest.values())
+
+def merge_manifests(lPath, sOutputPath=None):
+   """
+   Combine the manifests written by each shard.
+
+   INPUT
+   lPath: list of manifest paths
+   sOutputPath: if given, the merged records are written at this path.
+
+   OUTPUT
+   lRecord: the merged records, one per URL (see latest_records).
+   """
+
+   lAllRecord = []
+   for sPath in lPath:
+      lAllRecord.extend(read_manifest(sPath))
+
+   # Runs are appended in each manifest, so order by time to keep the last one
+   lAllRecord.sort(key=lambda dRecord: dRecord.get("time") or "")
+   lRecord = latest_records(lAllRecord)
+
+   if sOutputPath is not None:
+      if os.path.exists(sOutputPath):
+         os.remove(sOutputPath)
+      write_records(sOutputPath, lRecord)
+
+   return lRecord
+
+def summarize_records(lRecord):
+   """
+   Summarize the records by shard and by timeframe.
+
+   OUTPUT
+   dSummary: dictionnary with keys "total", "shard" and "timeframe". Each value
+    holds the number of files and bytes downloaded.
+   """
+
+   dSummary = { "total" : { "files" : 0, "bytes" : 0 }, \
+                "shard" : {}, \
+                "timeframe" : {}, \
+                "status" : {} }
+
+   for dRecord in lRecord:
+      nBytes = dRecord.get("bytes") or 0
+      sShard = dRecord.get("shard") or "-"
+      sTimeFrame = dRecord.get("timeframe") or "-"
+      sStatus = dRecord.get("status") or "-"
+
+      for (sKey, sValue) in [("shard", sShard), ("timeframe", sTimeFrame)]:
+         if sValue not in dSummary[sKey]:
+            dSummary[sKey][sValue] = { "files" : 0, "bytes" : 0 }
+         dSummary[sKey][sValue]["files"] += 1
+         dSummary[sKey][sValue]["bytes"] += nBytes
+
+      dSummary["status"][sStatus] = dSummary["status"].get(sStatus, 0) + 1
+      dSummary["total"]["files"] += 1
+      dSummary["total"]["bytes"] += nBytes
+
+   return dSummary
+
+def format_summary(dSummary):
+   """
+   Return the summary as a human readable report.
+   """
+
+   lLine = ["Files: " + str(dSummary["total"]["files"]) + \
+            "  Bytes: " + str(dSummary["total"]["bytes"])]
+   for sKey in ["shard", "timeframe"]:
+      lLine.append("By " + sKey + ":")
+      for sValue in sorted(dSummary[sKey].keys()):
+         dValue = dSummary[sKey][sValue]
+         lLine.append("\t" + sValue + ": " + str(dValue["files"]) + " files, " + \
+                      str(dValue["bytes"]) + " bytes")
+   lLine.append("By status:")
+   for sStatus in sorted(dSummary["status"].keys()):
+      lLine.append("\t" + sStatus + ": " + str(dSummary["status"][sStatus]))
+
+   return "\n".join(lLine)
+
+def get_file_language(sFilename):
+   """
+   Language of a file downloaded from ECCC, from the start of its name
+   ('en_climate_...', 'fr_climat_...'), None if unknown.
+   """
+
+   for (sPrefix, sLang) in [("en_", "en"), ("fr_", "fr")]:
+      if sFilename.startswith(sPrefix):
+         return sLang
+
+   return None
+
+def list_downloaded_files(sDirectory, sTimeFrame, sManifestPath=None, sLang="auto"):
+   """
+   Find the downloaded files of one timeframe.
+
+   INPUT
+   sDirectory: output directory of get_canadian_weather_observations.py
+   sTimeFrame: "hourly", "daily", "monthly" or "climate"
+   sManifestPath: if given, the files are taken from the manifest (latest download of each
+    URL). Otherwise the tree <sDirectory>/<station>/<timeframe>/ is listed, which does not
+    work with --no-tree since the station ID is then not known. Exits with an error if the
+    manifest lists files of an object storage.
+   sLang: language of the files, "en" or "fr". With '--lang en,fr' both languages are in
+    the same directories, and each observation would be counted twice if both were kept.
+    "auto" takes the language of the files when only one was downloaded, "en" otherwise.
+    None keeps every language. The files of unknown language are always kept. A warning
+    is written on stderr when no file is in sLang but some are in the other language.
+
+   A file downloaded as XML and converted to CSV by eccc_xml.py is only listed once, as
+   the CSV file, so its observations are not counted twice.
+
+   OUTPUT
+   lFile: sorted list of (station, path)
+   """
+
+   # (station, path, language)
+   lFound = []
+   if sManifestPath is not None:
+      for dRecord in latest_records(read_manifest(sManifestPath)):
+         if dRecord.get("timeframe") != sTimeFrame or dRecord.get("filename") is None:
+            continue
+         if eccc_storage.is_remote(dRecord["directory"]):
+            print ("Error: the manifest '%s' lists files of an object storage ('%s'), " % \
+                   (sManifestPath, dRecord["directory"]) + \
+                   "which are only read from a local directory. Copy them to a local " + \
+                   "directory and read it without --manifest. Exiting.")
+            exit(2)
+         sPath = dRecord["directory"] + "/" + dRecord["filename"]
+         if os.path.exists(sPath):
+            lFound.append((dRecord["station"], sPath, dRecord.get("lang")))
+   else:
+      for sStation in os.listdir(sDirectory):
+         sTimeFrameDirectory = os.path.join(sDirectory, sStation, sTimeFrame)
+         if not sStation.isdigit() or not os.path.isdir(sTimeFrameDirectory):
+            continue
+         for sFilename in os.listdir(sTimeFrameDirectory):
+            if sFilename.endswith(".csv") or sFilename.endswith(".xml"):
+               lFound.append((sStation, os.path.join(sTimeFrameDirectory, sFilename), \
+                              get_file_language(sFilename)))
+
+   setLang = set(sFileLang for (sStation, sPath, sFileLang) in lFound if sFileLang is not None)
+   if sLang == "auto":
+      sLang = "en"
+      if len(setLang) == 1:
+         sLang = setLang.pop()
+   if sLang is not None and len(setLang) > 0 and sLang not in setLang:
+      print("Warning: no " + sTimeFrame + " file in '" + sLang + "', " + \
+            "the files in '" + "', '".join(sorted(setLang)) + "' are not read. See --lang.", \
+            file=sys.stderr)
+   lFile = [(sStation, sPath) for (sStation, sPath, sFileLang) in lFound \
+            if sLang is None or sFileLang is None or sFileLang == sLang]
+
+   # Same file in both formats: keep the CSV (sorted before the XML)
+   setStem = set()
+   lUnique = []
+   for (sStation, sPath) in sorted(lFile):
+      sStem = os.path.splitext(sPath)[0]
+      if sStem not in setStem:
+         setStem.add(sStem)
+         lUnique.append((sStation, sPath))
+
+   return lUnique
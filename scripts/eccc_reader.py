@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_reader.py
+Description: Read the files downloaded by get_canadian_weather_observations.py
+ in parallel, as pandas data frames or Arrow record batches.
+
+Notes: The files are found through the manifest when it is given (or by
+ listing the <station>/<timeframe>/ tree otherwise). The station and date
+ filters are applied first on the files, using the period of each file, so
+ the files outside the request are never opened. The selected columns and the
+ rows in the date range are then read in a process pool (the XML files with
+ eccc_xml.py, giving the columns of the English CSV files). The result is
+ returned in chunks of about nChunkRows rows, and only a few files are read
+ ahead of the chunk being returned, so the memory used stays bounded.
+"""
+
+import re
+import os
+import sys
+import argparse
+from multiprocessing import Pool
+
+# From pandas: https://pypi.org/project/pandas/
+import pandas
+
+import eccc_manifest
+import eccc_xml
+
+DEFAULT_CHUNK_ROWS = 500000
+DEFAULT_WORKERS = 4
+
+# Period in the filenames of ECCC: ..._01-2021_P1H.csv (hourly), ..._2021_P1D.csv (daily)
+reHourlyFilename = re.compile(r"_(\d{2})-(\d{4})_P1H\.")
+reDailyFilename = re.compile(r"_(\d{4})_P1D\.")
+
+def get_file_period(sPath, dRecord=None):
+   """
+   Period covered by a file: 'YYYY-MM' for hourly, 'YYYY' for daily, None if unknown
+   (monthly and climate files cover the whole record of the station).
+   """
+
+   if dRecord is not None and dRecord.get("year") is not None:
+      return eccc_manifest.get_period(dRecord)
+
+   sFilename = os.path.basename(sPath)
+   match = reHourlyFilename.search(sFilename)
+   if match is not None:
+      return match.group(2) + "-" + match.group(1)
+   match = reDailyFilename.search(sFilename)
+   if match is not None:
+      return match.group(1)
+
+   return None
+
+def overlaps(sPeriod, sStart, sEnd):
+   """
+   True if the period of a file may contain dates between sStart and sEnd (YYYY[-MM[-DD]]).
+   """
+
+   if sPeriod is None:
+      return True
+   if sStart is not None and sPeriod < sStart[0:len(sPeriod)]:
+      return False
+   if sEnd is not None and sPeriod > sEnd[0:len(sPeriod)]:
+      return False
+
+   return True
+
+def plan_files(sDirectory, sTimeFrame, sManifestPath=None, lStation=None, sStart=None, sEnd=None, \
+               sLang="auto"):
+   """
+   Find the files of a timeframe and language matching the station and date filters.
+
+   OUTPUT
+   lFile: sorted list of (station, path)
+   """
+
+   dRecord = {}
+   if sManifestPath is not None:
+      for dManifestRecord in eccc_manifest.latest_records(eccc_manifest.read_manifest(sManifestPath)):
+         if dManifestRecord.get("filename") is not None:
+            dRecord[dManifestRecord["directory"] + "/" + dManifestRecord["filename"]] = dManifestRecord
+
+   setStation = None
+   if lStation is not None:
+      setStation = set(lStation)
+
+   lFile = []
+   for (sStation, sPath) in eccc_manifest.list_downloaded_files(sDirectory, sTimeFrame, sManifestPath, \
+                                                                      sLang):
+      if setStation is not None and sStation not in setStation:
+         continue
+      if not overlaps(get_file_period(sPath, dRecord.get(sPath)), sStart, sEnd):
+         continue
+      lFile.append((sStation, sPath))
+
+   return lFile
+
+def read_file(tJob):
+   """
+   Read one file, keeping the columns and the dates requested. Run in the process pool.
+
+   INPUT
+   tJob: (station, path, list of columns or None, start, end)
+
+   OUTPUT
+   frame: pandas data frame with an added 'ec_station_id' column. The date column
+    is always kept.
+   """
+
+   (sStation, sPath, lColumn, sStart, sEnd) = tJob
+
+   usecols = None
+   if lColumn is not None:
+      setColumn = set(lColumn)
+      usecols = lambda sColumn: sColumn in setColumn or sColumn.startswith("Date/")
+   if sPath.endswith(".xml"):
+      lRow = [dRow for [bHourly, dRow] in eccc_xml.iter_rows(sPath)]
+      lXmlColumn = eccc_xml.DAILY_COLUMNS
+      if len(lRow) > 0 and lRow[0].get("Time (LST)") is not None:
+         lXmlColumn = eccc_xml.HOURLY_COLUMNS
+      if usecols is not None:
+         lXmlColumn = [sColumn for sColumn in lXmlColumn if usecols(sColumn)]
+      frame = pandas.DataFrame(lRow, columns=lXmlColumn, dtype=str)
+      frame = frame.mask(frame == "")
+   else:
+      frame = pandas.read_csv(sPath, usecols=usecols, encoding="utf-8-sig", dtype=str, \
+                              keep_default_na=False, na_values=[""])
+
+   # Rows in the date range, compared as ISO strings
+   lDateColumn = [sColumn for sColumn in frame.columns if sColumn.startswith("Date/")]
+   if len(lDateColumn) > 0 and (sStart is not None or sEnd is not None):
+      seriesDate = frame[lDateColumn[0]]
+      if sStart is not None:
+         frame = frame[seriesDate.str[0:len(sStart)] >= sStart]
+         seriesDate = frame[lDateColumn[0]]
+      if sEnd is not None:
+         frame = frame[seriesDate.str[0:len(sEnd)] <= sEnd]
+   if lColumn is not None:
+      frame = frame[[sColumn for sColumn in frame.columns \
+                     if sColumn in setColumn or sColumn in lDateColumn]]
+
+   frame.insert(0, "ec_station_id", sStation)
+
+   return frame
+
+def read_frames(lFile, lColumn=None, sStart=None, sEnd=None, nWorkers=DEFAULT_WORKERS):
+   """
+   Read the files in a process pool, in the order of lFile, with at most 2 files
+   per worker read ahead.
+
+   OUTPUT
+   Generator of pandas data frames, one per file.
+   """
+
+   lJob = [(sStation, sPath, lColumn, sStart, sEnd) for (sStation, sPath) in lFile]
+   if nWorkers <= 1:
+      for tJob in lJob:
+         yield read_file(tJob)
+      return
+
+   nAhead = 2 * nWorkers
+   with Pool(nWorkers) as pool:
+      lPending = [pool.apply_async(read_file, (tJob,)) for tJob in lJob[0:nAhead]]
+      nNext = len(lPending)
+      while len(lPending) > 0:
+         frame = lPending.pop(0).get()
+         if nNext < len(lJob):
+            lPending.append(pool.apply_async(read_file, (lJob[nNext],)))
+            nNext = nNext + 1
+         yield frame
+
+def read_downloaded(sDirectory, sTimeFrame, sManifestPath=None, lColumn=None, lStation=None, \
+                    sStart=None, sEnd=None, nWorkers=DEFAULT_WORKERS, \
+                    nChunkRows=DEFAULT_CHUNK_ROWS, sOutput="pandas", sLang="auto"):
+   """
+   Read the downloaded files of one timeframe.
+
+   INPUT
+   sDirectory: output directory of get_canadian_weather_observations.py
+   sTimeFrame: "hourly", "daily", "monthly" or "climate"
+   sManifestPath: manifest used to find the files. Required for files downloaded with --no-tree.
+   lColumn: columns to keep, as in the ECCC files ('Total Precip (mm)'). Default is all.
+   lStation: station ID to keep. Default is all.
+   sStart, sEnd: dates to keep, YYYY[-MM[-DD]]
+   nWorkers: number of processes reading the files
+   nChunkRows: number of rows of each chunk returned (a file is never split)
+   sOutput: "pandas" for data frames, "arrow" for pyarrow record batches
+   sLang: language of the files, "auto", "en" or "fr" (see eccc_manifest.list_downloaded_files)
+
+   OUTPUT
+   Generator of chunks.
+   """
+
+   lFile = plan_files(sDirectory, sTimeFrame, sManifestPath, lStation, sStart, sEnd, sLang)
+
+   lFrame = []
+   nRows = 0
+   for frame in read_frames(lFile, lColumn, sStart, sEnd, nWorkers):
+      if len(frame) == 0:
+         continue
+      lFrame.append(frame)
+      nRows = nRows + len(frame)
+      if nRows >= nChunkRows:
+         yield to_output(lFrame, sOutput)
+         lFrame = []
+         nRows = 0
+   if len(lFrame) > 0:
+      yield to_output(lFrame, sOutput)
+
+def to_output(lFrame, sOutput):
+   """
+   Concatenate the data frames of a chunk, and convert it to Arrow if requested.
+   """
+
+   frame = pandas.concat(lFrame, ignore_index=True)
+   if sOutput == "arrow":
+      # From pyarrow: https://pypi.org/project/pyarrow/, only needed for this output
+      import pyarrow
+      # One single batch, even if pandas stores the strings in several chunks
+      tableChunk = pyarrow.Table.from_pandas(frame, preserve_index=False).combine_chunks()
+      return tableChunk.to_batches()[0]
+
+   return frame
+
+############################################################
+# eccc_reader in Command line
+#
+
+def get_command_line():
+   """
+   Parse the command line and perform all the checks.
+   """
+
+   parser = argparse.ArgumentParser(prog='eccc_reader.py', \
+                                    description="Read the downloaded files of one timeframe and write them as one CSV.")
+   parser.add_argument("Station", metavar="Station", nargs="*", \
+                       help="Station ID(s) to read. Default is all.", action="store", type=str)
+   parser.add_argument("--input-directory", "-i", dest="InputDirectory", required=True, \
+                       help="Output directory of get_canadian_weather_observations.py.",\
+                       action="store", type=str)
+   parser.add_argument("--timeframe", "-t", dest="TimeFrame", default="daily", \
+                       choices=["hourly", "daily", "monthly", "climate"], \
+                       help="Files to read. Default is 'daily'.", action="store", type=str)
+   parser.add_argument("--manifest", dest="ManifestPath", metavar=("PATH"), \
+                       help="Find the files in this manifest instead of listing the directory. Required for files downloaded with --no-tree.",\
+                       action="store", type=str, default=None)
+   parser.add_argument("--lang", "-l", dest="Language", choices=["auto","en","fr"], default="auto", \
+                       help="Language of the files read when both were downloaded (--lang en,fr). Default is 'auto': the language downloaded, or 'en' when both were.",\
+                       action="store", type=str)
+   parser.add_argument("--column", "-c", dest="Column", nargs="+", default=None, \
+                       help="Column(s) to keep, for example 'Total Precip (mm)'. The date is always kept.",\
+                       action="store", type=str)
+   parser.add_argument("--start-date", "-e", dest="StartDate", metavar=("YYYY[-MM[-DD]]"), \
+                       default=None, action="store", type=str)
+   parser.add_argument("--end-date", "-f", dest="EndDate", metavar=("YYYY[-MM[-DD]]"), \
+                       default=None, action="store", type=str)
+   parser.add_argument("--workers", "-w", dest="Workers", default=DEFAULT_WORKERS, \
+                       help="Number of processes reading the files. Default is %d." % DEFAULT_WORKERS,\
+                       action="store", type=int)
+   parser.add_argument("--output", "-o", dest="OutputPath", default=None, \
+                       help="CSV to write. Default is the standard output.", action="store", type=str)
+
+   options = parser.parse_args()
+
+   if not os.path.isdir(options.InputDirectory):
+      print ("Error: '%s' is not a directory. Exiting." % (options.InputDirectory))
+      exit(2)
+
+   return options
+
+def main(tOptions):
+   lStation = tOptions.Station
+   if len(lStation) == 0:
+      lStation = None
+
+   fileOutput = sys.stdout
+   if tOptions.OutputPath is not None:
+      fileOutput = open(tOptions.OutputPath, 'w', newline='')
+
+   bHeader = True
+   for frame in read_downloaded(tOptions.InputDirectory, tOptions.TimeFrame, tOptions.ManifestPath, \
+                                tOptions.Column, lStation, tOptions.StartDate, tOptions.EndDate, \
+                                tOptions.Workers, sLang=tOptions.Language):
+      frame.to_csv(fileOutput, header=bHeader, index=False)
+      bHeader = False
+
+   if tOptions.OutputPath is not None:
+      fileOutput.close()
+
+
+if __name__ == "__main__":
+
+   tOptions = get_command_line()
+   main(tOptions)
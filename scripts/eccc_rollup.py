@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_rollup.py
+Description: Precomputed day, month and year aggregates of the downloaded
+ hourly and daily files, per station and per province/territory.
+
+Notes: The aggregates are kept in a SQLite database. Each table holds the
+ sum, count, minimum and maximum of every numeric variable, so totals and
+ means of a longer period are computed from the rows of a shorter one:
+   hourly files -> rollup_day (source 'hourly')
+   daily files  -> rollup_day (source 'daily')
+   rollup_day   -> rollup_month -> rollup_year
+ The province rows use '*' as station. When a file is added or changed, only
+ the days of that file and the months and years containing them are computed
+ again. Queries are answered from the largest period that fits the request.
+ The XML files are read like the CSV files, with eccc_xml.iter_table.
+"""
+
+import os
+import re
+import sys
+import csv
+import datetime
+import sqlite3
+import argparse
+
+import eccc_xml
+import eccc_manifest
+import eccc_inventory
+
+lLevel = ["day", "month", "year"]
+# Length of the period string for each level: YYYY-MM-DD, YYYY-MM, YYYY
+dPeriodLength = { "day" : 10, "month" : 7, "year" : 4 }
+lStatistic = ["mean", "total", "min", "max", "n"]
+
+# Columns of the ECCC files which are not measurements
+lMetadataColumn = ["Longitude (x)", "Latitude (y)", "Station Name", "Climate ID", \
+                   "Year", "Month", "Day", "Time (LST)", "Data Quality", "Weather", \
+                   "Nom de la Station", "Année", "Mois", "Jour", "Heure (HNL)", \
+                   "Qualité des Données", "Temps"]
+
+def clean_column_name(sColumn):
+   """
+   Short name of a column, as in the Postgres tables ('Total Precip (mm)' -> 'total_precip').
+   Same rule as the R scripts: remove the parentheses, trim, spaces to '_', lower case.
+   """
+
+   return re.sub(r"\(.*\)", "", sColumn).strip().replace(" ", "_").lower()
+
+def open_database(sPath):
+   """
+   Open the rollup database, creating the tables if needed.
+   """
+
+   conn = sqlite3.connect(sPath)
+   conn.execute("create table if not exists files (path text primary key, station text, " + \
+                "timeframe text, fingerprint text)")
+   for sLevel in lLevel:
+      conn.execute("create table if not exists rollup_" + sLevel + " (source text, station text, " + \
+                   "province text, period text, variable text, path text, " + \
+                   "sum real, n integer, min real, max real)")
+      conn.execute("create index if not exists rollup_" + sLevel + "_station on rollup_" + sLevel + \
+                   " (source, station, period)")
+      conn.execute("create index if not exists rollup_" + sLevel + "_province on rollup_" + sLevel + \
+                   " (source, province, period)")
+   conn.execute("create index if not exists rollup_day_path on rollup_day (path)")
+
+   return conn
+
+def aggregate_file(sPath):
+   """
+   Aggregate one hourly or daily file, CSV or XML, by day.
+
+   OUTPUT
+   dDay: dictionnary with (date, variable) as key and [sum, n, min, max] as value.
+   """
+
+   dDay = {}
+   # XML files are read with the columns of the English CSV files
+   reader = eccc_xml.iter_table(sPath)
+   lHeader = next(reader, None)
+   if lHeader is None:
+      return dDay
+   nDate = None
+   lVariable = []
+   for (i, sColumn) in enumerate(lHeader):
+      if sColumn.startswith("Date/"):
+         nDate = i
+      elif sColumn not in lMetadataColumn and "Flag" not in sColumn and \
+           "Indicateur" not in sColumn:
+         lVariable.append((i, clean_column_name(sColumn)))
+   if nDate is None:
+      return dDay
+
+   for row in reader:
+      if len(row) != len(lHeader):
+         continue
+      sDate = row[nDate][0:10]
+      for (i, sVariable) in lVariable:
+         try:
+            fValue = float(row[i])
+         except ValueError:
+            continue
+         lValue = dDay.get((sDate, sVariable))
+         if lValue is None:
+            dDay[(sDate, sVariable)] = [fValue, 1, fValue, fValue]
+         else:
+            lValue[0] += fValue
+            lValue[1] += 1
+            lValue[2] = min(lValue[2], fValue)
+            lValue[3] = max(lValue[3], fValue)
+
+   return dDay
+
+def get_fingerprint(sPath):
+   """
+   Size and modification time of a file, to know if it changed since it was added.
+   """
+
+   tStat = os.stat(sPath)
+   return str(tStat.st_size) + ":" + str(tStat.st_mtime_ns)
+
+def get_range(sPeriod):
+   """
+   Limits of the shorter periods contained in sPeriod, for a 'between' clause.
+   """
+
+   return (sPeriod, sPeriod + "~")
+
+def refresh_levels(conn, setAffected):
+   """
+   Compute again the month and year rows of the stations, and the province rows, for
+   the affected periods.
+
+   INPUT
+   setAffected: set of (source, station, province, day) whose day rows changed.
+   """
+
+   setMonth = set((sSource, sStation, sProvince, sDay[0:7]) \
+                  for (sSource, sStation, sProvince, sDay) in setAffected)
+   setYear = set((sSource, sStation, sProvince, sMonth[0:4]) \
+                 for (sSource, sStation, sProvince, sMonth) in setMonth)
+
+   # Station rows: month from day, then year from month
+   for (sLevel, sFrom, setKey) in [("month", "day", setMonth), ("year", "month", setYear)]:
+      nLength = dPeriodLength[sLevel]
+      for (sSource, sStation, _, sPeriod) in setKey:
+         conn.execute("delete from rollup_" + sLevel + " where source = ? and station = ? " + \
+                      "and period = ?", (sSource, sStation, sPeriod))
+         conn.execute("insert into rollup_" + sLevel + " select source, station, province, " + \
+                      "substr(period, 1, " + str(nLength) + "), variable, null, sum(sum), " + \
+                      "sum(n), min(min), max(max) from rollup_" + sFrom + " where source = ? " + \
+                      "and station = ? and period between ? and ? group by variable", \
+                      (sSource, sStation) + get_range(sPeriod))
+
+   # Province rows, from the station rows of the same level. Day rows are done by month.
+   for (sLevel, setKey) in [("day", setMonth), ("month", setMonth), ("year", setYear)]:
+      setProvince = set((sSource, sProvince, sPeriod) \
+                        for (sSource, _, sProvince, sPeriod) in setKey if sProvince is not None)
+      for (sSource, sProvince, sPeriod) in setProvince:
+         conn.execute("delete from rollup_" + sLevel + " where source = ? and province = ? " + \
+                      "and station = '*' and period between ? and ?", \
+                      (sSource, sProvince) + get_range(sPeriod))
+         conn.execute("insert into rollup_" + sLevel + " select source, '*', province, period, " + \
+                      "variable, null, sum(sum), sum(n), min(min), max(max) from rollup_" + sLevel + \
+                      " where source = ? and province = ? and station != '*' and period between ? " + \
+                      "and ? group by period, variable", (sSource, sProvince) + get_range(sPeriod))
+
+def update_rollups(conn, lFile, dProvince):
+   """
+   Add the new and changed files to the rollups, and remove the deleted ones.
+
+   INPUT
+   lFile: list of (station, path, timeframe) of the hourly and daily files
+   dProvince: province code by station ID
+
+   OUTPUT
+   [nUpdated, nRemoved]: number of files added or changed, and removed.
+   """
+
+   dKnown = dict((sPath, [sStation, sTimeFrame, sFingerprint]) for (sPath, sStation, sTimeFrame, sFingerprint) \
+                 in conn.execute("select path, station, timeframe, fingerprint from files"))
+   setAffected = set()
+   setCurrent = set()
+   nUpdated = 0
+
+   for (sStation, sPath, sTimeFrame) in lFile:
+      setCurrent.add(sPath)
+      sFingerprint = get_fingerprint(sPath)
+      if sPath in dKnown and dKnown[sPath][2] == sFingerprint:
+         continue
+      sProvince = dProvince.get(sStation)
+      # The days previously covered by this file must also be computed again
+      for (sDay,) in conn.execute("select distinct period from rollup_day where path = ?", (sPath,)):
+         setAffected.add((sTimeFrame, sStation, sProvince, sDay))
+      conn.execute("delete from rollup_day where path = ?", (sPath,))
+      dDay = aggregate_file(sPath)
+      conn.executemany("insert into rollup_day values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", \
+                       [(sTimeFrame, sStation, sProvince, sDay, sVariable, sPath) + tuple(lValue) \
+                        for ((sDay, sVariable), lValue) in dDay.items()])
+      for (sDay, _) in dDay.keys():
+         setAffected.add((sTimeFrame, sStation, sProvince, sDay))
+      conn.execute("insert or replace into files values (?, ?, ?, ?)", \
+                   (sPath, sStation, sTimeFrame, sFingerprint))
+      nUpdated = nUpdated + 1
+
+   # Files removed from the download directory
+   lRemoved = [sPath for sPath in dKnown if sPath not in setCurrent]
+   for sPath in lRemoved:
+      [sStation, sTimeFrame, _] = dKnown[sPath]
+      for (sDay,) in conn.execute("select distinct period from rollup_day where path = ?", (sPath,)):
+         setAffected.add((sTimeFrame, sStation, dProvince.get(sStation), sDay))
+      conn.execute("delete from rollup_day where path = ?", (sPath,))
+      conn.execute("delete from files where path = ?", (sPath,))
+
+   refresh_levels(conn, setAffected)
+   conn.commit()
+
+   return [nUpdated, len(lRemoved)]
+
+def choose_level(sLevel, sStart, sEnd):
+   """
+   Largest table which can answer a request grouped by sLevel.
+
+   A request by month can use the month rows only if the date limits fall on the
+   boundaries of the months, otherwise the day rows are grouped by month.
+   """
+
+   lCandidate = lLevel[0:lLevel.index(sLevel) + 1]
+   for sCandidate in reversed(lCandidate):
+      bFit = True
+      if sCandidate == "year":
+         bFit = (sStart is None or sStart[4:] in ["", "-01", "-01-01"]) and \
+                (sEnd is None or sEnd[4:] in ["", "-12", "-12-31"])
+      elif sCandidate == "month":
+         bFit = (sStart is None or len(sStart) <= 7 or sStart.endswith("-01")) and \
+                (sEnd is None or len(sEnd) <= 7 or is_last_day(sEnd))
+      if bFit:
+         return sCandidate
+
+   return "day"
+
+def is_last_day(sDate):
+   """
+   True if the date YYYY-MM-DD is the last day of its month.
+   """
+
+   timeDate = datetime.date.fromisoformat(sDate)
+   return (timeDate + datetime.timedelta(days=1)).day == 1
+
+def get_first_day(sDate):
+   """
+   First day of a limit given as YYYY[-MM[-DD]].
+   """
+
+   return datetime.date.fromisoformat((sDate + "-01-01")[0:10])
+
+def get_last_day(sDate):
+   """
+   Last day of a limit given as YYYY[-MM[-DD]].
+   """
+
+   if len(sDate) == 4:
+      return datetime.date(int(sDate), 12, 31)
+   elif len(sDate) == 7:
+      timeNext = get_first_day(sDate) + datetime.timedelta(days=31)
+      return timeNext.replace(day=1) - datetime.timedelta(days=1)
+   return datetime.date.fromisoformat(sDate)
+
+def split_range(timeStart, timeEnd):
+   """
+   Cover [timeStart, timeEnd] with the fewest days, months and years.
+
+   OUTPUT
+   lSegment: list of (level, first period, last period), for example
+    [("day", "2020-12-30", "2020-12-31"), ("year", "2021", "2022"), ("month", "2023-01", "2023-02")]
+   """
+
+   lSegment = []
+   timeDate = timeStart
+   while timeDate <= timeEnd:
+      timeYearEnd = datetime.date(timeDate.year, 12, 31)
+      timeMonthEnd = get_last_day(timeDate.isoformat()[0:7])
+      if timeDate.month == 1 and timeDate.day == 1 and timeYearEnd <= timeEnd:
+         # Whole years
+         nLast = timeEnd.year if timeEnd.month == 12 and timeEnd.day == 31 else timeEnd.year - 1
+         lSegment.append(("year", str(timeDate.year), str(nLast)))
+         timeDate = datetime.date(nLast + 1, 1, 1)
+      elif timeDate.day == 1 and timeMonthEnd <= timeEnd:
+         # Whole months, until the end of the year or of the request
+         timeLast = timeMonthEnd
+         while timeLast.month < 12 and get_last_day(timeLast.isoformat()[0:5] + \
+               "%02d" % (timeLast.month + 1)) <= timeEnd:
+            timeLast = get_last_day(timeLast.isoformat()[0:5] + "%02d" % (timeLast.month + 1))
+         lSegment.append(("month", timeDate.isoformat()[0:7], timeLast.isoformat()[0:7]))
+         timeDate = timeLast + datetime.timedelta(days=1)
+      else:
+         # Days, until the end of the month or of the request
+         timeLast = min(timeMonthEnd, timeEnd)
+         lSegment.append(("day", timeDate.isoformat(), timeLast.isoformat()))
+         timeDate = timeLast + datetime.timedelta(days=1)
+
+   return lSegment
+
+def get_filter(sSource, sVariable, lStation, sProvince):
+   """
+   Where clause and parameters selecting the source, variable and stations.
+   """
+
+   sWhere = "source = ? and variable = ?"
+   lParameter = [sSource, sVariable]
+   if sProvince is not None:
+      sWhere += " and province = ? and station = '*'"
+      lParameter.append(sProvince)
+   elif lStation is not None:
+      sWhere += " and station in (" + ",".join("?" * len(lStation)) + ")"
+      lParameter.extend(lStation)
+   else:
+      sWhere += " and station != '*'"
+
+   return [sWhere, lParameter]
+
+def get_statistic(sStatistic, fSum, nCount, fMin, fMax):
+   """
+   Value of a statistic from the sum, count, minimum and maximum.
+   """
+
+   if sStatistic == "mean":
+      return fSum / nCount if nCount else None
+   elif sStatistic == "total":
+      return fSum
+   elif sStatistic == "min":
+      return fMin
+   elif sStatistic == "max":
+      return fMax
+   return nCount
+
+def query(conn, sVariable, sLevel="month", sSource=None, lStation=None, sProvince=None, \
+          sStart=None, sEnd=None, sStatistic="mean"):
+   """
+   Aggregate a variable by day, month or year, or over the whole request.
+
+   INPUT
+   sVariable: short name of the variable ('total_precip', 'temp', ...)
+   sLevel: "day", "month", "year", or "all" for one value over [sStart, sEnd]
+   sSource: "hourly" or "daily". Default is daily when the variable is in the daily files.
+   lStation: station ID to return, one row per station. Ignored if sProvince is given.
+   sProvince: two-letter code, returns the rows of the whole province/territory.
+   sStart, sEnd: limits of the request, YYYY[-MM[-DD]]
+   sStatistic: "mean", "total", "min", "max" or "n"
+
+   OUTPUT
+   lRow: list of (station, period, value). The station is '*' for a province.
+   """
+
+   if sSource is None:
+      sSource = "hourly"
+      for _ in conn.execute("select 1 from rollup_year where source = 'daily' and variable = ? " + \
+                            "limit 1", (sVariable,)):
+         sSource = "daily"
+   [sWhere, lParameter] = get_filter(sSource, sVariable, lStation, sProvince)
+
+   if sLevel != "all":
+      # Rows of the largest table fitting the limits, grouped to the requested level
+      sTable = "rollup_" + choose_level(sLevel, sStart, sEnd)
+      sPeriod = "substr(period, 1, " + str(dPeriodLength[sLevel]) + ")"
+      if sStart is not None:
+         sWhere += " and period >= ?"
+         lParameter.append(get_first_day(sStart).isoformat()[0:dPeriodLength[sTable[7:]]])
+      if sEnd is not None:
+         sWhere += " and period <= ?"
+         lParameter.append(get_last_day(sEnd).isoformat()[0:dPeriodLength[sTable[7:]]])
+      sQuery = "select station, " + sPeriod + ", sum(sum), sum(n), min(min), max(max) from " + \
+               sTable + " where " + sWhere + " group by station, " + sPeriod + \
+               " order by station, " + sPeriod
+      return [(sStation, sPeriod, get_statistic(sStatistic, fSum, nCount, fMin, fMax)) \
+              for (sStation, sPeriod, fSum, nCount, fMin, fMax) in conn.execute(sQuery, lParameter)]
+
+   # One value over the request: cover it with the fewest year, month and day rows
+   if sStart is None or sEnd is None:
+      for (sFirst, sLast) in conn.execute("select min(period), max(period) from rollup_day where " + \
+                                          sWhere, lParameter):
+         if sFirst is None:
+            return []
+         sStart = sStart or sFirst
+         sEnd = sEnd or sLast
+   timeStart = get_first_day(sStart)
+   timeEnd = get_last_day(sEnd)
+
+   dTotal = {}
+   for (sSegmentLevel, sFirst, sLast) in split_range(timeStart, timeEnd):
+      sQuery = "select station, sum(sum), sum(n), min(min), max(max) from rollup_" + sSegmentLevel + \
+               " where " + sWhere + " and period between ? and ? group by station"
+      for (sStation, fSum, nCount, fMin, fMax) in conn.execute(sQuery, lParameter + [sFirst, sLast]):
+         if sStation not in dTotal:
+            dTotal[sStation] = [fSum, nCount, fMin, fMax]
+         else:
+            lTotal = dTotal[sStation]
+            dTotal[sStation] = [lTotal[0] + fSum, lTotal[1] + nCount, min(lTotal[2], fMin), \
+                                max(lTotal[3], fMax)]
+
+   sPeriod = timeStart.isoformat() + "/" + timeEnd.isoformat()
+   return [(sStation, sPeriod, get_statistic(sStatistic, *dTotal[sStation])) \
+           for sStation in sorted(dTotal.keys())]
+
+############################################################
+# eccc_rollup in Command line
+#
+
+def get_command_line():
+   """
+   Parse the command line and perform all the checks.
+   """
+
+   parser = argparse.ArgumentParser(prog='eccc_rollup.py', \
+                                    description="Maintain and query day/month/year aggregates of the downloaded hourly and daily files.")
+   parser.add_argument("--database", "-b", dest="DatabasePath", required=True, \
+                       help="SQLite database of the rollups.", action="store", type=str)
+   subparsers = parser.add_subparsers(dest="Command", required=True)
+
+   parserUpdate = subparsers.add_parser("update", help="Add the new and changed files to the rollups.")
+   parserUpdate.add_argument("--input-directory", "-i", dest="InputDirectory", required=True, \
+                             help="Output directory of get_canadian_weather_observations.py.",\
+                             action="store", type=str)
+   parserUpdate.add_argument("--manifest", dest="ManifestPath", metavar=("PATH"), \
+                             help="Find the files in this manifest instead of listing the directory.",\
+                             action="store", type=str, default=None)
+   parserUpdate.add_argument("--lang", "-l", dest="Language", choices=["auto","en","fr"], default="auto", \
+                             help="Language of the files read when both were downloaded (--lang en,fr). Default is 'auto': the language downloaded, or 'en' when both were.",\
+                             action="store", type=str)
+   parserUpdate.add_argument("--station-file", "-S", dest="StationPath", required=True, \
+                             help="Station list CSV, used to find the province of each station.",\
+                             action="store", type=str)
+
+   parserQuery = subparsers.add_parser("query", help="Print an aggregate as CSV.")
+   parserQuery.add_argument("Variable", help="Short variable name, for example 'total_precip'.", \
+                            action="store", type=str)
+   parserQuery.add_argument("--level", "-L", dest="Level", choices=lLevel + ["all"], default="month", \
+                            help="Period of the aggregate, or 'all' for one value over the dates requested. Default is 'month'.",\
+                            action="store")
+   parserQuery.add_argument("--statistic", "-s", dest="Statistic", choices=lStatistic, default="mean", \
+                            help="Default is 'mean'.", action="store")
+   parserQuery.add_argument("--source", dest="Source", choices=["hourly", "daily"], default=None, \
+                            help="Files the aggregate is computed from. Default is daily when available.",\
+                            action="store")
+   parserQuery.add_argument("--station", dest="Station", nargs="+", default=None, \
+                            help="Station ID(s).", action="store", type=str)
+   parserQuery.add_argument("--province", "-p", dest="Province", default=None, \
+                            help="Two-letter province/territory code, aggregated over all its stations.",\
+                            action="store", type=str)
+   parserQuery.add_argument("--start-date", "-e", dest="StartDate", metavar=("YYYY[-MM[-DD]]"), \
+                            default=None, action="store", type=str)
+   parserQuery.add_argument("--end-date", "-f", dest="EndDate", metavar=("YYYY[-MM[-DD]]"), \
+                            default=None, action="store", type=str)
+
+   options = parser.parse_args()
+
+   if options.Command == "update":
+      if not os.path.isdir(options.InputDirectory):
+         print ("Error: '%s' is not a directory. Exiting." % (options.InputDirectory))
+         exit(2)
+      if not os.path.exists(options.StationPath):
+         print ("Error: file '%s' does not exist. Exiting." % (options.StationPath))
+         exit(2)
+   elif not os.path.exists(options.DatabasePath):
+      print ("Error: database '%s' does not exist. Run 'update' first. Exiting." % (options.DatabasePath))
+      exit(2)
+
+   return options
+
+def main(tOptions):
+   conn = open_database(tOptions.DatabasePath)
+
+   if tOptions.Command == "update":
+      dProvince = dict((row["Station ID"].strip(), eccc_inventory.get_province_code(row)) \
+                       for row in eccc_inventory.read_station_rows(tOptions.StationPath))
+      lFile = []
+      for sTimeFrame in ["hourly", "daily"]:
+         for (sStation, sPath) in eccc_manifest.list_downloaded_files(tOptions.InputDirectory, \
+                                                                      sTimeFrame, tOptions.ManifestPath, \
+                                                                      tOptions.Language):
+            lFile.append((sStation, sPath, sTimeFrame))
+      [nUpdated, nRemoved] = update_rollups(conn, lFile, dProvince)
+      print ("Files: " + str(len(lFile)) + ", added or changed: " + str(nUpdated) + \
+             ", removed: " + str(nRemoved))
+   else:
+      lRow = query(conn, tOptions.Variable, tOptions.Level, tOptions.Source, tOptions.Station, \
+                   tOptions.Province, tOptions.StartDate, tOptions.EndDate, tOptions.Statistic)
+      writer = csv.writer(sys.stdout)
+      writer.writerow(["station", "period", tOptions.Variable + "_" + tOptions.Statistic])
+      writer.writerows(lRow)
+
+   conn.close()
+
+
+if __name__ == "__main__":
+
+   tOptions = get_command_line()
+   main(tOptions)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_schedule.py
+Description: Estimate the cost of each file to download and order the
+ downloads so that a pool of workers finishes as early as possible.
+
+Notes: The cost of a request is the server latency plus its expected size
+ divided by the throughput. Sizes, latency and throughput are taken from the
+ manifest of the previous runs when available, otherwise from the defaults below.
+ The same costs give the pre-flight estimate of a run, and the work of lowest
+ priority is trimmed when the estimate exceeds the size or time budget.
+"""
+
+import eccc_manifest
+
+# Default size in bytes of one file, for each timeframe, when there is no history
+dDefaultBytes = { "hourly" : 150000, \
+                  "daily" : 60000, \
+                  "monthly" : 40000, \
+                  "climate" : 15000 }
+# Default server latency in seconds and throughput in bytes per second
+DEFAULT_LATENCY = 1.0
+DEFAULT_THROUGHPUT = 500000.0
+
+def learn_history(lRecord):
+   """
+   Extract the file sizes and the server speed from manifest records.
+
+   INPUT
+   lRecord: list of manifest records (see eccc_manifest.read_manifest)
+
+   OUTPUT
+   dHistory: dictionnary with keys
+     "station": mean bytes per (station, timeframe)
+     "timeframe": mean bytes per timeframe
+     "latency": seconds before the first byte
+     "throughput": bytes per second
+   """
+
+   dStationSum = {}
+   dTimeFrameSum = {}
+   lSample = []
+   for dRecord in lRecord:
+      if dRecord.get("status") != "downloaded" or dRecord.get("bytes") is None:
+         continue
+      nBytes = dRecord["bytes"]
+      tKey = (dRecord.get("station"), dRecord.get("timeframe"))
+      for (dSum, key) in [(dStationSum, tKey), (dTimeFrameSum, dRecord.get("timeframe"))]:
+         [nTotal, nCount] = dSum.get(key, [0, 0])
+         dSum[key] = [nTotal + nBytes, nCount + 1]
+      if dRecord.get("elapsed") is not None:
+         lSample.append((float(nBytes), float(dRecord["elapsed"])))
+
+   dHistory = { "station" : dict((key, float(n) / c) for (key, [n, c]) in dStationSum.items()), \
+                "timeframe" : dict((key, float(n) / c) for (key, [n, c]) in dTimeFrameSum.items()), \
+                "latency" : DEFAULT_LATENCY, \
+                "throughput" : DEFAULT_THROUGHPUT }
+
+   # Least squares fit of elapsed = latency + bytes / throughput
+   if len(lSample) >= 2:
+      fMeanBytes = sum(x for (x, _) in lSample) / len(lSample)
+      fMeanTime = sum(y for (_, y) in lSample) / len(lSample)
+      fVariance = sum((x - fMeanBytes) ** 2 for (x, _) in lSample)
+      fCovariance = sum((x - fMeanBytes) * (y - fMeanTime) for (x, y) in lSample)
+      if fVariance > 0 and fCovariance > 0:
+         fSlope = fCovariance / fVariance
+         dHistory["throughput"] = 1.0 / fSlope
+         dHistory["latency"] = max(0.0, fMeanTime - fSlope * fMeanBytes)
+      elif fMeanTime > 0:
+         dHistory["latency"] = fMeanTime
+
+   return dHistory
+
+def estimate_bytes(dRequest, dHistory):
+   """
+   Expected size in bytes of the file for one request.
+   """
+
+   tKey = (dRequest["station"], dRequest["timeframe"])
+   if tKey in dHistory["station"]:
+      return dHistory["station"][tKey]
+   if dRequest["timeframe"] in dHistory["timeframe"]:
+      return dHistory["timeframe"][dRequest["timeframe"]]
+   return dDefaultBytes.get(dRequest["timeframe"], dDefaultBytes["daily"])
+
+def estimate_cost(sURL, dHistory):
+   """
+   Expected time in seconds to download the file at sURL.
+   """
+
+   dRequest = eccc_manifest.parse_url_request(sURL)
+   return dHistory["latency"] + estimate_bytes(dRequest, dHistory) / dHistory["throughput"]
+
+def order_by_cost(lUrlPath, lRecord):
+   """
+   Order the downloads from the most to the least expensive.
+
+   The workers take the next file of the queue as soon as they are idle, so
+   starting with the large files (longest processing time first) leaves the
+   small ones to fill the end of the run instead of a few large files
+   finishing alone. Only for a lane without time limit: with a deadline, the
+   files left out would be the small recent ones (see order_by_priority).
+   Equal costs keep the order of create_url. The languages of a request have
+   the same cost, so the languages interleaved by interleave stay together.
+
+   INPUT
+   lUrlPath: list of [URL, localpath] returned by create_url
+   lRecord: list of manifest records of the previous runs
+
+   OUTPUT
+   lUrlPath ordered by decreasing expected cost.
+   """
+
+   dHistory = learn_history(lRecord)
+   lCost = [estimate_cost(lList[0], dHistory) for lList in lUrlPath]
+   lIndex = sorted(range(len(lUrlPath)), key=lambda i: -lCost[i])
+
+   return [lUrlPath[i] for i in lIndex]
+
+def is_recent(dRequest, timeNow):
+   """
+   Return True if the request covers the current or the previous month.
+   Files covering the whole period of the station (monthly, climate) are not recent.
+   """
+
+   nYear = timeNow.year
+   nMonth = timeNow.month
+   if nMonth == 1:
+      lRecentMonth = [(nYear, 1), (nYear - 1, 12)]
+   else:
+      lRecentMonth = [(nYear, nMonth), (nYear, nMonth - 1)]
+
+   if dRequest["timeframe"] == "hourly":
+      return (int(dRequest["year"]), int(dRequest["month"])) in lRecentMonth
+   elif dRequest["timeframe"] == "daily":
+      return int(dRequest["year"]) in [nYearRecent for (nYearRecent, _) in lRecentMonth]
+   else:
+      return False
+
+def split_priority(lUrlPath, setActive, timeNow):
+   """
+   Split the downloads in two lanes: the recent months of the active stations,
+   which are needed first, and the backfill of everything else.
+
+   INPUT
+   lUrlPath: list of [URL, localpath] returned by create_url
+   setActive: set of the station ID considered active
+   timeNow: datetime used to define the current month
+
+   OUTPUT
+   [lRecent, lBackfill]: the two lanes, in the order of lUrlPath
+   """
+
+   lRecent = []
+   lBackfill = []
+   for lList in lUrlPath:
+      dRequest = eccc_manifest.parse_url_request(lList[0])
+      if dRequest["station"] in setActive and is_recent(dRequest, timeNow):
+         lRecent.append(lList)
+      else:
+         lBackfill.append(lList)
+
+   return [lRecent, lBackfill]
+
+def get_priority(lUrlPath, bRecent):
+   """
+   Priority of a download, higher first: the recent lane, then the files covering
+   the whole period of a station (monthly, climate), then the most recent periods.
+   """
+
+   dRequest = eccc_manifest.parse_url_request(lUrlPath[0])
+   if dRequest["year"] is None or not dRequest["year"].isdigit():
+      tPeriod = (9999, 12)
+   elif dRequest["month"] is None or not dRequest["month"].isdigit():
+      tPeriod = (int(dRequest["year"]), 12)
+   else:
+      tPeriod = (int(dRequest["year"]), int(dRequest["month"]))
+
+   return (int(bRecent),) + tPeriod
+
+def order_by_priority(lUrlPath, bRecent=False):
+   """
+   Order the downloads of a lane with a time limit by decreasing priority (see
+   get_priority): the files not started in time are then the ones of lowest
+   priority, as with trim_to_budget. Equal priorities keep the order of
+   create_url, so the languages stay interleaved.
+   """
+
+   lPriority = [get_priority(lList, bRecent) for lList in lUrlPath]
+   # sorted is stable, also in reverse order
+   lIndex = sorted(range(len(lUrlPath)), key=lambda i: lPriority[i], reverse=True)
+
+   return [lUrlPath[i] for i in lIndex]
+
+def get_wall_time(fTotalCost, fMaxCost, nWorkers):
+   """
+   Expected wall time of downloads costing fTotalCost seconds, the longest one fMaxCost.
+   The workers share the queue: the run lasts the total cost divided between them,
+   but never less than the longest file.
+   """
+
+   return max(fTotalCost / nWorkers, fMaxCost)
+
+def estimate_plan(lUrlPath, dHistory, nWorkers=1):
+   """
+   Expected size and duration of a list of downloads.
+
+   INPUT
+   lUrlPath: list of [URL, localpath]
+   dHistory: returned by learn_history
+   nWorkers: number of files downloaded at the same time
+
+   OUTPUT
+   dEstimate: dictionnary with keys "requests", "bytes", "seconds" (wall time), and
+    "timeframe": timeframe -> [requests, bytes]
+   """
+
+   dEstimate = { "requests" : len(lUrlPath), "bytes" : 0.0, "seconds" : 0.0, "timeframe" : {} }
+   fTotalCost = 0.0
+   fMaxCost = 0.0
+   for lList in lUrlPath:
+      dRequest = eccc_manifest.parse_url_request(lList[0])
+      fBytes = estimate_bytes(dRequest, dHistory)
+      fCost = dHistory["latency"] + fBytes / dHistory["throughput"]
+      dEstimate["bytes"] += fBytes
+      [nRequest, fTimeFrameBytes] = dEstimate["timeframe"].get(dRequest["timeframe"], [0, 0.0])
+      dEstimate["timeframe"][dRequest["timeframe"]] = [nRequest + 1, fTimeFrameBytes + fBytes]
+      fTotalCost += fCost
+      fMaxCost = max(fMaxCost, fCost)
+
+   dEstimate["seconds"] = get_wall_time(fTotalCost, fMaxCost, nWorkers)
+
+   return dEstimate
+
+def trim_to_budget(lRecent, lBackfill, dHistory, nWorkers=1, nMaxBytes=None, fMaxTime=None):
+   """
+   Remove the downloads of lowest priority (see get_priority) until the expected
+   size is below nMaxBytes and the expected wall time (as in estimate_plan) below fMaxTime.
+
+   OUTPUT
+   [lRecent, lBackfill, lTrimmed]: the lanes kept, in their original order, and the
+    downloads removed.
+   """
+
+   if nMaxBytes is None and fMaxTime is None:
+      return [lRecent, lBackfill, []]
+
+   nRecent = len(lRecent)
+   lCandidate = [(get_priority(lList, True), i, lList) for (i, lList) in enumerate(lRecent)] + \
+                [(get_priority(lList, False), nRecent + i, lList) \
+                 for (i, lList) in enumerate(lBackfill)]
+   setKept = set()
+   fBytes = 0.0
+   fTotalCost = 0.0
+   fMaxCost = 0.0
+   bFull = False
+   for (tPriority, i, lList) in sorted(lCandidate, key=lambda t: (t[0], -t[1]), reverse=True):
+      fFileBytes = estimate_bytes(eccc_manifest.parse_url_request(lList[0]), dHistory)
+      fFileCost = dHistory["latency"] + fFileBytes / dHistory["throughput"]
+      if (nMaxBytes is not None and fBytes + fFileBytes > nMaxBytes) or \
+         (fMaxTime is not None and \
+          get_wall_time(fTotalCost + fFileCost, max(fMaxCost, fFileCost), nWorkers) > fMaxTime):
+         # Everything of lower priority is trimmed too, so the kept work has no holes
+         bFull = True
+      if bFull:
+         continue
+      setKept.add(i)
+      fBytes += fFileBytes
+      fTotalCost += fFileCost
+      fMaxCost = max(fMaxCost, fFileCost)
+
+   lTrimmed = [lList for (tPriority, i, lList) in lCandidate if i not in setKept]
+   lRecent = [lList for (i, lList) in enumerate(lRecent) if i in setKept]
+   lBackfill = [lList for (i, lList) in enumerate(lBackfill) if nRecent + i in setKept]
+
+   return [lRecent, lBackfill, lTrimmed]
+
+def format_estimate(dEstimate, dHistory, nWorkers=1):
+   """
+   Text report of estimate_plan.
+   """
+
+   lLine = ["Pre-flight estimate with " + str(nWorkers) + " worker(s):"]
+   for sTimeFrame in ["hourly", "daily", "monthly", "climate"]:
+      if sTimeFrame in dEstimate["timeframe"]:
+         [nRequest, fBytes] = dEstimate["timeframe"][sTimeFrame]
+         lLine.append("  %-8s %8d files %12.1f MB" % (sTimeFrame + ":", nRequest, fBytes / 1e6))
+   nSeconds = int(round(dEstimate["seconds"]))
+   lLine.append("  Total: %d requests, %.1f MB, about %d:%02d:%02d" % \
+                (dEstimate["requests"], dEstimate["bytes"] / 1e6, \
+                 nSeconds // 3600, (nSeconds // 60) % 60, nSeconds % 60))
+   lLine.append("  Latency %.2f s, throughput %.2f MB/s" % \
+                (dHistory["latency"], dHistory["throughput"] / 1e6))
+
+   return "\n".join(lLine)
+
+def interleave(llUrlPath):
+   """
+   Merge several lists of downloads, taking one from each list in turn:
+   [[a1, a2, a3], [b1, b2]] -> [a1, b1, a2, b2, a3]
+   """
+
+   lUrlPath = []
+   for i in range(max([len(lList) for lList in llUrlPath] + [0])):
+      for lList in llUrlPath:
+         if i < len(lList):
+            lUrlPath.append(lList[i])
+
+   return lUrlPath
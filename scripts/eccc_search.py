@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_search.py
+Description: Search the ECCC station list by name or code, and format the
+ matching stations as a table or as JSON.
+
+Notes: The index is built once in memory from the rows of the station list.
+ Names are split in words without accents or punctuation; each word of the
+ query must match a word of the name, exactly, as a prefix (sorted word list)
+ or approximately (candidates sharing a trigram, compared with difflib). The
+ Climate ID, WMO ID, TC ID and Station ID are matched exactly.
+"""
+
+import sys
+import json
+import bisect
+import difflib
+import unicodedata
+
+# Columns matched exactly, without case
+lCodeColumn = ["Station ID", "Climate ID", "WMO ID", "TC ID"]
+# Columns of the table output
+lTableColumn = ["Station ID", "Name", "Province", "Climate ID", "WMO ID", "TC ID", \
+                "Latitude (Decimal Degrees)", "Longitude (Decimal Degrees)", \
+                "First Year", "Last Year"]
+lTableTitle = ["Station ID", "Name", "Province", "Climate ID", "WMO", "TC", \
+               "Latitude", "Longitude", "First", "Last"]
+
+# Minimal similarity (difflib ratio) of a fuzzy match
+FUZZY_CUTOFF = 0.75
+
+# Score of each kind of match, the best stations are returned first
+SCORE_CODE = 100
+SCORE_WORD = 2
+SCORE_PREFIX = 1
+SCORE_FUZZY = 0
+
+def normalize(sText):
+   """
+   Upper case, no accent, no punctuation: 'Montréal/Pierre-Elliott' -> 'MONTREAL PIERRE ELLIOTT'
+   """
+
+   sText = unicodedata.normalize("NFKD", sText or "")
+   sText = "".join([c for c in sText if not unicodedata.combining(c)]).upper()
+
+   return "".join([c if c.isalnum() else " " for c in sText])
+
+def get_trigrams(sWord):
+   """
+   Set of the trigrams of a word, with its ends marked: 'ABC' -> {' AB', 'ABC', 'BC '}
+   """
+
+   sWord = " " + sWord + " "
+   return set([sWord[i:i+3] for i in range(len(sWord) - 2)])
+
+def build_index(lRow):
+   """
+   Build the search index of the stations.
+
+   INPUT
+   lRow: rows of the station list, dictionnaries with the keys of COLUMN_TITLE_EN.
+
+   OUTPUT
+   dIndex: dictionnary with
+    "row": station ID -> row
+    "word": word of a name -> set of station ID
+    "sorted": sorted list of the words, for the prefix search
+    "trigram": trigram -> set of words, for the fuzzy search
+    "code": upper case code -> set of station ID
+   """
+
+   dIndex = { "row" : {}, "word" : {}, "sorted" : [], "trigram" : {}, "code" : {} }
+
+   for row in lRow:
+      sStation = row["Station ID"].strip()
+      dIndex["row"][sStation] = row
+      for sWord in normalize(row["Name"]).split():
+         dIndex["word"].setdefault(sWord, set()).add(sStation)
+      for sColumn in lCodeColumn:
+         sCode = (row[sColumn] or "").strip().upper()
+         if sCode != "":
+            dIndex["code"].setdefault(sCode, set()).add(sStation)
+
+   dIndex["sorted"] = sorted(dIndex["word"].keys())
+   for sWord in dIndex["sorted"]:
+      for sTrigram in get_trigrams(sWord):
+         dIndex["trigram"].setdefault(sTrigram, set()).add(sWord)
+
+   return dIndex
+
+def match_word(dIndex, sQueryWord, bPrefix, bFuzzy):
+   """
+   Stations whose name has a word matching sQueryWord.
+
+   OUTPUT
+   dScore: station ID -> best score of the match
+   """
+
+   dScore = {}
+
+   def add(setStation, nScore):
+      for sStation in setStation:
+         if dScore.get(sStation, -1) < nScore:
+            dScore[sStation] = nScore
+
+   add(dIndex["word"].get(sQueryWord, set()), SCORE_WORD)
+
+   if bPrefix:
+      lSorted = dIndex["sorted"]
+      i = bisect.bisect_left(lSorted, sQueryWord)
+      while i < len(lSorted) and lSorted[i].startswith(sQueryWord):
+         add(dIndex["word"][lSorted[i]], SCORE_PREFIX)
+         i = i + 1
+
+   if bFuzzy:
+      # Only the words sharing a trigram with the query are compared
+      setCandidate = set()
+      for sTrigram in get_trigrams(sQueryWord):
+         setCandidate.update(dIndex["trigram"].get(sTrigram, set()))
+      matcher = difflib.SequenceMatcher(b=sQueryWord)
+      for sWord in setCandidate:
+         matcher.set_seq1(sWord)
+         if matcher.real_quick_ratio() >= FUZZY_CUTOFF and \
+            matcher.quick_ratio() >= FUZZY_CUTOFF and \
+            matcher.ratio() >= FUZZY_CUTOFF:
+            add(dIndex["word"][sWord], SCORE_FUZZY)
+
+   return dScore
+
+def is_active_in(row, nYear):
+   """
+   True if the station has observations during nYear ('First Year' <= nYear <= 'Last Year').
+   """
+
+   sFirstYear = (row["First Year"] or "").strip()
+   sLastYear = (row["Last Year"] or "").strip()
+   if not sFirstYear.isdigit() or not sLastYear.isdigit():
+      return False
+
+   return int(sFirstYear) <= nYear <= int(sLastYear)
+
+def search(dIndex, sQuery, bPrefix=False, bFuzzy=False):
+   """
+   Find the stations matching a query.
+
+   INPUT
+   dIndex: index returned by build_index
+   sQuery: a code (Station ID, Climate ID, WMO ID, TC ID) or words of the station name.
+    Every word must match.
+   bPrefix: the words of the query can be the beginning of a word of the name
+   bFuzzy: the words of the query can be misspelled
+
+   OUTPUT
+   lStation: station ID, best matches first, then by name.
+   """
+
+   dScore = {}
+   for sStation in dIndex["code"].get(sQuery.strip().upper(), set()):
+      dScore[sStation] = SCORE_CODE
+
+   lQueryWord = normalize(sQuery).split()
+   if len(lQueryWord) > 0:
+      dWordScore = None
+      for sQueryWord in lQueryWord:
+         dMatch = match_word(dIndex, sQueryWord, bPrefix, bFuzzy)
+         if dWordScore is None:
+            dWordScore = dMatch
+         else:
+            dWordScore = dict((sStation, dWordScore[sStation] + dMatch[sStation]) \
+                              for sStation in dWordScore if sStation in dMatch)
+      for sStation in dWordScore:
+         dScore[sStation] = max(dScore.get(sStation, 0), dWordScore[sStation])
+
+   return sorted(dScore.keys(), key=lambda s: (-dScore[s], dIndex["row"][s]["Name"], int(s)))
+
+def format_json(lRow):
+   """
+   Rows as a JSON list of objects with the columns of the station list.
+   """
+
+   return json.dumps([dict((sColumn, row[sColumn]) for sColumn in row if sColumn is not None) \
+                      for row in lRow], ensure_ascii=False, indent=1)
+
+def format_table(lRow):
+   """
+   Rows as a text table, one line per station.
+   """
+
+   llCell = [lTableTitle] + [[(row[sColumn] or "").strip() for sColumn in lTableColumn] \
+                             for row in lRow]
+   lWidth = [max([len(lCell[i]) for lCell in llCell]) for i in range(len(lTableColumn))]
+
+   return "\n".join(["  ".join([lCell[i].ljust(lWidth[i]) for i in range(len(lCell))]).rstrip() \
+                     for lCell in llCell])
+
+def write_output(sText, sPath=None):
+   """
+   Write the formatted stations in sPath, or on the standard output.
+   """
+
+   if sPath is None:
+      sys.stdout.write(sText + "\n")
+   else:
+      with open(sPath, 'w', encoding='utf-8') as fileOutput:
+         fileOutput.write(sText + "\n")
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_storage.py
+Description: Where get_canadian_weather_observations.py writes the downloaded
+ files: a local directory or an S3-compatible object storage (AWS, MinIO, ...).
+
+Notes: A storage is a dictionnary returned by get_storage, given to the other
+ functions; paths are 'DIRECTORY/FILENAME' in both cases, with
+ 's3://bucket/prefix' as the directory of an object storage. Objects are
+ uploaded from memory, without a local copy: in one request, or in parts of
+ nPartSize bytes sent by several threads for the large files. The upload is not
+ streamed, the whole file being in memory (body read by eccc_cache.fetch): its
+ ETag is compared with the stored one before anything is sent, and an ECCC file
+ is at most a few megabytes. The objects of a
+ directory are listed once per process and kept in memory, with their ETag: the
+ --no-clobber checks and the comparison with the previous version of a file
+ (new, changed or unchanged) do not send any other request. boto3 is only
+ needed for the object storage.
+"""
+
+import os
+import glob
+import fnmatch
+import hashlib
+
+S3_SCHEME = "s3://"
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_CONCURRENCY = 4
+
+# Clients and listings of this process, a storage dictionnary being sent to the workers of the pool.
+# (process ID, endpoint) -> client: a client is not shared with the workers forked from this process.
+dClient = {}
+# (endpoint, directory) -> { path : ETag }
+dListing = {}
+
+def normalize_directory(sDirectory):
+   """
+   Object storage directory without trailing '/': 's3://bucket/prefix/' -> 's3://bucket/prefix',
+   so the paths built from it are the keys of the listings. A local directory is unchanged.
+   """
+
+   if not is_remote(sDirectory):
+      return sDirectory
+
+   return sDirectory.rstrip("/")
+
+def is_remote(sDirectory):
+   """
+   True if sDirectory is in an object storage ('s3://bucket/prefix').
+   """
+
+   return sDirectory is not None and sDirectory.startswith(S3_SCHEME)
+
+def is_available():
+   """
+   True if boto3, needed for the object storage, is installed.
+   """
+
+   import importlib.util
+
+   return importlib.util.find_spec("boto3") is not None
+
+def get_storage(sDirectory, sEndpoint=None, nPartSize=DEFAULT_PART_SIZE, \
+                nConcurrency=DEFAULT_CONCURRENCY):
+   """
+   Storage of an output directory.
+
+   INPUT
+   sDirectory: local directory or 's3://bucket/prefix'
+   sEndpoint: URL of the S3-compatible service (http://localhost:9000 for a local MinIO).
+    Default is AWS, or the AWS_ENDPOINT_URL environment variable.
+   nPartSize: files larger than this are uploaded in parts of this size
+   nConcurrency: number of parts of a file uploaded at the same time
+
+   OUTPUT
+   dStorage: dictionnary with "type" ("local" or "s3"), "endpoint", "part_size" and "concurrency"
+   """
+
+   if not is_remote(sDirectory):
+      return { "type" : "local" }
+
+   return { "type" : "s3", \
+            "endpoint" : sEndpoint, \
+            "part_size" : nPartSize, \
+            "concurrency" : nConcurrency }
+
+def split_path(sPath):
+   """
+   's3://bucket/a/b.csv' -> ['bucket', 'a/b.csv']
+   """
+
+   lPart = sPath[len(S3_SCHEME):].split("/", 1)
+   if len(lPart) == 1:
+      return [lPart[0], ""]
+
+   return [lPart[0], lPart[1].strip("/")]
+
+def get_client(dStorage):
+   """
+   boto3 client of the storage, created once per process: the connections of a client
+   cannot be used by the workers forked after it was created. The credentials are found
+   by boto3 (AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY, ~/.aws/credentials, ...).
+   """
+
+   tKey = (os.getpid(), dStorage["endpoint"])
+   if tKey not in dClient:
+      # From boto3: https://pypi.org/project/boto3/
+      import boto3
+      dClient[tKey] = boto3.client("s3", endpoint_url=dStorage["endpoint"])
+
+   return dClient[tKey]
+
+def list_directory(dStorage, sDirectory):
+   """
+   Objects directly in an object storage directory, listed once per process.
+
+   OUTPUT
+   dObject: path -> ETag (without quotes)
+   """
+
+   sDirectory = sDirectory.rstrip("/")
+   tKey = (dStorage["endpoint"], sDirectory)
+   if tKey not in dListing:
+      [sBucket, sPrefix] = split_path(sDirectory)
+      if sPrefix != "":
+         sPrefix = sPrefix + "/"
+      dObject = {}
+      paginator = get_client(dStorage).get_paginator("list_objects_v2")
+      for dPage in paginator.paginate(Bucket=sBucket, Prefix=sPrefix, Delimiter="/"):
+         for dContent in dPage.get("Contents", []):
+            dObject[S3_SCHEME + sBucket + "/" + dContent["Key"]] = dContent["ETag"].strip('"')
+      dListing[tKey] = dObject
+
+   return dListing[tKey]
+
+def prefetch_listings(dStorage, lDirectory):
+   """
+   List the directories before the pool is started, so the workers created by fork
+   share the listings instead of listing the directories again.
+   """
+
+   if dStorage["type"] == "s3":
+      for sDirectory in set(lDirectory):
+         list_directory(dStorage, sDirectory)
+
+def is_writable(dStorage, sDirectory):
+   """
+   True if the files can be written in sDirectory. For an object storage, only the
+   access to the bucket is checked.
+   """
+
+   if dStorage["type"] == "local":
+      return os.access(sDirectory, os.W_OK)
+
+   # From botocore (installed with boto3)
+   import botocore.exceptions
+
+   try:
+      get_client(dStorage).head_bucket(Bucket=split_path(sDirectory)[0])
+   except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError):
+      return False
+
+   return True
+
+def is_directory(dStorage, sDirectory):
+   """
+   True if sDirectory exists. The directories of an object storage always exist.
+   """
+
+   if dStorage["type"] == "local":
+      return os.path.isdir(sDirectory)
+
+   return True
+
+def make_directory(dStorage, sDirectory):
+   """
+   Create a local directory. Nothing to do in an object storage.
+   """
+
+   if dStorage["type"] == "local":
+      os.makedirs(sDirectory)
+
+def glob_paths(dStorage, sPattern):
+   """
+   Paths matching sPattern. The wildcards must be in the filename, not in the directory.
+   """
+
+   if dStorage["type"] == "local":
+      return glob.glob(sPattern)
+
+   [sDirectory, sFilename] = sPattern.rsplit("/", 1)
+   return [sPath for sPath in list_directory(dStorage, sDirectory) \
+           if fnmatch.fnmatchcase(sPath.rsplit("/", 1)[1], sFilename)]
+
+def get_etag(content, nPartSize):
+   """
+   ETag given by the object storage to content uploaded by write_file: MD5 of a file
+   sent in one request, MD5 of the MD5 of the parts followed by the number of parts
+   for a multipart upload.
+   """
+
+   if len(content) <= nPartSize:
+      return hashlib.md5(content).hexdigest()
+
+   lDigest = [hashlib.md5(content[nStart:nStart + nPartSize]).digest() \
+              for nStart in range(0, len(content), nPartSize)]
+   return hashlib.md5(b"".join(lDigest)).hexdigest() + "-" + str(len(lDigest))
+
+def get_change(dStorage, sPath, content):
+   """
+   Compare content with the file already at sPath.
+
+   OUTPUT
+   "new", "changed" or "unchanged"
+   """
+
+   if dStorage["type"] == "local":
+      if not os.path.exists(sPath):
+         return "new"
+      with open(sPath, "rb") as fileStored:
+         if hashlib.sha256(fileStored.read()).digest() == hashlib.sha256(content).digest():
+            return "unchanged"
+      return "changed"
+
+   dObject = list_directory(dStorage, sPath.rsplit("/", 1)[0])
+   if sPath not in dObject:
+      return "new"
+   # An object uploaded with another part size is seen as changed, and uploaded again
+   if dObject[sPath] == get_etag(content, dStorage["part_size"]):
+      return "unchanged"
+
+   return "changed"
+
+def upload_multipart(dStorage, sBucket, sKey, content, dMetadata):
+   """
+   Upload content in parts of dStorage["part_size"] bytes, dStorage["concurrency"]
+   parts at the same time. The upload is aborted if a part fails.
+   """
+
+   from concurrent.futures import ThreadPoolExecutor
+
+   client = get_client(dStorage)
+   nPartSize = dStorage["part_size"]
+   sUploadId = client.create_multipart_upload(Bucket=sBucket, Key=sKey, \
+                                              Metadata=dMetadata)["UploadId"]
+   viewContent = memoryview(content)
+
+   def upload_part(nPart):
+      nStart = (nPart - 1) * nPartSize
+      dResponse = client.upload_part(Bucket=sBucket, Key=sKey, UploadId=sUploadId, \
+                                     PartNumber=nPart, \
+                                     Body=bytes(viewContent[nStart:nStart + nPartSize]))
+      return { "PartNumber" : nPart, "ETag" : dResponse["ETag"] }
+
+   lPartNumber = list(range(1, (len(content) + nPartSize - 1) // nPartSize + 1))
+   try:
+      with ThreadPoolExecutor(dStorage["concurrency"]) as executor:
+         lPart = list(executor.map(upload_part, lPartNumber))
+      client.complete_multipart_upload(Bucket=sBucket, Key=sKey, UploadId=sUploadId, \
+                                       MultipartUpload={ "Parts" : lPart })
+   except Exception:
+      client.abort_multipart_upload(Bucket=sBucket, Key=sKey, UploadId=sUploadId)
+      raise
+
+def write_file(dStorage, sPath, content, sSha256=None):
+   """
+   Write content at sPath. In an object storage, sSha256 is saved in the metadata of
+   the object and the listing of the directory is updated.
+   """
+
+   if dStorage["type"] == "local":
+      with open(sPath, "wb") as fileOutput:
+         fileOutput.write(content)
+      return
+
+   [sBucket, sKey] = split_path(sPath)
+   dMetadata = {}
+   if sSha256 is not None:
+      dMetadata["sha256"] = sSha256
+   if len(content) <= dStorage["part_size"]:
+      get_client(dStorage).put_object(Bucket=sBucket, Key=sKey, Body=content, Metadata=dMetadata)
+   else:
+      upload_multipart(dStorage, sBucket, sKey, content, dMetadata)
+
+   list_directory(dStorage, sPath.rsplit("/", 1)[0])[sPath] = \
+      get_etag(content, dStorage["part_size"])
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_weights.py
+Description: Maintain the pairwise interpolation weights between the active
+ stations and their neighbours (climate.precip_pairwise_weights) incrementally.
+
+Notes: Same weights as scripts/interpolate/create_active_weights_dbase.R:
+ comp_weight = 0.75 * corr_weight + 0.25 * dist_weight, where dist_weight is
+ the distance standardized to [0, 1] (1 = closest) and corr_weight is the
+ correlation between the representative precipitation years of the two
+ stations, weighted by the completeness of the neighbour's year. Only the
+ nearest --neighbours stations of each active station are kept.
+
+ The correlations of the previous run are reused for every pair where neither
+ station changed (coordinates or representative year). The distances are
+ always recomputed since they are cheap and their standardization depends on
+ the whole station set.
+"""
+
+import os
+import csv
+import json
+import hashlib
+import argparse
+
+# From numpy: https://pypi.org/project/numpy/
+import numpy
+
+import eccc_inventory
+
+# Weight of the correlation and of the distance in the composite weight
+CORR_WEIGHT = 0.75
+DIST_WEIGHT = 0.25
+# Number of nearest stations kept for each active station
+DEFAULT_NEIGHBOURS = 300
+# Number of pairs correlated at once, to bound the memory used
+PAIR_BATCH = 10000
+EARTH_RADIUS = 6371008.8
+
+# Columns of climate.precip_pairwise_weights
+WEIGHT_COLUMNS = ["active_station", "station_id", "corr_weight", \
+                  "rep_year_completeness", "dist_weight", "comp_weight"]
+
+# Month-day index of a non leap year, in calendar order ('1-1', '1-2', ...)
+lDayIndex = [str(nMonth) + "-" + str(nDay) \
+             for (nMonth, nDays) in enumerate([31,28,31,30,31,30,31,31,30,31,30,31], 1) \
+             for nDay in range(1, nDays + 1)]
+dDayPosition = dict((sIndex, i) for (i, sIndex) in enumerate(lDayIndex))
+
+def normalize_day_index(sIndex):
+   """
+   Return the month-day index without leading zeros ('01-05' -> '1-5').
+   """
+
+   [sMonth, sDay] = sIndex.strip().split("-")
+   return str(int(sMonth)) + "-" + str(int(sDay))
+
+def read_representative_year(sPath, sColumn="mean_total_precip"):
+   """
+   Read a representative year table (index, ec_station_id, mean_total_precip), as
+   exported from climate.precip_representative_year or written by eccc_climatology.py.
+
+   OUTPUT
+   dYear: dictionnary with the station ID as key and an array of 365 values (NaN
+    when missing, February 29 removed) as value.
+   """
+
+   dYear = {}
+   with open(sPath, 'r') as fileYear:
+      for row in csv.DictReader(fileYear):
+         sIndex = normalize_day_index(row["index"])
+         if sIndex not in dDayPosition: # February 29
+            continue
+         sStation = row["ec_station_id"].strip()
+         if sStation not in dYear:
+            dYear[sStation] = numpy.full(len(lDayIndex), numpy.nan)
+         sValue = row[sColumn]
+         if sValue not in ["", "NA", "NaN", None]:
+            dYear[sStation][dDayPosition[sIndex]] = float(sValue)
+
+   return dYear
+
+def get_fingerprint(fLatitude, fLongitude, arrYear):
+   """
+   Hash of the data used by the weights of a station.
+   """
+
+   hashStation = hashlib.sha1()
+   hashStation.update(numpy.array([fLatitude, fLongitude], dtype=float).tobytes())
+   hashStation.update(numpy.asarray(arrYear, dtype=float).tobytes())
+
+   return hashStation.hexdigest()
+
+def distance_matrix(arrLatA, arrLonA, arrLatB, arrLonB):
+   """
+   Great circle distance in meters between each station of A (rows) and of B (columns).
+   """
+
+   arrLatA = numpy.radians(arrLatA)[:, None]
+   arrLonA = numpy.radians(arrLonA)[:, None]
+   arrLatB = numpy.radians(arrLatB)[None, :]
+   arrLonB = numpy.radians(arrLonB)[None, :]
+
+   arrHav = numpy.sin((arrLatB - arrLatA) / 2.0) ** 2 + \
+            numpy.cos(arrLatA) * numpy.cos(arrLatB) * numpy.sin((arrLonB - arrLonA) / 2.0) ** 2
+
+   return 2.0 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.clip(arrHav, 0.0, 1.0)))
+
+def pairwise_correlation(arrA, arrB):
+   """
+   Pearson correlation between the rows of arrA and arrB, using only the days where
+   both values are available (R: cor(use = 'pairwise.complete.obs')).
+
+   OUTPUT
+   arrCorr: one correlation per row, NaN if it cannot be computed.
+   """
+
+   arrMask = ~numpy.isnan(arrA) & ~numpy.isnan(arrB)
+   arrCount = arrMask.sum(axis=1)
+   arrA = numpy.where(arrMask, arrA, 0.0)
+   arrB = numpy.where(arrMask, arrB, 0.0)
+
+   with numpy.errstate(invalid="ignore", divide="ignore"):
+      arrMeanA = arrA.sum(axis=1) / arrCount
+      arrMeanB = arrB.sum(axis=1) / arrCount
+      arrDevA = numpy.where(arrMask, arrA - arrMeanA[:, None], 0.0)
+      arrDevB = numpy.where(arrMask, arrB - arrMeanB[:, None], 0.0)
+      arrCorr = (arrDevA * arrDevB).sum(axis=1) / \
+                numpy.sqrt((arrDevA ** 2).sum(axis=1) * (arrDevB ** 2).sum(axis=1))
+
+   arrCorr[arrCount < 2] = numpy.nan
+
+   return arrCorr
+
+def correlation_weights(arrActiveYear, arrStationYear):
+   """
+   Correlation weight and completeness for pairs of representative years.
+
+   INPUT
+   arrActiveYear, arrStationYear: arrays of shape (pairs, 365)
+
+   OUTPUT
+   [arrCorrWeight, arrCompleteness]
+   """
+
+   arrCompleteness = 1.0 - numpy.isnan(arrStationYear).sum(axis=1) / float(arrStationYear.shape[1])
+   arrCorrWeight = pairwise_correlation(arrActiveYear, arrStationYear) * arrCompleteness
+   # No precipitation at all for the neighbour: the correlation weight is also 0
+   arrCorrWeight[arrCompleteness == 0] = 0.0
+
+   return [arrCorrWeight, arrCompleteness]
+
+def read_weights(sPath):
+   """
+   Read a weight table written by write_weights.
+
+   OUTPUT
+   dWeight: dictionnary with (active_station, station_id) as key and the row as value.
+   """
+
+   dWeight = {}
+   if sPath is None or not os.path.exists(sPath):
+      return dWeight
+
+   with open(sPath, 'r') as fileWeight:
+      for row in csv.DictReader(fileWeight):
+         dWeight[(row["active_station"], row["station_id"])] = row
+
+   return dWeight
+
+def write_weights(sPath, lRow):
+   """
+   Write the weight table as a CSV with the columns of climate.precip_pairwise_weights.
+   """
+
+   with open(sPath, 'w', newline='') as fileWeight:
+      writer = csv.DictWriter(fileWeight, fieldnames=WEIGHT_COLUMNS)
+      writer.writeheader()
+      for row in lRow:
+         writer.writerow(row)
+
+def format_value(fValue):
+   """
+   Format a float for the CSV, missing values as NA like the R scripts.
+   """
+
+   if fValue is None or numpy.isnan(fValue):
+      return "NA"
+   return repr(float(fValue))
+
+def parse_value(sValue):
+   """
+   Read a float written by format_value.
+   """
+
+   if sValue in ["", "NA", None]:
+      return numpy.nan
+   return float(sValue)
+
+def update_weights(lStationRow, dYear, setActive, dPreviousWeight, dPreviousFingerprint, \
+                   nNeighbours=DEFAULT_NEIGHBOURS):
+   """
+   Compute the pairwise weights, reusing the correlations of the previous run for
+   the pairs where neither station changed.
+
+   INPUT
+   lStationRow: station inventory rows (eccc_inventory.read_station_rows)
+   dYear: representative years by station (read_representative_year)
+   setActive: station ID of the active stations
+   dPreviousWeight: weights of the previous run (read_weights)
+   dPreviousFingerprint: fingerprints of the previous run, by station
+   nNeighbours: number of nearest stations kept for each active station
+
+   OUTPUT
+   [lRow, dFingerprint, nComputed]: the weight rows ordered by active station and
+    decreasing comp_weight, the fingerprints of this run and the number of
+    correlations computed.
+   """
+
+   # Only the stations with coordinates and a representative year can be weighted
+   lStation = []
+   lLatitude = []
+   lLongitude = []
+   for row in lStationRow:
+      sStation = row["Station ID"].strip()
+      try:
+         fLatitude = float(row["Latitude (Decimal Degrees)"])
+         fLongitude = float(row["Longitude (Decimal Degrees)"])
+      except (TypeError, ValueError):
+         continue
+      if sStation in dYear:
+         lStation.append(sStation)
+         lLatitude.append(fLatitude)
+         lLongitude.append(fLongitude)
+
+   arrLatitude = numpy.array(lLatitude)
+   arrLongitude = numpy.array(lLongitude)
+   arrYear = numpy.array([dYear[sStation] for sStation in lStation]).reshape(len(lStation), \
+                                                                              len(lDayIndex))
+   dFingerprint = dict((sStation, get_fingerprint(lLatitude[i], lLongitude[i], arrYear[i])) \
+                       for (i, sStation) in enumerate(lStation))
+   setChanged = set(sStation for sStation in lStation \
+                    if dPreviousFingerprint.get(sStation) != dFingerprint[sStation])
+
+   lActiveIndex = [i for (i, sStation) in enumerate(lStation) if sStation in setActive]
+   if len(lActiveIndex) == 0 or len(lStation) < 2:
+      return [[], dFingerprint, 0]
+   arrActiveIndex = numpy.array(lActiveIndex)
+
+   # Distances between every active station and all the stations, without itself
+   arrDistance = distance_matrix(arrLatitude[arrActiveIndex], arrLongitude[arrActiveIndex], \
+                                 arrLatitude, arrLongitude)
+   arrDistance[numpy.arange(len(arrActiveIndex)), arrActiveIndex] = numpy.nan
+   arrMin = numpy.nanmin(arrDistance, axis=1)[:, None]
+   arrRange = numpy.nanmax(arrDistance, axis=1)[:, None] - arrMin
+   arrRange[arrRange == 0] = 1.0
+   arrDistWeight = 1.0 - (arrDistance - arrMin) / arrRange
+
+   # Nearest neighbours of each active station
+   nKeep = min(nNeighbours, len(lStation) - 1)
+   arrRank = numpy.where(numpy.isnan(arrDistance), numpy.inf, arrDistance)
+   arrNeighbour = numpy.argpartition(arrRank, nKeep - 1, axis=1)[:, :nKeep]
+
+   arrPairActive = numpy.repeat(arrActiveIndex, nKeep)
+   arrPairStation = arrNeighbour.ravel()
+   arrPairDist = arrDistWeight[numpy.repeat(numpy.arange(len(arrActiveIndex)), nKeep), arrPairStation]
+   arrCorrWeight = numpy.full(len(arrPairActive), numpy.nan)
+   arrCompleteness = numpy.full(len(arrPairActive), numpy.nan)
+
+   # Reuse the correlations of the pairs that did not change
+   lDirty = []
+   for i in range(len(arrPairActive)):
+      sActive = lStation[arrPairActive[i]]
+      sStation = lStation[arrPairStation[i]]
+      rowPrevious = dPreviousWeight.get((sActive, sStation))
+      if rowPrevious is None or sActive in setChanged or sStation in setChanged:
+         lDirty.append(i)
+      else:
+         arrCorrWeight[i] = parse_value(rowPrevious["corr_weight"])
+         arrCompleteness[i] = parse_value(rowPrevious["rep_year_completeness"])
+
+   # Correlate the other pairs by batch
+   arrDirty = numpy.array(lDirty, dtype=int)
+   for nStart in range(0, len(arrDirty), PAIR_BATCH):
+      arrBatch = arrDirty[nStart:nStart + PAIR_BATCH]
+      [arrCorrWeight[arrBatch], arrCompleteness[arrBatch]] = \
+         correlation_weights(arrYear[arrPairActive[arrBatch]], arrYear[arrPairStation[arrBatch]])
+
+   arrCompWeight = CORR_WEIGHT * arrCorrWeight + DIST_WEIGHT * arrPairDist
+
+   # Order by active station, then decreasing composite weight (NA last)
+   arrOrder = numpy.lexsort((-numpy.nan_to_num(arrCompWeight, nan=-numpy.inf), arrPairActive))
+   lRow = []
+   for i in arrOrder:
+      lRow.append({ "active_station" : lStation[arrPairActive[i]], \
+                    "station_id" : lStation[arrPairStation[i]], \
+                    "corr_weight" : format_value(arrCorrWeight[i]), \
+                    "rep_year_completeness" : format_value(arrCompleteness[i]), \
+                    "dist_weight" : format_value(arrPairDist[i]), \
+                    "comp_weight" : format_value(arrCompWeight[i]) })
+
+   return [lRow, dFingerprint, len(arrDirty)]
+
+############################################################
+# eccc_weights in Command line
+#
+
+def get_command_line():
+   """
+   Parse the command line and perform all the checks.
+   """
+
+   parser = argparse.ArgumentParser(prog='eccc_weights.py', \
+                                    description="Update the pairwise interpolation weights between the active stations and their nearest stations.")
+   parser.add_argument("--station-file", "-S", dest="StationPath", required=True, \
+                       help="Station list CSV (as downloaded from ECCC or data/station_list_BC.csv).",\
+                       action="store", type=str)
+   parser.add_argument("--rep-year", "-r", dest="RepYearPath", required=True, \
+                       help="CSV with the columns index, ec_station_id and mean_total_precip (climate.precip_representative_year).",\
+                       action="store", type=str)
+   parser.add_argument("--active-stations", "-a", dest="ActiveStationPath", \
+                       help="File with one active station ID per line. Default is the stations reporting daily values since last year.",\
+                       action="store", type=str, default=None)
+   parser.add_argument("--output", "-o", dest="OutputPath", required=True, \
+                       help="CSV of the weights (climate.precip_pairwise_weights). If it exists, the unchanged pairs are reused.",\
+                       action="store", type=str)
+   parser.add_argument("--neighbours", "-k", dest="Neighbours", \
+                       help="Number of nearest stations kept for each active station. Default is %d." % DEFAULT_NEIGHBOURS,\
+                       action="store", type=int, default=DEFAULT_NEIGHBOURS)
+   parser.add_argument("--full", dest="Full", \
+                       help="Ignore the previous run and recompute every pair.",\
+                       action="store_true", default=False)
+
+   options = parser.parse_args()
+
+   for sPath in [options.StationPath, options.RepYearPath, options.ActiveStationPath]:
+      if sPath is not None and not os.path.exists(sPath):
+         print ("Error: file '%s' does not exist. Exiting." % (sPath))
+         exit(2)
+   if options.Neighbours < 1:
+      print ("Error: '--neighbours' must be at least 1. Exiting.")
+      exit(3)
+
+   return options
+
+def main(tOptions):
+   lStationRow = eccc_inventory.read_station_rows(tOptions.StationPath)
+   dYear = read_representative_year(tOptions.RepYearPath)
+   if tOptions.ActiveStationPath is not None:
+      setActive = eccc_inventory.read_station_ids(tOptions.ActiveStationPath)
+   else:
+      setActive = set(row["Station ID"].strip() for row in lStationRow if eccc_inventory.is_active(row))
+
+   # Fingerprints of the previous run are saved next to the weights
+   sStatePath = tOptions.OutputPath + ".state.json"
+   dPreviousWeight = {}
+   dPreviousFingerprint = {}
+   if not tOptions.Full and os.path.exists(sStatePath):
+      dPreviousWeight = read_weights(tOptions.OutputPath)
+      with open(sStatePath, 'r') as fileState:
+         dPreviousFingerprint = json.load(fileState)["fingerprint"]
+
+   [lRow, dFingerprint, nComputed] = update_weights(lStationRow, dYear, setActive, dPreviousWeight, \
+                                                    dPreviousFingerprint, tOptions.Neighbours)
+
+   write_weights(tOptions.OutputPath, lRow)
+   with open(sStatePath, 'w') as fileState:
+      json.dump({ "fingerprint" : dFingerprint, "neighbours" : tOptions.Neighbours }, fileState)
+
+   print ("Pairs: " + str(len(lRow)) + ", correlations computed: " + str(nComputed) + \
+          ", reused: " + str(len(lRow) - nComputed))
+
+
+if __name__ == "__main__":
+
+   tOptions = get_command_line()
+   main(tOptions)
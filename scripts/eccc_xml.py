@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        eccc_xml.py
+Description: Read the hourly and daily XML files downloaded with '--format xml'
+ and write them with the columns of the English CSV files.
+
+Notes: The XML is read with iterparse and every <stationdata> element is
+ cleared once its row is built, so the memory used does not depend on the size
+ of the file. The station name, climate ID and coordinates of the
+ <stationinformation> header are repeated on every row, as in the CSV files;
+ the whole header is also available with read_station_information. The column
+ names are the English ones, whatever the language of the XML.
+"""
+
+import os
+import csv
+import json
+import time
+import argparse
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+# Columns of the English CSV files
+DAILY_COLUMNS = ["Longitude (x)", "Latitude (y)", "Station Name", "Climate ID", "Date/Time", \
+                 "Year", "Month", "Day", "Data Quality", "Max Temp (°C)", "Max Temp Flag", \
+                 "Min Temp (°C)", "Min Temp Flag", "Mean Temp (°C)", "Mean Temp Flag", \
+                 "Heat Deg Days (°C)", "Heat Deg Days Flag", "Cool Deg Days (°C)", \
+                 "Cool Deg Days Flag", "Total Rain (mm)", "Total Rain Flag", "Total Snow (cm)", \
+                 "Total Snow Flag", "Total Precip (mm)", "Total Precip Flag", "Snow on Grnd (cm)", \
+                 "Snow on Grnd Flag", "Dir of Max Gust (10s deg)", "Dir of Max Gust Flag", \
+                 "Spd of Max Gust (km/h)", "Spd of Max Gust Flag"]
+HOURLY_COLUMNS = ["Longitude (x)", "Latitude (y)", "Station Name", "Climate ID", "Date/Time (LST)", \
+                  "Year", "Month", "Day", "Time (LST)", "Temp (°C)", "Temp Flag", \
+                  "Dew Point Temp (°C)", "Dew Point Temp Flag", "Rel Hum (%)", "Rel Hum Flag", \
+                  "Precip. Amount (mm)", "Precip. Amount Flag", "Wind Dir (10s deg)", \
+                  "Wind Dir Flag", "Wind Spd (km/h)", "Wind Spd Flag", "Visibility (km)", \
+                  "Visibility Flag", "Stn Press (kPa)", "Stn Press Flag", "Hmdx", "Hmdx Flag", \
+                  "Wind Chill", "Wind Chill Flag", "Weather"]
+
+# Element of <stationdata> -> (value column, flag column)
+dDailyElement = { "maxtemp" : ("Max Temp (°C)", "Max Temp Flag"), \
+                  "mintemp" : ("Min Temp (°C)", "Min Temp Flag"), \
+                  "meantemp" : ("Mean Temp (°C)", "Mean Temp Flag"), \
+                  "heatdegdays" : ("Heat Deg Days (°C)", "Heat Deg Days Flag"), \
+                  "cooldegdays" : ("Cool Deg Days (°C)", "Cool Deg Days Flag"), \
+                  "totalrain" : ("Total Rain (mm)", "Total Rain Flag"), \
+                  "totalsnow" : ("Total Snow (cm)", "Total Snow Flag"), \
+                  "totalprecipitation" : ("Total Precip (mm)", "Total Precip Flag"), \
+                  "snowonground" : ("Snow on Grnd (cm)", "Snow on Grnd Flag"), \
+                  "dirofmaxgust" : ("Dir of Max Gust (10s deg)", "Dir of Max Gust Flag"), \
+                  "speedofmaxgust" : ("Spd of Max Gust (km/h)", "Spd of Max Gust Flag") }
+dHourlyElement = { "temp" : ("Temp (°C)", "Temp Flag"), \
+                   "dptemp" : ("Dew Point Temp (°C)", "Dew Point Temp Flag"), \
+                   "relhum" : ("Rel Hum (%)", "Rel Hum Flag"), \
+                   "precipamount" : ("Precip. Amount (mm)", "Precip. Amount Flag"), \
+                   "winddir" : ("Wind Dir (10s deg)", "Wind Dir Flag"), \
+                   "windspd" : ("Wind Spd (km/h)", "Wind Spd Flag"), \
+                   "visibility" : ("Visibility (km)", "Visibility Flag"), \
+                   "stnpress" : ("Stn Press (kPa)", "Stn Press Flag"), \
+                   "humidex" : ("Hmdx", "Hmdx Flag"), \
+                   "windchill" : ("Wind Chill", "Wind Chill Flag"), \
+                   "weather" : ("Weather", None) }
+
+def get_tag(element):
+   """
+   Tag of an element without its namespace.
+   """
+
+   return element.tag.rsplit("}", 1)[-1]
+
+def read_station_information(sPath):
+   """
+   Read the <stationinformation> header of a XML file, without reading the data.
+
+   OUTPUT
+   dStation: dictionnary with the tags of the header as keys (name, province, latitude,
+    longitude, elevation, climate_identifier, wmo_identifier, tc_identifier, ...).
+   """
+
+   dStation = {}
+   for (sEvent, element) in ElementTree.iterparse(sPath, events=("end",)):
+      sTag = get_tag(element)
+      if sTag == "stationinformation":
+         for child in element:
+            dStation[get_tag(child)] = (child.text or "").strip()
+         break
+      elif sTag == "stationdata":
+         break
+
+   return dStation
+
+def create_row(element, dStation):
+   """
+   Row with the columns of the CSV files for one <stationdata> element.
+
+   OUTPUT
+   [bHourly, dRow]
+   """
+
+   sYear = element.get("year", "")
+   sMonth = element.get("month", "").zfill(2)
+   sDay = element.get("day", "").zfill(2)
+   bHourly = element.get("hour") is not None
+
+   dRow = { "Longitude (x)" : dStation.get("longitude", ""), \
+            "Latitude (y)" : dStation.get("latitude", ""), \
+            "Station Name" : dStation.get("name", ""), \
+            "Climate ID" : dStation.get("climate_identifier", ""), \
+            "Year" : sYear, "Month" : sMonth, "Day" : sDay }
+   if bHourly:
+      sTime = element.get("hour").zfill(2) + ":" + element.get("minute", "0").zfill(2)
+      dRow["Date/Time (LST)"] = sYear + "-" + sMonth + "-" + sDay + " " + sTime
+      dRow["Time (LST)"] = sTime
+      dElement = dHourlyElement
+   else:
+      dRow["Date/Time"] = sYear + "-" + sMonth + "-" + sDay
+      dRow["Data Quality"] = element.get("quality", "")
+      dElement = dDailyElement
+
+   for child in element:
+      tColumn = dElement.get(get_tag(child))
+      if tColumn is None:
+         continue
+      dRow[tColumn[0]] = (child.text or "").strip()
+      if tColumn[1] is not None:
+         dRow[tColumn[1]] = child.get("flag", "")
+
+   return [bHourly, dRow]
+
+def iter_rows(sPath):
+   """
+   Read a daily or hourly XML file, one <stationdata> at a time.
+
+   OUTPUT
+   Generator of [bHourly, dRow], dRow having the columns of DAILY_COLUMNS or
+    HOURLY_COLUMNS. The elements missing in the XML are not in dRow.
+   """
+
+   dStation = {}
+   elementRoot = None
+   for (sEvent, element) in ElementTree.iterparse(sPath, events=("start", "end")):
+      if elementRoot is None:
+         elementRoot = element
+      if sEvent == "start":
+         continue
+      sTag = get_tag(element)
+      if sTag == "stationinformation":
+         for child in element:
+            dStation[get_tag(child)] = (child.text or "").strip()
+         elementRoot.clear()
+      elif sTag == "stationdata":
+         yield create_row(element, dStation)
+         # Constant memory: the rows already returned are dropped from the tree
+         elementRoot.clear()
+
+def iter_table(sPath):
+   """
+   Read a CSV file, or a XML file as if it was converted by convert_file.
+
+   OUTPUT
+   Generator of lists, the header first, then one list per row. Nothing for an
+    empty file.
+   """
+
+   if not sPath.endswith(".xml"):
+      with open(sPath, 'r', encoding='utf-8-sig') as fileData:
+         yield from csv.reader(fileData)
+      return
+
+   lColumn = None
+   for [bHourly, dRow] in iter_rows(sPath):
+      if lColumn is None:
+         lColumn = DAILY_COLUMNS
+         if bHourly:
+            lColumn = HOURLY_COLUMNS
+         yield lColumn
+      yield [dRow.get(sColumn, "") for sColumn in lColumn]
+
+def convert_file(sPath, sOutputPath):
+   """
+   Write a XML file as a CSV file with the columns of the English CSV files.
+
+   OUTPUT
+   nRow: number of rows written.
+   """
+
+   nRow = 0
+   writer = None
+   with open(sOutputPath, 'w', newline='', encoding='utf-8-sig') as fileOutput:
+      for [bHourly, dRow] in iter_rows(sPath):
+         if writer is None:
+            lColumn = DAILY_COLUMNS
+            if bHourly:
+               lColumn = HOURLY_COLUMNS
+            writer = csv.DictWriter(fileOutput, fieldnames=lColumn, restval="", \
+                                    quoting=csv.QUOTE_ALL)
+            writer.writeheader()
+         writer.writerow(dRow)
+         nRow = nRow + 1
+
+   return nRow
+
+def benchmark(lPath):
+   """
+   Compare the throughput of reading the XML files with iter_rows and reading the
+   same rows from CSV files with csv.DictReader.
+
+   OUTPUT
+   dResult: rows, megabytes and seconds of each parser.
+   """
+
+   dResult = { "xml" : { "rows" : 0, "MB" : 0.0, "seconds" : 0.0 }, \
+               "csv" : { "rows" : 0, "MB" : 0.0, "seconds" : 0.0 } }
+   with tempfile.TemporaryDirectory() as sTemporaryDirectory:
+      for sPath in lPath:
+         sCsvPath = os.path.join(sTemporaryDirectory, os.path.basename(sPath) + ".csv")
+         convert_file(sPath, sCsvPath)
+
+         timeStart = time.time()
+         for [bHourly, dRow] in iter_rows(sPath):
+            dResult["xml"]["rows"] += 1
+         dResult["xml"]["seconds"] += time.time() - timeStart
+         dResult["xml"]["MB"] += os.path.getsize(sPath) / 1e6
+
+         timeStart = time.time()
+         with open(sCsvPath, 'r', encoding='utf-8-sig') as fileCsv:
+            for dRow in csv.DictReader(fileCsv):
+               dResult["csv"]["rows"] += 1
+         dResult["csv"]["seconds"] += time.time() - timeStart
+         dResult["csv"]["MB"] += os.path.getsize(sCsvPath) / 1e6
+
+   return dResult
+
+def format_benchmark(dResult):
+   """
+   Text report of benchmark.
+   """
+
+   lLine = []
+   for sParser in ["xml", "csv"]:
+      dParser = dResult[sParser]
+      fSeconds = max(dParser["seconds"], 1e-9)
+      lLine.append("%s: %d rows, %.1f MB in %.2f s, %.0f rows/s, %.1f MB/s" % \
+                   (sParser.upper(), dParser["rows"], dParser["MB"], dParser["seconds"], \
+                    dParser["rows"] / fSeconds, dParser["MB"] / fSeconds))
+
+   return "\n".join(lLine)
+
+############################################################
+# eccc_xml in Command line
+#
+
+def get_command_line():
+   """
+   Parse the command line and perform all the checks.
+   """
+
+   parser = argparse.ArgumentParser(prog='eccc_xml.py', \
+                                    description="Convert the daily and hourly XML files of ECCC to CSV files with the columns of the English CSV files.")
+   parser.add_argument("XmlPath", metavar="XML", nargs="+", \
+                       help="XML file(s) downloaded with '--format xml'.", action="store", type=str)
+   parser.add_argument("--output-directory", "-o", dest="OutputDirectory", default=None, \
+                       help="Directory where the CSV files are written, with the name of the XML file and '.csv'. Default is the directory of each XML file: the other tools then read the CSV file instead of the XML file.",\
+                       action="store", type=str)
+   parser.add_argument("--metadata", dest="MetadataPath", metavar=("PATH"), default=None, \
+                       help="Append the <stationinformation> of every file to PATH (JSON lines).",\
+                       action="store", type=str)
+   parser.add_argument("--benchmark", dest="Benchmark", \
+                       help="Do not convert, compare the throughput of the XML and CSV parsers on these files.",\
+                       action="store_true", default=False)
+
+   options = parser.parse_args()
+
+   for sPath in options.XmlPath:
+      if not os.path.exists(sPath):
+         print ("Error: file '%s' does not exist. Exiting." % (sPath))
+         exit(2)
+   if options.OutputDirectory is not None and not os.path.isdir(options.OutputDirectory):
+      print ("Error: '%s' is not a directory. Exiting." % (options.OutputDirectory))
+      exit(3)
+
+   return options
+
+def main(tOptions):
+   if tOptions.Benchmark:
+      print (format_benchmark(benchmark(tOptions.XmlPath)))
+      return
+
+   nRow = 0
+   for sPath in tOptions.XmlPath:
+      sDirectory = tOptions.OutputDirectory
+      if sDirectory is None:
+         sDirectory = os.path.dirname(sPath)
+      sOutputPath = os.path.join(sDirectory, os.path.splitext(os.path.basename(sPath))[0] + ".csv")
+      nRow = nRow + convert_file(sPath, sOutputPath)
+      if tOptions.MetadataPath is not None:
+         dStation = read_station_information(sPath)
+         dStation["path"] = sPath
+         with open(tOptions.MetadataPath, 'a') as fileMetadata:
+            fileMetadata.write(json.dumps(dStation, ensure_ascii=False) + "\n")
+
+   print ("Files: " + str(len(tOptions.XmlPath)) + ", rows: " + str(nRow))
+
+
+if __name__ == "__main__":
+
+   tOptions = get_command_line()
+   main(tOptions)
@@ -30,22 +30,31 @@ Date: July 25th 2017
 
 import sys
 import os
-import shutil
-import glob
 import datetime
-import urllib
 import io
 import csv
-import urllib.request
-import cgi
 import argparse
-from multiprocessing import Pool
-
-
-# From dateutil package: https://pypi.python.org/pypi/python-dateutil
-from dateutil import rrule
-# From progress https://pypi.python.org/pypi/progress
-from progress.bar import Bar
+import time
+import zlib
+import functools
+import hashlib
+
+# Imported in the functions using them, so --info and --dry-run start fast:
+#  urllib.request (check_eccc_climate_connexion), dateutil.rrule (get_hourly_url),
+#  email.message (get_filename), shutil, multiprocessing and progress.bar (download_files)
+
+# Manifest of planned/downloaded files
+import eccc_manifest
+# Download ordering
+import eccc_schedule
+# Station list shared with the other tools
+import eccc_inventory
+# Station search for --info
+import eccc_search
+# HTTP cache shared with the R scripts
+import eccc_cache
+# Local directory or object storage where the files are written
+import eccc_storage
 
 VERSION = "0.8"
 # Verbose level:
@@ -55,6 +64,8 @@ NORMAL= 1
 VERBOSE= 2
 
 nGlobalVerbosity = 2
+# Messages are written on the standard error when the standard output is a table or JSON (--info-format)
+bMessageToStderr = False
 
 # Dictionnary used for variables specific to the language of the request
 dLang = {}
@@ -76,11 +87,7 @@ ECCC_WEBSITE_URL_FR = ECCC_WEBSITE_URL +\
            "climate_data/bulk_data_f.html?format={format}&stationID={station}&timeframe={timeframe}&Year={year}&Month={month}&submit=++T%C3%A9l%C3%A9charger+%0D%0Ades+donn%C3%A9es"
 
 # CSV file station list
-COLUMN_TITLE_EN=["Name","Province","Climate ID","Station ID","WMO ID","TC ID",\
-                 "Latitude (Decimal Degrees)","Longitude (Decimal Degrees)",\
-                 "Latitude","Longitude","Elevation (m)","First Year","Last Year",\
-                 "HLY First Year","HLY Last Year","DLY First Year","DLY Last Year",\
-                 "MLY First Year","MLY Last Year"]
+COLUMN_TITLE_EN = eccc_inventory.COLUMN_TITLE_EN
 
 # Dictionnaries to contain the station ID of the list
 dStationList = {}
@@ -102,43 +109,28 @@ dProvTerrList = { "AB" : [], \
 # Province and territory string and code management
 lProvTerrCode = ["AB","BC","MB","NB","NL","NS","NT","NU", \
                  "ON","PE","QC","SK","YT" ]
-dProvFR = { "ALBERTA" : "AB", \
-            "COLOMBIE-BRITANNIQUE" : "BC" , \
-            "MANITOBA" : "MB", \
-            "NOUVEAU-BRUNSWICK" : "NB", \
-            "TERRE-NEUVE" : "NL", \
-            "NOUVELLE-ECOSSE" : "NS", \
-            "TERRITOIRES DU NORD-OUEST" : "NT", \
-            "NUNAVUT" : "NU", \
-            "ONTARIO" : "ON", \
-            "ILE DU PRINCE-EDOUARD" : "PE", \
-            "QUEBEC" : "QC", \
-            "SASKATCHEWAN" : "SK", \
-            "YUKON" : "YT"  }
-dProvEN = { "ALBERTA" : "AB" , \
-            "BRITISH COLUMBIA" : "BC", \
-            "MANITOBA" : "MB", \
-            "NEW BRUNSWICK" : "NB", \
-            "NEWFOUNDLAND" : "NL", \
-            "NOVA SCOTIA" : "NS", \
-            "NORTHWEST TERRITORIES" : "NT", \
-            "NUNAVUT" : "NU", \
-            "ONTARIO" : "ON", \
-            "PRINCE EDWARD ISLAND" : "PE", \
-            "QUEBEC" : "QC", \
-            "SASKATCHEWAN" : "SK", \
-            "YUKON TERRITORY" : "YT"  }
+dProvFR = eccc_inventory.dProvFR
+dProvEN = eccc_inventory.dProvEN
 dProvCode = None # Will be set to EN or FR
+
+# Storage of the output directory, set from --output-directory and --s3-endpoint
+dOutputStorage = eccc_storage.get_storage(None)
                   
 def my_print(sMessage, nMessageVerbosity=NORMAL):
    """
-   Use this method to write the message in the standart output 
+   Use this method to write the message in the standart output, or in the standard
+   error when bMessageToStderr is set.
    """
 
+   if bMessageToStderr:
+      fileMessage = sys.stderr
+   else:
+      fileMessage = sys.stdout
+
    if nMessageVerbosity == NORMAL:
-      print (sMessage)
+      print (sMessage, file=fileMessage)
    elif nMessageVerbosity == VERBOSE and nGlobalVerbosity == VERBOSE:
-      print (sMessage)
+      print (sMessage, file=fileMessage)
 
 def set_language(sLang):
    """
@@ -258,6 +250,7 @@ def check_eccc_climate_connexion():
 
    my_print("Checking if ECCC Climate web site is available...", nMessageVerbosity=VERBOSE)
 
+   import urllib.request
    try:
       urllib.request.urlopen(ECCC_WEBSITE_URL)
    except urllib.error.URLError :
@@ -270,9 +263,10 @@ def check_eccc_climate_connexion():
    my_print("ECCC Climate web site reached! Continuing. ", nMessageVerbosity=VERBOSE)
 
    
-def load_station_list(sPath):
+def load_station_list(sPath, sCacheDirectory=None):
    """
    Download the latest file from the ECCC climate web site.
+   If sCacheDirectory is given, the file is taken from the HTTP cache when it is recent enough.
    """
    global dStationList, dStationAirport, dProvTerrList
 
@@ -290,13 +284,15 @@ def load_station_list(sPath):
          file_list = open(sPath, 'r')
          station_list = csv.DictReader(file_list, fieldnames=COLUMN_TITLE_EN)
    else:
+      import urllib.error
       try:
          my_print("Loading online station list at: " + \
                   dLang['station_list_URL'], nMessageVerbosity=VERBOSE)
          my_print("This may take a while...", nMessageVerbosity=VERBOSE)         
-         # Recipe from http://bit.ly/2hc9XMB
-         webpage = urllib.request.urlopen(dLang['station_list_URL'])
-         station_list = csv.DictReader(io.TextIOWrapper(webpage), \
+         [dHeader, content, bHit] = eccc_cache.fetch(dLang['station_list_URL'], sCacheDirectory)
+         if bHit:
+            my_print("Station list found in the cache", nMessageVerbosity=VERBOSE)
+         station_list = csv.DictReader(io.TextIOWrapper(io.BytesIO(content)), \
                                        fieldnames=COLUMN_TITLE_EN,
                                        delimiter = ',')
 
@@ -373,7 +369,7 @@ def fetch_requested_stations(lInput):
             my_print("Airport code added in list: " +sElement, nMessageVerbosity=VERBOSE)
             my_print("Corresponding station(s): " + \
                     str(dStationAirport[sElement]) , nMessageVerbosity=VERBOSE)
-            lStationRequested = lStationRequested + dStationAirport[sElement]
+            lStationRequested.extend(dStationAirport[sElement])
          else:
             my_print("Warning: requested airport code not in station list: '" + sElement +\
                      "'\nIgnoring", nMessageVerbosity=NORMAL)
@@ -390,7 +386,7 @@ def fetch_requested_stations(lInput):
          if sElement in lProvTerrCode: # Province or territory
             my_print("Station in province or territory added: " +sElement, \
                      nMessageVerbosity=VERBOSE)
-            lStationRequested = lStationRequested + dProvTerrList[sElement]
+            lStationRequested.extend(dProvTerrList[sElement])
          else:
             my_print("Warning: requested province or territory not in list: '" + sElement +\
                      "'\nOptions are:", nMessageVerbosity=NORMAL)
@@ -401,6 +397,124 @@ def fetch_requested_stations(lInput):
          
    return lStationRequested
 
+def parse_shard(sShard):
+   """
+   Parse a shard given as 'i/N', where i is between 1 and N.
+
+   OUTPUT
+   [nShard, nShardCount] or None if the string is not valid.
+   """
+
+   lShard = sShard.split("/")
+   if len(lShard) != 2 or not lShard[0].isdigit() or not lShard[1].isdigit():
+      return None
+   [nShard, nShardCount] = [int(lShard[0]), int(lShard[1])]
+   if nShardCount < 1 or nShard < 1 or nShard > nShardCount:
+      return None
+
+   return [nShard, nShardCount]
+
+def parse_size(sSize):
+   """
+   Parse a size in bytes, with an optional K, M or G suffix (powers of 1000): '500M', '2.5G'.
+
+   OUTPUT
+   nBytes or None if the string is not valid.
+   """
+
+   dMultiplier = { "K" : 1e3, "M" : 1e6, "G" : 1e9 }
+   sSize = sSize.strip().upper()
+   fMultiplier = 1
+   if len(sSize) > 0 and sSize[-1] in dMultiplier:
+      fMultiplier = dMultiplier[sSize[-1]]
+      sSize = sSize[0:-1]
+   try:
+      fSize = float(sSize)
+   except ValueError:
+      return None
+   if fSize < 0:
+      return None
+
+   return int(fSize * fMultiplier)
+
+def select_shard(lStationRequested, nShard, nShardCount, sShardBy):
+   """
+   Keep only the stations belonging to shard nShard out of nShardCount.
+
+   INPUT
+   lStationRequested: list of station ID returned by fetch_requested_stations.
+   nShard: shard number, between 1 and nShardCount.
+   nShardCount: total number of shards.
+   sShardBy: "station" to split by a hash of the station ID, "province" to keep all
+    the stations of a province/territory in the same shard.
+
+   OUTPUT
+   lStationShard: list of the station ID in this shard. Every shard computes the same 
+    split independently, so they can run in separate processes or on other hosts.
+   """
+
+   if sShardBy == "province":
+      # Count the requested stations per province/territory
+      dProvCount = {}
+      for sStation in lStationRequested:
+         sProvTerr = dProvCode[dStationList[sStation]["Province"]]
+         dProvCount[sProvTerr] = dProvCount.get(sProvTerr, 0) + 1
+      # Greedy balancing: the largest province goes to the least loaded shard
+      lShardLoad = [0] * nShardCount
+      dProvShard = {}
+      for sProvTerr in sorted(dProvCount, key=lambda s: (-dProvCount[s], s)):
+         nIndex = lShardLoad.index(min(lShardLoad))
+         dProvShard[sProvTerr] = nIndex
+         lShardLoad[nIndex] += dProvCount[sProvTerr]
+      lStationShard = [sStation for sStation in lStationRequested \
+                       if dProvShard[dProvCode[dStationList[sStation]["Province"]]] == nShard - 1]
+   else:
+      # crc32 is stable between processes and hosts, unlike hash()
+      lStationShard = [sStation for sStation in lStationRequested \
+                       if zlib.crc32(sStation.encode()) % nShardCount == nShard - 1]
+
+   my_print("Shard " + str(nShard) + "/" + str(nShardCount) + ": " + str(len(lStationShard)) + \
+            " station(s) out of " + str(len(lStationRequested)), nMessageVerbosity=VERBOSE)
+
+   return lStationShard
+
+def get_active_stations(lStationRequested, sActivePath):
+   """
+   Find the stations whose recent data should be downloaded first.
+
+   INPUT
+   lStationRequested: list of station ID requested.
+   sActivePath: path to a file with one station ID per line (the first column of a CSV 
+    is used, lines that are not a station ID like a header are ignored). For example the 
+    stations of climate.precip_daily_active used by create_active_weights_dbase.R. 
+    If None, a station is active if it reported daily or hourly values last year or this year.
+
+   OUTPUT
+   setActive: set of the active station ID.
+   """
+
+   setActive = set()
+
+   if sActivePath is not None:
+      if not os.path.exists(sActivePath):
+         my_print("ERROR: Active station file does not exist: " + sActivePath,\
+                  nMessageVerbosity=NORMAL)
+         my_print("Exiting")
+         exit(12)
+      setActive = eccc_inventory.read_station_ids(sActivePath)
+      my_print(str(len(setActive)) + " active stations loaded from: " + sActivePath, \
+               nMessageVerbosity=VERBOSE)
+      return setActive
+
+   sLastYear = str(datetime.datetime.now().year - 1)
+   for sStation in lStationRequested:
+      dStation = dStationList[sStation]
+      for sKey in ["DLY Last Year", "HLY Last Year"]:
+         if len(dStation[sKey]) == 4 and dStation[sKey] >= sLastYear:
+            setActive.add(sStation)
+
+   return setActive
+
 def check_specific_date(sStation, timeDate, timeFirstYear, timeLastYear, sPeriod=None):
    """
    When a specific date is given, check if it falls between the intervals. 
@@ -658,7 +772,7 @@ def create_url(dStationDates, sDirectory, bNoTree, sLang, sFormat, bNoClobber):
       sDirectory = os.path.dirname(os.path.realpath(__file__))
 
    # Check if the directory can be written by the user
-   if not os.access(sDirectory, os.W_OK):
+   if not eccc_storage.is_writable(dOutputStorage, sDirectory):
       my_print("ERROR: you do not have permission to write on the output directory:\n\t" +sDirectory +\
                "\nPlease change the permission or change the output directory", nMessageVerbosity=NORMAL)
       return
@@ -675,7 +789,7 @@ def create_url(dStationDates, sDirectory, bNoTree, sLang, sFormat, bNoClobber):
             sDirectoryStationMonth = sDirectoryStation + "/monthly"
 
          sPathWildCard = sDirectoryStationMonth + "/" + sLang + "*-monthly-??????-??????." + sFormat
-         if bNoClobber and glob.glob(sPathWildCard) :
+         if bNoClobber and eccc_storage.glob_paths(dOutputStorage, sPathWildCard) :
             my_print("File already exists:\n\t" + sPathWildCard + "\n\tSkipping",\
                      nMessageVerbosity=NORMAL)
          else:
@@ -715,7 +829,7 @@ def create_url(dStationDates, sDirectory, bNoTree, sLang, sFormat, bNoClobber):
             sDirectoryStationClimate = sDirectoryStation + "/climate"
 
          sPathWildCard = sDirectoryStationClimate + "/" + sLang + "*-almanac-????-????." + sFormat
-         if bNoClobber and glob.glob(sPathWildCard) :
+         if bNoClobber and eccc_storage.glob_paths(dOutputStorage, sPathWildCard) :
             my_print("File already exists:\n\t" + sPathWildCard + "\n\tSkipping",\
                      nMessageVerbosity=NORMAL)
          else:
@@ -771,7 +885,7 @@ def get_daily_url(sStation, sLang, sFormat, lStartEndTime, sDirectory, bNoClobbe
       sYear = str(nYear)
       sPathWildCard = sDirectory + "/" + sLang + "*-daily-0101" + sYear +\
                       "-1231" + sYear + "." + sFormat
-      if bNoClobber and glob.glob(sPathWildCard) :
+      if bNoClobber and eccc_storage.glob_paths(dOutputStorage, sPathWildCard) :
          my_print("File already exists:\n\t" + sPathWildCard + "\n\tSkipping",\
                   nMessageVerbosity=NORMAL)
       else: # value of 'month' can be set to anything
@@ -798,6 +912,9 @@ def get_hourly_url(sStation, sLang, sFormat, lStartEndTime, sDirectory, bNoClobb
    elif sLang == "fr":
       sStartURL = ECCC_WEBSITE_URL_FR
 
+   # From dateutil package: https://pypi.python.org/pypi/python-dateutil
+   from dateutil import rrule
+
    lUrl = []
    [sStart, sEnd] = lStartEndTime
    timeStart = datetime.datetime.strptime(sStart, "%Y-%m")
@@ -809,7 +926,7 @@ def get_hourly_url(sStation, sLang, sFormat, lStartEndTime, sDirectory, bNoClobb
 
       sPathWildCard = sDirectory + "/" + sLang + "*-hourly-" + sMonth + "??" +sYear +\
                       "-" + sMonth + "??" +sYear + "." + sFormat
-      if bNoClobber and glob.glob(sPathWildCard) :
+      if bNoClobber and eccc_storage.glob_paths(dOutputStorage, sPathWildCard) :
          my_print("File already exists:\n\t" + sPathWildCard + "\n\tSkipping",\
                   nMessageVerbosity=NORMAL)
       else:
@@ -821,66 +938,178 @@ def get_hourly_url(sStation, sLang, sFormat, lStartEndTime, sDirectory, bNoClobb
 
 
 
-def download_files(lUrlAndPath, bDryRun):
+def get_filename(sContentDisposition):
+   """
+   Filename given in a Content-Disposition header ('attachment; filename="..."').
+   Replaces cgi.parse_header, the cgi module being deprecated.
+   """
+
+   import email.message
+
+   message = email.message.Message()
+   message["Content-Disposition"] = sContentDisposition
+   return message.get_param("filename", header="Content-Disposition")
+
+def download_file(lUrlAndPath, fDeadline=None, sCacheDirectory=None, dStorage=None):
+   """
+   Download one file. Used by download_files, in the main process or in a worker of the pool.
+
+   INPUT:
+   lUrlAndPath: list containing the URL to download and the local directory of the file.
+   fDeadline: if given and time.time() is past this value, the file is not downloaded.
+   sCacheDirectory: if given, the file is taken from the HTTP cache when it is recent enough.
+   dStorage: storage of the directory (see eccc_storage.py). Default is a local directory.
+
+   OUTPUT:
+   [sURL, sDirectory, sFilename, nBytes, fElapsed, sSha256, sChange]. sFilename is None if the 
+    file was skipped. sChange is "new", "changed" or "unchanged" compared to the file already saved.
+    fElapsed is None if the file was found in the cache, so the speed of the web site
+    learned from the manifest is not biased.
+
+   The whole file is kept in memory between the download and the write, also for an
+    object storage (see eccc_storage.py).
+   """
+
+   [sURL, sDirectory] = lUrlAndPath
+   if dStorage is None:
+      dStorage = eccc_storage.get_storage(sDirectory)
+   if fDeadline is not None and time.time() > fDeadline:
+      return [sURL, sDirectory, None, None, None, None, None]
+
+   timeStart = time.time()
+   [dHeader, content, bHit] = eccc_cache.fetch(sURL, sCacheDirectory)
+   # Extract the provided filename
+   sFilename = get_filename(dHeader.get('Content-Disposition', ''))
+   my_print("Downloading file:\n\t" + sFilename, nMessageVerbosity=VERBOSE)
+   my_print("and saving on local directory:\n\t" + sDirectory, \
+            nMessageVerbosity=VERBOSE)
+   sPath = sDirectory + "/" + sFilename
+   sSha256 = hashlib.sha256(content).hexdigest()
+
+   # Compare with the file already saved, on disk or in the listing of the object storage
+   sChange = eccc_storage.get_change(dStorage, sPath, content)
+   if sChange != "unchanged":
+      eccc_storage.write_file(dStorage, sPath, content, sSha256)
+
+   fElapsed = time.time() - timeStart
+   if bHit:
+      fElapsed = None
+
+   return [sURL, sDirectory, sFilename, len(content), fElapsed, sSha256, sChange]
+
+def download_files(lUrlAndPath, bDryRun, sManifestPath=None, sShard=None, nWorkers=1, \
+                   fTimeLimit=None, sLabel='Downloading', sChangeFeedPath=None, \
+                   sCacheDirectory=None, dStorage=None):
    """
    INPUT:
    lUrlAndPath: a list of list containing two values: the URL to download 
     and the path where the file should be copied on the local computer.
    bDryRun: if set to True, do not download or create directory.
+   sManifestPath: if given, a record for every file is appended to this manifest.
+   sShard: shard identifier ('i/N') saved in the manifest records.
+   nWorkers: number of files downloaded at the same time. Each worker takes the 
+    next file in lUrlAndPath as soon as it is done with the previous one.
+   fTimeLimit: if given, files not started after this number of seconds are skipped 
+    and recorded as 'skipped' in the manifest.
+   sLabel: label of the progress bar.
+   sChangeFeedPath: if given, append to this JSON-lines file the station, timeframe, period, 
+    bytes, sha256 and status (new, changed or unchanged) of every downloaded file.
+   sCacheDirectory: if given, files are taken from this HTTP cache when they are recent enough.
+   dStorage: storage of the directories (see eccc_storage.py). Default is local directories.
    """
 
+   import shutil
+   from multiprocessing import Pool
+   # From progress https://pypi.python.org/pypi/progress
+   from progress.bar import Bar
+
    # Create directories
+   if dStorage is None:
+      dStorage = eccc_storage.get_storage(None)
    lDirectories = [item[1] for item in lUrlAndPath]
-   create_directories(lDirectories, bDryRun)
+   create_directories(lDirectories, bDryRun, dStorage)
    
    # Set the progress bar
    columns = shutil.get_terminal_size()[0]
    nWidth = int(columns) - 32
-   bar = Bar('Downloading', max=len(lUrlAndPath), width=int(nWidth))
-
-   for lList in lUrlAndPath:
-      [sURL, sDirectory] = lList
-      if not bDryRun:
-         # Download the file
-         httpResponse = urllib.request.urlopen(sURL)
-         # Extract the provided filename
-         _,params = cgi.parse_header(httpResponse.headers.get('Content-Disposition', ''))
-         sFilename = params['filename']
-         bar.next()
-         my_print("Downloading file:\n\t" + sFilename, nMessageVerbosity=VERBOSE)
-         my_print("and saving on local directory:\n\t" + sDirectory, \
-                  nMessageVerbosity=VERBOSE)
-         sPath = sDirectory + "/" + sFilename
-         fichier = open(sPath,  "wb")
-         fichier.write(httpResponse.read())
-         fichier.close()
-      else:
+   bar = Bar(sLabel, max=len(lUrlAndPath), width=int(nWidth))
+
+   if bDryRun:
+      for lList in lUrlAndPath:
+         [sURL, sDirectory] = lList
          my_print("--dry-run mode: file not downloaded:\n\t" + sURL, \
                   nMessageVerbosity=NORMAL)
-            
+         eccc_manifest.write_records(sManifestPath, \
+                                     [eccc_manifest.create_record(sURL, sDirectory, sStatus="planned", \
+                                                                  sShard=sShard)])
+      bar.finish()
+      return
+
+   fDeadline = None
+   if fTimeLimit is not None:
+      fDeadline = time.time() + fTimeLimit
+   funcDownload = functools.partial(download_file, fDeadline=fDeadline, \
+                                    sCacheDirectory=sCacheDirectory, dStorage=dStorage)
+   # Objects already in the storage, listed once and shared with the workers
+   eccc_storage.prefetch_listings(dStorage, lDirectories)
+
+   if nWorkers > 1:
+      pool = Pool(nWorkers)
+      # chunksize=1: a worker only takes one file at a time from the shared queue
+      iterDownloaded = pool.imap_unordered(funcDownload, lUrlAndPath, chunksize=1)
+   else:
+      pool = None
+      iterDownloaded = map(funcDownload, lUrlAndPath)
+
+   nSkipped = 0
+   for [sURL, sDirectory, sFilename, nBytes, fElapsed, sSha256, sChange] in iterDownloaded:
+      bar.next()
+      if sFilename is None: # Time limit reached
+         nSkipped = nSkipped + 1
+         eccc_manifest.write_records(sManifestPath, \
+                                     [eccc_manifest.create_record(sURL, sDirectory, sStatus="skipped", \
+                                                                  sShard=sShard)])
+         continue
+      # Written as soon as the file is saved, so an interrupted shard keeps its manifest
+      dRecord = eccc_manifest.create_record(sURL, sDirectory, sFilename, nBytes, fElapsed, \
+                                            "downloaded", sShard, sSha256, sChange)
+      eccc_manifest.write_records(sManifestPath, [dRecord])
+      eccc_manifest.write_records(sChangeFeedPath, [eccc_manifest.create_change(dRecord)])
+   if pool is not None:
+      pool.close()
+      pool.join()
             
    bar.finish()
 
+   if nSkipped > 0:
+      my_print(sLabel + ": time limit of " + str(fTimeLimit) + " seconds reached, " + \
+               str(nSkipped) + " file(s) not downloaded.", nMessageVerbosity=NORMAL)
+
       
-def create_directories(lDirectories, bDryRun):
+def create_directories(lDirectories, bDryRun, dStorage=None):
       """
       Check if directories exists in the list lDirectories. If not, create it, unless we are in 
-      --dry-run mode.
+      --dry-run mode. Nothing is created in an object storage.
       """
 
-      lDirectoryCreated =[]
-      
+      if dStorage is None:
+         dStorage = eccc_storage.get_storage(None)
+
+      # lDirectories has one directory per file to download, each one is only checked once
+      setDirectoryChecked = set()
+
       for sDirectory in lDirectories:
-         # Check if the directory has not been created and does not exists
-         if sDirectory not in lDirectoryCreated and \
-            not os.path.isdir(sDirectory):
+         if sDirectory in setDirectoryChecked:
+            continue
+         setDirectoryChecked.add(sDirectory)
+         # Check if the directory does not exists
+         if not eccc_storage.is_directory(dStorage, sDirectory):
             my_print("Directory does not exists \n\t" + sDirectory, nMessageVerbosity=NORMAL)
             if bDryRun:
                my_print("\t--dry-run mode: directory is not created", nMessageVerbosity=NORMAL)
             else:
                my_print("\tCreating directory", nMessageVerbosity=NORMAL)
-               os.makedirs(sDirectory)
-            lDirectoryCreated.append(sDirectory)
+               eccc_storage.make_directory(dStorage, sDirectory)
       
 def get_canadian_weather_observations(tOptions):
    """
@@ -888,19 +1117,60 @@ def get_canadian_weather_observations(tOptions):
    on your local computer.
    """
 
-   # Set language
-   set_language(tOptions.Language)
+   # Merge the manifests of the different shards and exit
+   if tOptions.MergeManifests is not None:
+      lRecord = eccc_manifest.merge_manifests(tOptions.MergeManifests, tOptions.ManifestPath)
+      my_print(eccc_manifest.format_summary(eccc_manifest.summarize_records(lRecord)), \
+               nMessageVerbosity=NORMAL)
+      return
+
+   # Local directory or object storage where the files are written
+   global dOutputStorage
+   dOutputStorage = eccc_storage.get_storage(tOptions.OutputDirectory, tOptions.S3Endpoint)
+
+   # Set language. With several languages, the station list of the first one is used for all:
+   # only the names differ, the stations are joined by their Station ID in the URL.
+   set_language(tOptions.LanguageList[0])
 
-   # Load the station list
-   load_station_list(tOptions.LocalStationPath)
+   # Load the station list, from the cache when --cache is given and the copy is recent enough
+   load_station_list(tOptions.LocalStationPath, tOptions.CacheDirectory)
 
    # Fetch the requested stations
-   lStationList = fetch_requested_stations(tOptions.Input)
+   if tOptions.Search is not None:
+      dIndex = eccc_search.build_index(dStationList.values())
+      lStationList = eccc_search.search(dIndex, tOptions.Search, tOptions.Prefix, tOptions.Fuzzy)
+      # Stations given in input restrict the search
+      if len(tOptions.Input) > 0:
+         setStationInput = set(fetch_requested_stations(tOptions.Input))
+         lStationList = [sStation for sStation in lStationList if sStation in setStationInput]
+   else:
+      lStationList = fetch_requested_stations(tOptions.Input)
+   if tOptions.ActiveYear is not None:
+      lStationList = [sStation for sStation in lStationList \
+                      if eccc_search.is_active_in(dStationList[sStation], tOptions.ActiveYear)]
    if len(lStationList) == 0: # If nothing fits.
       my_print ("No station found corresponding to input: ", \
                 nMessageVerbosity=NORMAL)
       my_print (tOptions.Input, nMessageVerbosity=NORMAL)
       return
+
+   # Keep only the stations of this shard
+   sShard = None
+   if tOptions.Shard is not None:
+      [nShard, nShardCount] = parse_shard(tOptions.Shard)
+      lStationList = select_shard(lStationList, nShard, nShardCount, tOptions.ShardBy)
+      sShard = tOptions.Shard
+      if len(lStationList) == 0:
+         my_print ("No station in shard " + sShard + ". Nothing to do.", \
+                   nMessageVerbosity=NORMAL)
+         return
+
+   if tOptions.Information and tOptions.InfoFormat == "json":
+      eccc_search.write_output(eccc_search.format_json([dStationList[s] for s in lStationList]))
+      return
+   elif tOptions.Information and tOptions.InfoFormat == "table":
+      eccc_search.write_output(eccc_search.format_table([dStationList[s] for s in lStationList]))
+      return
    elif tOptions.Information: # print the lines of the station dictionnary and exits
       for sStation in lStationList:
          my_print("----", nMessageVerbosity=NORMAL)
@@ -914,8 +1184,9 @@ def get_canadian_weather_observations(tOptions):
    lRequestedDate = check_input_dates\
                     ([tOptions.RequestedDate, tOptions.StartDate, tOptions.EndDate])
 
-   # Check if we can contact ECCC web site
-   check_eccc_climate_connexion()
+   # Check if we can contact ECCC web site. Nothing is downloaded with --dry-run or --estimate.
+   if not tOptions.DryRun and not tOptions.Estimate:
+      check_eccc_climate_connexion()
 
    # Check if the requested dates are available for each station
    dObsPeriod = { "hourly"  : tOptions.Hourly,\
@@ -931,11 +1202,90 @@ def get_canadian_weather_observations(tOptions):
                 nMessageVerbosity=NORMAL)
       return
 
-   # Create the URL for all the files requested
-   lUrlPath = create_url(dStationStartEndDates, tOptions.OutputDirectory, \
-                         tOptions.NoTree, tOptions.Language, tOptions.Format, tOptions.NoClobber)
+   # Create the URL for all the files requested, in each language
+   llUrlPath = []
+   for sLang in tOptions.LanguageList:
+      lUrlPathLang = create_url(dStationStartEndDates, tOptions.OutputDirectory, \
+                                tOptions.NoTree, sLang, tOptions.Format, tOptions.NoClobber)
+      if lUrlPathLang is None: # Output directory cannot be written
+         return
+      llUrlPath.append(lUrlPathLang)
+   # The languages are interleaved so they progress together in the same pool and manifest
+   lUrlPath = eccc_schedule.interleave(llUrlPath)
+   
+   # A manifest is always written for a shard, so the shards can be merged afterward
+   sManifestPath = tOptions.ManifestPath
+   if sManifestPath is None and sShard is not None:
+      sOutputDirectory = tOptions.OutputDirectory
+      # The manifest is appended during the run, it stays local with an object storage
+      if sOutputDirectory == None or eccc_storage.is_remote(sOutputDirectory):
+         sOutputDirectory = os.path.dirname(os.path.realpath(__file__))
+      sManifestPath = sOutputDirectory + "/manifest-shard-" + sShard.replace("/", "-of-") + ".jsonl"
+   
+   # Recent months of the active stations are downloaded first, then the backfill
+   setActive = get_active_stations(dStationStartEndDates.keys(), tOptions.ActiveStationPath)
+   [lRecent, lBackfill] = eccc_schedule.split_priority(lUrlPath, setActive, datetime.datetime.now())
+   my_print("Files for recent months of active stations: " + str(len(lRecent)) + \
+            ", backfill: " + str(len(lBackfill)), nMessageVerbosity=VERBOSE)
+
+   # Expected size and time of the run, from the sizes and speed observed in previous runs
+   lRecord = eccc_manifest.read_manifest(sManifestPath)
+   dHistory = eccc_schedule.learn_history(lRecord)
+   nEstimateVerbosity = VERBOSE
+   if tOptions.Estimate or tOptions.DryRun:
+      nEstimateVerbosity = NORMAL
+   my_print(eccc_schedule.format_estimate(eccc_schedule.estimate_plan(lRecent + lBackfill, dHistory, \
+                                                                      tOptions.Workers), \
+                                          dHistory, tOptions.Workers), \
+            nMessageVerbosity=nEstimateVerbosity)
+
+   # Keep the work of highest priority fitting in the budget
+   if tOptions.MaxBytes is not None or tOptions.MaxTime is not None:
+      [lRecent, lBackfill, lTrimmed] = eccc_schedule.trim_to_budget(lRecent, lBackfill, dHistory, \
+                                                                    tOptions.Workers, \
+                                                                    tOptions.MaxBytes, \
+                                                                    tOptions.MaxTime)
+      if len(lTrimmed) > 0:
+         dTrimmed = eccc_schedule.estimate_plan(lTrimmed, dHistory, tOptions.Workers)
+         my_print("Budget: " + str(len(lTrimmed)) + " file(s) of lowest priority trimmed (" + \
+                  "%.1f MB). After trimming:" % (dTrimmed["bytes"] / 1e6), nMessageVerbosity=NORMAL)
+         my_print(eccc_schedule.format_estimate(eccc_schedule.estimate_plan(lRecent + lBackfill, \
+                                                                            dHistory, \
+                                                                            tOptions.Workers), \
+                                                dHistory, tOptions.Workers), \
+                  nMessageVerbosity=NORMAL)
+         # Only a run downloading the files records what it left out
+         if not tOptions.Estimate and not tOptions.DryRun:
+            eccc_manifest.write_records(sManifestPath, \
+                                        [eccc_manifest.create_record(sURL, sDirectory, sStatus="skipped", \
+                                                                     sShard=sShard) \
+                                         for [sURL, sDirectory] in lTrimmed])
+   if tOptions.Estimate:
+      return
+
+   # Without time limit, start with the most expensive files, using the sizes and speed observed
+   # in previous runs. A time-boxed backfill starts with the most recent periods instead.
+   lRecent = eccc_schedule.order_by_cost(lRecent, lRecord)
+   if tOptions.BackfillTimeLimit is None:
+      lBackfill = eccc_schedule.order_by_cost(lBackfill, lRecord)
+   else:
+      lBackfill = eccc_schedule.order_by_priority(lBackfill)
    
-   download_files(lUrlPath, tOptions.DryRun)
+   if len(lRecent) > 0:
+      download_files(lRecent, tOptions.DryRun, sManifestPath, sShard, tOptions.Workers, \
+                     sLabel='Recent', sChangeFeedPath=tOptions.ChangeFeedPath, \
+                     sCacheDirectory=tOptions.CacheDirectory, dStorage=dOutputStorage)
+   if len(lBackfill) > 0:
+      download_files(lBackfill, tOptions.DryRun, sManifestPath, sShard, tOptions.Workers, \
+                     tOptions.BackfillTimeLimit, sLabel='Backfill', \
+                     sChangeFeedPath=tOptions.ChangeFeedPath, \
+                     sCacheDirectory=tOptions.CacheDirectory, dStorage=dOutputStorage)
+
+   # Keep the cache under its size budget
+   if tOptions.CacheDirectory is not None:
+      [nRemoved, nBytes] = eccc_cache.evict(tOptions.CacheDirectory, tOptions.CacheSize * 1e6)
+      my_print("Cache: " + str(nRemoved) + " entries removed, " + str(nBytes) + " bytes kept", \
+               nMessageVerbosity=VERBOSE)
 
 ############################################################
 # get_canadian_weather_observations in Command line
@@ -955,8 +1305,11 @@ def get_command_line():
                      help="Station(s) for which the observations should be downloaded",\
                        action="store", type=str, default=None)
    parser.add_argument("--output-directory", "-o", dest="OutputDirectory", \
-                     help="Directory where the files will be downloaded, in their corresponding sub-directory or not (see --no-tree option). Default value is where the script get_canadian_weather_observations.py is located.",\
+                     help="Directory where the files will be downloaded, in their corresponding sub-directory or not (see --no-tree option). Can be 's3://bucket/prefix' to write in an S3-compatible object storage (requires boto3, see --s3-endpoint). Default value is where the script get_canadian_weather_observations.py is located.",\
                      action="store", type=str, default=None)
+   parser.add_argument("--s3-endpoint", dest="S3Endpoint", metavar=("URL"), \
+                       help="URL of the S3-compatible object storage when --output-directory is 's3://bucket/prefix', for example 'http://localhost:9000' for a local MinIO. The credentials are taken from the AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables or the AWS configuration files. Default is AWS, or the AWS_ENDPOINT_URL environment variable.",\
+                       action="store", type=str, default=None)
    parser.add_argument("--no-tree", "-n", dest="NoTree", \
                        help="Do not create directories, download all the files in the output directory.",\
                        action="store_true", default=False)
@@ -968,11 +1321,10 @@ def get_command_line():
                      help="Use this local version located at PATH for the station list instead of the online version on the EC Climate web site.",\
                      action="store", type=str, default=None)   
    parser.add_argument("--dry-run", "-t", dest="DryRun", \
-                     help="Execute the program, print the URL but do not download any file",\
+                     help="Execute the program, print the URL but do not download any file. The ECCC web site is only contacted for the station list, which is taken from the cache with --cache when it was downloaded less than a day ago.",\
                        action="store_true", default=False)
-   parser.add_argument("--lang", "-l", dest="Language", metavar=("[en|fr]"), 
-                       choices=["fr","en"], \
-                       help="Language in which the data will be downloaded (en = English, fr = French). Default is English.",\
+   parser.add_argument("--lang", "-l", dest="Language", metavar=("[en|fr|en,fr]"), 
+                       help="Language in which the data will be downloaded (en = English, fr = French). Both are downloaded in the same run with 'en,fr'. Default is English.",\
                        action="store", type=str, default="en")   
    parser.add_argument("--format", "-F", dest="Format", metavar=("[xml|csv]"), \
                        help="Download the files in 'csv' or 'xml' format. Default value is 'csv'.",\
@@ -1003,8 +1355,71 @@ def get_command_line():
    
    
    parser.add_argument("--info", "-I", dest="Information", \
-                     help="Get and print the information (lat, lon, code, start/end date, etc.) for the selected station(s) and exit.",\
+                     help="Get and print the information (lat, lon, code, start/end date, etc.) for the selected station(s) and exit. With --cache, the station list is taken from the cache when it was downloaded less than a day ago.",\
                      action="store_true", default=False)
+   parser.add_argument("--info-format", dest="InfoFormat", metavar=("[text|table|json]"), \
+                       choices=["text","table","json"], \
+                       help="Print the --info as 'text' (every field of every station), as a 'table' (one line per station) or as 'json' (a list of objects with every field). With 'table' and 'json', the other messages are written on the standard error. Default is 'text'.",\
+                       action="store", type=str, default="text")
+   # Station search
+   parser.add_argument("--search", "-s", dest="Search", metavar=("TEXT"), \
+                       help="Select the stations whose name contains every word of TEXT, or whose Station ID, Climate ID, WMO ID or TC ID is TEXT. Accents, case and punctuation are ignored. If stations are given in input, only those are searched.",\
+                       action="store", type=str, default=None)
+   parser.add_argument("--prefix", dest="Prefix", \
+                       help="With --search, the words of TEXT can be the beginning of a word of the name ('abbots' finds 'ABBOTSFORD').",\
+                       action="store_true", default=False)
+   parser.add_argument("--fuzzy", dest="Fuzzy", \
+                       help="With --search, the words of TEXT can be misspelled ('abotsford' finds 'ABBOTSFORD').",\
+                       action="store_true", default=False)
+   parser.add_argument("--active-in", dest="ActiveYear", metavar=("YYYY"), \
+                       help="Keep only the stations having observations during year YYYY (between 'First Year' and 'Last Year' of the station list).",\
+                       action="store", type=int, default=None)
+
+   parser.add_argument("--workers", "-w", dest="Workers", metavar=("N"), \
+                       help="Number of files downloaded at the same time. Default is 1.",\
+                       action="store", type=int, default=1)
+   # Priority
+   parser.add_argument("--active-stations", dest="ActiveStationPath", metavar=("PATH"), \
+                       help="File with one station ID per line (or a CSV with the station ID in the first column) whose current and previous month are downloaded before everything else. Default is the stations reporting daily or hourly values since last year.",\
+                       action="store", type=str, default=None)
+   parser.add_argument("--backfill-time-limit", dest="BackfillTimeLimit", metavar=("SECONDS"), \
+                       help="Stop downloading the backfill (everything except the current and previous month of the active stations) after SECONDS. The backfill then starts with the most recent periods instead of the largest files. Skipped files are recorded in the manifest.",\
+                       action="store", type=float, default=None)
+   # Sharding and manifest
+   parser.add_argument("--shard", dest="Shard", metavar=("i/N"), \
+                       help="Only process the i-th of N shards of the requested stations (1 <= i <= N). Each shard can run in its own process or on another host. A manifest is written for each shard, see --manifest.",\
+                       action="store", type=str, default=None)
+   parser.add_argument("--shard-by", dest="ShardBy", metavar=("[station|province]"), \
+                       choices=["station","province"], \
+                       help="Split the shards by a hash of the station ID or by province/territory. Default is 'station'.",\
+                       action="store", type=str, default="station")
+   parser.add_argument("--manifest", dest="ManifestPath", metavar=("PATH"), \
+                       help="Append a record for every planned or downloaded file to the manifest at PATH (JSON lines). With --shard, default is 'manifest-shard-i-of-N.jsonl' in the output directory. With --merge-manifests, PATH is where the merged manifest is written.",\
+                       action="store", type=str, default=None)
+   parser.add_argument("--change-feed", dest="ChangeFeedPath", metavar=("PATH"), \
+                       help="Append to PATH (JSON lines) the station, timeframe, period, bytes, sha256 and status (new, changed or unchanged) of every downloaded file, so loaders can process only the changes.",\
+                       action="store", type=str, default=None)
+   parser.add_argument("--merge-manifests", dest="MergeManifests", metavar=("MANIFEST"), nargs="+", \
+                       help="Merge the manifests written by each shard, print a report and exit.",\
+                       action="store", type=str, default=None)
+
+   # Pre-flight estimate and budget
+   parser.add_argument("--estimate", dest="Estimate", \
+                       help="Print the number of files, the size and the time expected for the download, from the sizes and speed observed in the manifest (see --manifest), and exit. The estimate is also printed with --dry-run.",\
+                       action="store_true", default=False)
+   parser.add_argument("--max-bytes", dest="MaxBytes", metavar=("SIZE"), \
+                       help="Download at most SIZE bytes (K, M or G suffix accepted, for example 5G), according to the estimate. The files of lowest priority are not downloaded: backfill before recent months of active stations, then oldest periods first. They are recorded as 'skipped' in the manifest.",\
+                       action="store", type=str, default=None)
+   parser.add_argument("--max-time", dest="MaxTime", metavar=("SECONDS"), \
+                       help="Download only what is expected to take at most SECONDS, trimming the files of lowest priority like --max-bytes.",\
+                       action="store", type=float, default=None)
+   # HTTP cache
+   parser.add_argument("--cache", dest="CacheDirectory", metavar=("DIRECTORY"), \
+                       help="Keep the station list and the downloaded files in this HTTP cache, and take them from it while they are recent enough: 1 hour for hourly files, 6 hours for daily files, 7 days for monthly files, 30 days for almanac files and 1 day for the station list. Hourly files of a past month and daily files of a past year are kept 1 year. The cache can be shared with the R scripts (see eccc_cache.py).",\
+                       action="store", type=str, default=None)
+   parser.add_argument("--cache-size", dest="CacheSize", metavar=("MB"), \
+                       help="Size budget of the cache in megabytes. The least recently used files are removed at the end of the run. Default is %d." % eccc_cache.DEFAULT_SIZE_MB,\
+                       action="store", type=float, default=eccc_cache.DEFAULT_SIZE_MB)
 
    parser.add_argument("--verbose", "-v", dest="Verbosity", \
                      help="Explain what is being done", action="store_true", default=False)
@@ -1024,17 +1439,51 @@ def get_command_line():
       print ("Written by Miguel Tremblay, http://ptaff.ca/miguel/")
       exit(0)
    
-   # Verify it the output is a directory
-   if options.OutputDirectory is not None and not os.path.isdir(options.OutputDirectory):
+   # Verify it the output is a directory, or an object storage that can be used
+   if eccc_storage.is_remote(options.OutputDirectory):
+      options.OutputDirectory = eccc_storage.normalize_directory(options.OutputDirectory)
+      if not eccc_storage.is_available():
+         print ("Error: boto3 is required to write in '%s'. Install it with 'pip install boto3'. Exiting." % (options.OutputDirectory))
+         exit (15)
+   elif options.OutputDirectory is not None and not os.path.isdir(options.OutputDirectory):
       print ("Error: Directory '%s' provided in '--output-directory' does not exist or is not a directory. Please provide a valid output directory. Exiting." % (options.OutputDirectory))
       exit (3)
 
+   # Verify the number of workers
+   if options.Workers < 1:
+      print ("Error: '--workers' must be at least 1. Exiting.")
+      exit (11)
+
+   # Verify the languages
+   options.LanguageList = options.Language.split(",")
+   if len(options.LanguageList) != len(set(options.LanguageList)) or \
+      len([sLang for sLang in options.LanguageList if sLang not in ["en","fr"]]) > 0:
+      print ("Error: '--lang %s' is not valid. Use 'en', 'fr' or 'en,fr'. Exiting." % (options.Language))
+      exit (14)
+
+   # Verify the budget
+   if options.MaxBytes is not None:
+      sMaxBytes = options.MaxBytes
+      options.MaxBytes = parse_size(sMaxBytes)
+      if options.MaxBytes is None:
+         print ("Error: '--max-bytes %s' is not valid. Use a number of bytes with an optional K, M or G suffix, for example '--max-bytes 5G'. Exiting." % (sMaxBytes))
+         exit (13)
+   if options.MaxTime is not None and options.MaxTime <= 0:
+      print ("Error: '--max-time' must be positive. Exiting.")
+      exit (13)
+
+   # Verify the shard format
+   if options.Shard is not None and parse_shard(options.Shard) is None:
+      print ("Error: '--shard %s' is not valid. Use 'i/N' with 1 <= i <= N, for example '--shard 2/4'. Exiting." % (options.Shard))
+      exit (10)
+
    # Verify if at least one period of observation is requested.
    if options.Hourly is False and \
       options.Daily is False and \
       options.Monthly is False and \
       options.Climate is False and \
-      options.Information is False:
+      options.Information is False and \
+      options.MergeManifests is None:
       print ("Error: no observation period indicated.")
       print ("Please choose for one or more of these options:")
       print ("--hourly --daily --monthly --climate")
@@ -1047,6 +1496,9 @@ def get_command_line():
       nGlobalVerbosity = VERBOSE
    else:
       nGlobalVerbosity = NORMAL
+   # Keep the table or JSON of --info alone on the standard output, so it can be parsed
+   global bMessageToStderr
+   bMessageToStderr = options.Information and options.InfoFormat in ["table", "json"]
       
    my_print("Verbosity level is set to: " + str(nGlobalVerbosity), nMessageVerbosity=VERBOSE)
    my_print("Arguments in command line are:\n " + str(sys.argv), nMessageVerbosity=VERBOSE)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_benchmark.py
+Description: Tests of eccc_benchmark.py: synthetic station lists and the
+ planning benchmark, with the station dictionnaries of the script emptied after.
+"""
+
+import datetime
+
+import pytest
+
+import eccc_inventory
+import eccc_benchmark
+import get_canadian_weather_observations
+
+@pytest.fixture
+def station_path(tmp_path):
+   sPath = str(tmp_path / "stations.csv")
+   eccc_benchmark.write_station_list(sPath, 200)
+   yield sPath
+   eccc_benchmark.reset_station_list(get_canadian_weather_observations)
+
+def test_station_list(station_path):
+   lRow = eccc_inventory.read_station_rows(station_path)
+   assert [dRow["Station ID"] for dRow in lRow] == [str(nStation) for nStation in range(1, 201)]
+
+def test_fetch_requested_stations(station_path):
+   get_canadian_weather_observations.set_language("en")
+   get_canadian_weather_observations.load_station_list(station_path)
+   # Stations in the order requested, the provinces extending the same list
+   assert get_canadian_weather_observations.fetch_requested_stations(["12", "3", "150"]) == \
+          ["12", "3", "150"]
+   lStation = get_canadian_weather_observations.fetch_requested_stations( \
+                 get_canadian_weather_observations.lProvTerrCode)
+   assert sorted(lStation, key=int) == [str(nStation) for nStation in range(1, 201)]
+
+def test_benchmark_planning(station_path):
+   sLastYear = str(datetime.datetime.now().year - 1)
+   dResult = eccc_benchmark.benchmark_planning(station_path, sLastYear + "-01", sLastYear + "-12", 1)
+   assert sorted(dResult.keys()) == sorted(eccc_benchmark.lPlanningPhase + ["files"])
+   # One daily file per station, and 12 hourly files for the stations with hourly data
+   assert dResult["files"] >= 200
+   assert (dResult["files"] - 200) % 12 == 0
+   assert len(get_canadian_weather_observations.dStationList) == 0
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_cache.py
+Description: Tests of eccc_cache.py: cache keys, time to live of the entries,
+ expiry and LRU eviction, and a fetch answered by the cache.
+"""
+
+import os
+import json
+import time
+
+import eccc_cache
+
+DAILY_URL = "https://climate.weather.gc.ca/climate_data/bulk_data_e.html?format=csv&stationID=51&timeframe=2&Year=%d&Month=01"
+
+def test_normalize_url():
+   sURL = "HTTPS://Climate.Weather.GC.CA/x/bulk_data_e.html?timeframe=3&stationID=51&Year=2020&Month=5&format=csv"
+   sOtherURL = "https://climate.weather.gc.ca/x/bulk_data_e.html?format=csv&stationID=51&timeframe=3&Year=1999&Month=1"
+   assert eccc_cache.normalize_url(sURL) == eccc_cache.normalize_url(sOtherURL)
+   assert eccc_cache.normalize_url(sURL) == \
+          "https://climate.weather.gc.ca/x/bulk_data_e.html?format=csv&stationID=51&timeframe=3"
+   # Year and Month are part of the daily requests
+   assert eccc_cache.normalize_url(DAILY_URL % 2019) != eccc_cache.normalize_url(DAILY_URL % 2020)
+
+def test_ttl_of_closed_period():
+   fStored = time.mktime((2021, 6, 15, 12, 0, 0, 0, 0, -1))
+   assert eccc_cache.get_ttl(DAILY_URL % 2020, fStored) == eccc_cache.CLOSED_PERIOD_TTL
+   assert eccc_cache.get_ttl(DAILY_URL % 2021, fStored) == eccc_cache.dTimeFrameTTL["daily"]
+   assert eccc_cache.get_ttl("https://x/Station%20Inventory%20EN.csv", fStored) == \
+          eccc_cache.dTimeFrameTTL["other"]
+
+def set_stored(sCacheDirectory, sURL, fStored):
+   sMetadataPath = eccc_cache.get_entry_path(sCacheDirectory, sURL) + ".json"
+   with open(sMetadataPath, "r") as fileMetadata:
+      dMetadata = json.load(fileMetadata)
+   dMetadata["stored"] = fStored
+   with open(sMetadataPath, "w") as fileMetadata:
+      json.dump(dMetadata, fileMetadata)
+
+def test_store_and_lookup(tmp_path):
+   sCacheDirectory = str(tmp_path / "cache")
+   sURL = DAILY_URL % time.localtime().tm_year
+   assert eccc_cache.lookup(sCacheDirectory, sURL) is None
+
+   dHeader = { "Content-Disposition" : 'attachment; filename="a.csv"' }
+   eccc_cache.store(sCacheDirectory, sURL, dHeader, b"a,b\n1,2\n")
+   assert eccc_cache.lookup(sCacheDirectory, sURL) == [dHeader, b"a,b\n1,2\n"]
+
+   # Expired entry
+   set_stored(sCacheDirectory, sURL, time.time() - eccc_cache.dTimeFrameTTL["daily"] - 10)
+   assert eccc_cache.lookup(sCacheDirectory, sURL) is None
+
+def test_evict_least_recently_used(tmp_path):
+   sCacheDirectory = str(tmp_path)
+   nYear = time.localtime().tm_year
+   lURL = [DAILY_URL.replace("stationID=51", "stationID=" + str(nStation)) % nYear \
+           for nStation in range(3)]
+   for (i, sURL) in enumerate(lURL):
+      eccc_cache.store(sCacheDirectory, sURL, {}, b"x" * 100)
+      fUsed = time.time() - 1000 + i * 100
+      os.utime(eccc_cache.get_entry_path(sCacheDirectory, sURL) + ".json", (fUsed, fUsed))
+   # The first entry is used again: the second one is now the least recently used
+   assert eccc_cache.lookup(sCacheDirectory, lURL[0]) is not None
+
+   assert eccc_cache.evict(sCacheDirectory, 250) == [1, 200]
+   assert eccc_cache.lookup(sCacheDirectory, lURL[1]) is None
+   assert eccc_cache.lookup(sCacheDirectory, lURL[0]) is not None
+   assert eccc_cache.lookup(sCacheDirectory, lURL[2]) is not None
+
+def test_evict_expired(tmp_path):
+   sCacheDirectory = str(tmp_path)
+   sURL = DAILY_URL % time.localtime().tm_year
+   eccc_cache.store(sCacheDirectory, sURL, {}, b"x")
+   set_stored(sCacheDirectory, sURL, time.time() - eccc_cache.dTimeFrameTTL["daily"] - 10)
+   assert eccc_cache.evict(sCacheDirectory, 1e9) == [1, 0]
+   assert os.listdir(sCacheDirectory) == []
+
+def test_fetch_from_cache(tmp_path, monkeypatch):
+   sCacheDirectory = str(tmp_path)
+   sURL = DAILY_URL % 2000
+   eccc_cache.store(sCacheDirectory, sURL, {}, b"cached")
+
+   def urlopen(sURL):
+      raise AssertionError("The URL should not be downloaded")
+   import urllib.request
+   monkeypatch.setattr(urllib.request, "urlopen", urlopen)
+
+   assert eccc_cache.fetch(sURL, sCacheDirectory) == [{}, b"cached", True]
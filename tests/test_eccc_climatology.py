@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_climatology.py
+Description: Tests of eccc_climatology.py: means by day of year, invalid rows
+ and reuse of the stations whose files did not change.
+"""
+
+import os
+
+import eccc_climatology
+
+def write_daily(sPath, lRow):
+   """
+   Daily file with the English columns used by the builder, lRow: [(date, precip)]
+   """
+
+   with open(sPath, 'w', encoding='utf-8-sig') as fileDaily:
+      fileDaily.write('"Date/Time","Station Name","Total Precip (mm)"\n')
+      for (sDate, sPrecip) in lRow:
+         fileDaily.write('"%s","STATION","%s"\n' % (sDate, sPrecip))
+
+def get_day(lRow, sIndex):
+   return [row for row in lRow if row["index"] == sIndex][0]
+
+def test_mean_by_day_of_year(tmp_path):
+   write_daily(str(tmp_path / "2019.csv"), [("2019-01-01", "1.0"), ("2019-01-02", "")])
+   write_daily(str(tmp_path / "2020.csv"), [("2020-01-01", "3.0"), ("2020-02-29", "2.0")])
+   lRow = eccc_climatology.build_station("1", [str(tmp_path / "2019.csv"), str(tmp_path / "2020.csv")])
+
+   # As in R, only the month-days found in the files, in calendar order
+   assert [row["index"] for row in lRow] == ["1-1", "1-2", "2-29"]
+   assert float(get_day(lRow, "1-1")["mean_total_precip"]) == 2.0
+   assert get_day(lRow, "1-1")["n_total_precip"] == 2
+   assert get_day(lRow, "1-2")["mean_total_precip"] == "NA"
+   assert get_day(lRow, "1-2")["n_total_precip"] == 0
+   assert float(get_day(lRow, "2-29")["mean_total_precip"]) == 2.0
+   assert lRow[0]["station_name"] == "STATION"
+
+def test_unchanged_stations_are_not_read_again(tmp_path):
+   for sStation in ["1", "2"]:
+      os.makedirs(str(tmp_path / sStation))
+      write_daily(str(tmp_path / sStation / "2020.csv"), [("2020-01-01", sStation)])
+   lFile = [(sStation, str(tmp_path / sStation / "2020.csv")) for sStation in ["1", "2"]]
+
+   [lRow, dFingerprint, lRebuilt] = eccc_climatology.build_climatology(lFile, {}, {})
+   assert lRebuilt == ["1", "2"]
+
+   dPreviousRow = {}
+   for row in lRow:
+      dPreviousRow.setdefault(row["ec_station_id"], []).append(row)
+   write_daily(str(tmp_path / "2" / "2020.csv"), [("2020-01-01", "7.0"), ("2020-01-02", "1.0")])
+   [lRowAgain, dFingerprintAgain, lRebuilt] = \
+      eccc_climatology.build_climatology(lFile, dPreviousRow, dFingerprint)
+
+   assert lRebuilt == ["2"]
+   assert dFingerprintAgain["1"] == dFingerprint["1"]
+   assert float(get_day([row for row in lRowAgain if row["ec_station_id"] == "2"], "1-1") \
+                ["mean_total_precip"]) == 7.0
+   assert [row for row in lRowAgain if row["ec_station_id"] == "1"] == dPreviousRow["1"]
+
+def test_invalid_dates_are_skipped(tmp_path):
+   write_daily(str(tmp_path / "bad.csv"), [("", "5.0"), ("2020-13-40", "5.0"), ("bad", "5.0"), \
+                                           ("2020-01-01", "x"), ("2020-01-01", "1.5")])
+   lSum = [0.0] * len(eccc_climatology.lDayIndex)
+   lCount = [0] * len(eccc_climatology.lDayIndex)
+   lRowCount = [0] * len(eccc_climatology.lDayIndex)
+   eccc_climatology.accumulate_file(str(tmp_path / "bad.csv"), lSum, lCount, lRowCount)
+   assert sum(lCount) == 1
+   assert sum(lSum) == 1.5
+   assert sum(lRowCount) == 2
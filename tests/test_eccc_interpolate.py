@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_interpolate.py
+Description: Tests of eccc_interpolate.py: weighted mean over the neighbours
+ having a value, compared with a loop over the days like calc_intp_val in R.
+"""
+
+import datetime
+
+import numpy
+
+import eccc_interpolate
+
+def interpolate_loop(dWeight, dValue, sTarget, timeDate):
+   """
+   Weighted mean of one target and one day, one neighbour at a time.
+   """
+
+   fSum = 0.0
+   fWeightSum = 0.0
+   for (sSource, fWeight) in dWeight.get(sTarget, []):
+      fValue = dValue.get((sSource, timeDate), numpy.nan)
+      if sSource != sTarget and not numpy.isnan(fValue):
+         fSum += fWeight * fValue
+         fWeightSum += fWeight
+   if fWeightSum == 0:
+      return numpy.nan
+   return fSum / fWeightSum
+
+def test_interpolate_ignores_missing_neighbours():
+   matWeight = eccc_interpolate.build_weight_matrix({ "T" : [("A", 2.0), ("B", 1.0)] }, \
+                                                    ["T"], ["A", "B", "T"])
+   arrValue = numpy.array([[1.0, numpy.nan, numpy.nan], \
+                           [4.0, 4.0, numpy.nan], \
+                           [numpy.nan, numpy.nan, numpy.nan]])
+   arrInterpolated = eccc_interpolate.interpolate(matWeight, arrValue)
+   assert abs(arrInterpolated[0, 0] - 2.0) < 1e-12
+   assert abs(arrInterpolated[0, 1] - 4.0) < 1e-12
+   # No neighbour with a value: NaN, not 0
+   assert numpy.isnan(arrInterpolated[0, 2])
+
+def test_station_never_fills_itself():
+   matWeight = eccc_interpolate.build_weight_matrix({ "T" : [("T", 5.0), ("A", 1.0)] }, \
+                                                    ["T"], ["A", "T"])
+   assert matWeight.nnz == 1
+
+def test_fill_gaps_matches_loop():
+   rand = numpy.random.RandomState(0)
+   lStation = ["A", "B", "C", "D", "T1", "T2"]
+   timeStart = datetime.date(2020, 1, 1)
+   timeEnd = datetime.date(2020, 1, 20)
+   dValue = {}
+   for sStation in lStation:
+      for i in range(20):
+         if rand.rand() < 0.7: # Days without a row are missing too
+            fValue = rand.gamma(0.5, 4.0)
+            if rand.rand() < 0.2:
+               fValue = numpy.nan
+            dValue[(sStation, timeStart + datetime.timedelta(days=i))] = fValue
+   dWeight = { "T1" : [("A", 0.9), ("B", 0.5), ("C", 0.1)], \
+               "T2" : [("B", 0.7), ("D", 0.3), ("T1", 0.2)] }
+
+   lRow = eccc_interpolate.fill_gaps(dValue, dWeight, ["T1", "T2"], timeStart, timeEnd)
+   assert len(lRow) == 40
+   for row in lRow:
+      timeDate = datetime.date.fromisoformat(row["datetime"])
+      fOriginal = dValue.get((row["ec_station_id"], timeDate), numpy.nan)
+      if numpy.isnan(fOriginal):
+         assert row["precip_intp_flag"] == "interpolated"
+         assert row["og_total_precip"] == "NA"
+         fExpected = interpolate_loop(dWeight, dValue, row["ec_station_id"], timeDate)
+      else:
+         assert row["precip_intp_flag"] == "recorded"
+         fExpected = fOriginal
+      if numpy.isnan(fExpected):
+         assert row["total_precip"] == "NA"
+      else:
+         assert abs(float(row["total_precip"]) - fExpected) < 1e-9
+
+def test_weight_table_fills_the_active_stations(tmp_path):
+   # Pairwise table of eccc_weights.py / create_active_weights_dbase.R: one row per active station and neighbour
+   sPath = str(tmp_path / "weights.csv")
+   with open(sPath, "w") as fileWeight:
+      fileWeight.write("active_station,station_id,comp_weight\n" + \
+                       "1,2,0.5\n1,3,0.9\n1,4,-0.1\n1,5,NA\n6,1,0.7\n")
+   dWeight = eccc_interpolate.read_weight_table(sPath, nNeighbours=1)
+   assert dWeight == { "1" : [("3", 0.9)], "6" : [("1", 0.7)] }
+
+def test_days_without_row_are_filled():
+   dValue = { ("A", datetime.date(2020, 1, 1)) : 1.0, ("T", datetime.date(2020, 1, 1)) : 3.0, \
+              ("A", datetime.date(2020, 1, 2)) : 2.0 }
+   lRow = eccc_interpolate.fill_gaps(dValue, { "T" : [("A", 1.0)] }, ["T"], \
+                                     datetime.date(2020, 1, 1), datetime.date(2020, 1, 3))
+   assert [(row["datetime"], row["total_precip"], row["og_total_precip"], row["precip_intp_flag"]) \
+           for row in lRow] == [("2020-01-01", "3.0", "3.0", "recorded"), \
+                                ("2020-01-02", "2.0", "NA", "interpolated"), \
+                                ("2020-01-03", "NA", "NA", "interpolated")]
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_manifest.py
+Description: Tests of eccc_manifest.py: requests of the URLs, records, merge of
+ the shard manifests and their summary, and downloaded files of one language.
+"""
+
+import os
+
+import pytest
+
+import eccc_manifest
+
+URL = "https://climate.weather.gc.ca/climate_data/bulk_data_%s.html?format=csv&stationID=51&timeframe=2&Year=%d&Month=01"
+HOURLY_URL = "https://climate.weather.gc.ca/climate_data/bulk_data_e.html?format=csv&stationID=51&timeframe=1&Year=2020&Month=03"
+MONTHLY_URL = "https://climate.weather.gc.ca/climate_data/bulk_data_e.html?format=csv&stationID=51&timeframe=3&Year=2020&Month=1"
+
+def test_parse_url_request():
+   assert eccc_manifest.parse_url_request(HOURLY_URL + "&submit=Download+Data") == \
+          { "station" : "51", "timeframe" : "hourly", "year" : "2020", "month" : "03", \
+            "format" : "csv", "lang" : "en" }
+   dRequest = eccc_manifest.parse_url_request(URL % ("f", 2020))
+   assert [dRequest["timeframe"], dRequest["year"], dRequest["month"], dRequest["lang"]] == \
+          ["daily", "2020", None, "fr"]
+   # Year and month are dummy values for the files covering the whole period
+   dRequest = eccc_manifest.parse_url_request(MONTHLY_URL)
+   assert [dRequest["timeframe"], dRequest["year"], dRequest["month"]] == ["monthly", None, None]
+
+def create_shard_record(sURL, sShard, nBytes, sTime, sStatus="downloaded"):
+   dRecord = eccc_manifest.create_record(sURL, "/tmp", "a.csv", nBytes, 1.0, sStatus, sShard)
+   dRecord["time"] = sTime
+   return dRecord
+
+def test_merge_and_summary(tmp_path):
+   lFirst = [create_shard_record(URL % ("e", 2019), "1/2", 100, "2020-01-01T00:00:00"), \
+             create_shard_record(URL % ("e", 2020), "1/2", 200, "2020-01-01T00:00:00")]
+   # The file of 2020 downloaded again later by the other shard: only the latest record is kept
+   lSecond = [create_shard_record(HOURLY_URL, "2/2", 1000, "2020-01-01T00:00:01"), \
+              create_shard_record(MONTHLY_URL, "2/2", None, "2020-01-01T00:00:01", "planned"), \
+              create_shard_record(URL % ("e", 2020), "2/2", 300, "2020-01-02T00:00:00")]
+   eccc_manifest.write_records(str(tmp_path / "1.jsonl"), lFirst)
+   eccc_manifest.write_records(str(tmp_path / "2.jsonl"), lSecond)
+
+   sOutputPath = str(tmp_path / "merged.jsonl")
+   for i in range(2):
+      lRecord = eccc_manifest.merge_manifests([str(tmp_path / "2.jsonl"), str(tmp_path / "1.jsonl")], \
+                                              sOutputPath)
+      # The merged manifest is written again, not appended
+      assert eccc_manifest.read_manifest(sOutputPath) == lRecord
+   assert len(lRecord) == 4
+
+   dSummary = eccc_manifest.summarize_records(lRecord)
+   assert dSummary["total"] == { "files" : 4, "bytes" : 1400 }
+   assert dSummary["shard"] == { "1/2" : { "files" : 1, "bytes" : 100 }, \
+                                 "2/2" : { "files" : 3, "bytes" : 1300 } }
+   assert dSummary["timeframe"] == { "daily" : { "files" : 2, "bytes" : 400 }, \
+                                     "hourly" : { "files" : 1, "bytes" : 1000 }, \
+                                     "monthly" : { "files" : 1, "bytes" : 0 } }
+   assert dSummary["status"] == { "downloaded" : 3, "planned" : 1 }
+
+   lLine = eccc_manifest.format_summary(dSummary).split("\n")
+   assert lLine[0] == "Files: 4  Bytes: 1400"
+   assert "\t2/2: 3 files, 1300 bytes" in lLine
+   assert "\tplanned: 1" in lLine
+
+def test_change_feed_entry():
+   dRecord = eccc_manifest.create_record(HOURLY_URL, "/out/51/hourly", "a.csv", 10, 1.0, \
+                                         sSha256="ab", sChange="new")
+   dChange = eccc_manifest.create_change(dRecord)
+   assert [dChange["station"], dChange["timeframe"], dChange["period"], dChange["path"]] == \
+          ["51", "hourly", "2020-03", "/out/51/hourly/a.csv"]
+   assert [dChange["change"], dChange["bytes"], dChange["sha256"]] == ["new", 10, "ab"]
+   assert eccc_manifest.create_change(eccc_manifest.create_record(URL % ("e", 2020), "/out"))["period"] == "2020"
+   dChange = eccc_manifest.create_change(eccc_manifest.create_record(MONTHLY_URL, "/out", sStatus="planned"))
+   assert [dChange["period"], dChange["path"]] == ["all", None]
+
+def test_latest_records():
+   sURL = URL % ("e", 2020)
+   lRecord = [eccc_manifest.create_record(sURL, "/tmp", "a.csv", sStatus="planned"), \
+              eccc_manifest.create_record(sURL, "/tmp", "a.csv"), \
+              eccc_manifest.create_record(sURL, "/tmp", sStatus="planned"), \
+              eccc_manifest.create_record(sURL, "/tmp", sStatus="skipped"), \
+              eccc_manifest.create_record(URL % ("e", 2019), "/tmp", sStatus="planned")]
+   # A file downloaded once stays downloaded, whatever the later dry runs or skips
+   assert [(dRecord["year"], dRecord["status"]) for dRecord in eccc_manifest.latest_records(lRecord)] == \
+          [("2020", "downloaded"), ("2019", "planned")]
+   # A new download replaces the previous one
+   lRecord.append(eccc_manifest.create_record(sURL, "/tmp", "b.csv"))
+   assert eccc_manifest.latest_records(lRecord)[0]["filename"] == "b.csv"
+
+def test_merge_keeps_the_downloaded_file(tmp_path):
+   sURL = URL % ("e", 2020)
+   dFirst = eccc_manifest.create_record(sURL, "/tmp", "a.csv", sShard="1/2")
+   dFirst["time"] = "2020-01-01T00:00:00"
+   dSecond = eccc_manifest.create_record(sURL, "/tmp", sStatus="skipped", sShard="2/2")
+   dSecond["time"] = "2020-01-02T00:00:00"
+   eccc_manifest.write_records(str(tmp_path / "2.jsonl"), [dSecond])
+   eccc_manifest.write_records(str(tmp_path / "1.jsonl"), [dFirst])
+
+   sOutputPath = str(tmp_path / "merged.jsonl")
+   lRecord = eccc_manifest.merge_manifests([str(tmp_path / "2.jsonl"), str(tmp_path / "1.jsonl")], \
+                                           sOutputPath)
+   assert lRecord == [dFirst]
+   assert eccc_manifest.read_manifest(sOutputPath) == [dFirst]
+
+def create_tree(sDirectory):
+   sTimeFrameDirectory = os.path.join(sDirectory, "51", "daily")
+   os.makedirs(sTimeFrameDirectory)
+   lRecord = []
+   for (sLang, sPrefix) in [("e", "en"), ("f", "fr")]:
+      for nYear in [2019, 2020]:
+         sFilename = sPrefix + "_climate_daily_BC_1100030_" + str(nYear) + "_P1D.csv"
+         with open(os.path.join(sTimeFrameDirectory, sFilename), "w") as fileCsv:
+            fileCsv.write("a\n")
+         lRecord.append(eccc_manifest.create_record(URL % (sLang, nYear), sTimeFrameDirectory, sFilename))
+   eccc_manifest.write_records(os.path.join(sDirectory, "manifest.jsonl"), lRecord)
+
+def list_filenames(sDirectory, sManifestPath, sLang):
+   return [os.path.basename(sPath) for (sStation, sPath) in \
+           eccc_manifest.list_downloaded_files(sDirectory, "daily", sManifestPath, sLang)]
+
+def test_file_language():
+   assert eccc_manifest.get_file_language("en_climate_daily_BC_1100030_2020_P1D.csv") == "en"
+   assert eccc_manifest.get_file_language("fr_climat_quotidiennes_BC_1100030_2020_P1D.csv") == "fr"
+   assert eccc_manifest.get_file_language("51.csv") is None
+   assert eccc_manifest.get_file_language("english.csv") is None
+
+def test_language_filter(tmp_path):
+   sDirectory = str(tmp_path)
+   create_tree(sDirectory)
+   for sManifestPath in [None, os.path.join(sDirectory, "manifest.jsonl")]:
+      assert list_filenames(sDirectory, sManifestPath, "en") == \
+             ["en_climate_daily_BC_1100030_2019_P1D.csv", "en_climate_daily_BC_1100030_2020_P1D.csv"]
+      assert list_filenames(sDirectory, sManifestPath, "fr") == \
+             ["fr_climate_daily_BC_1100030_2019_P1D.csv", "fr_climate_daily_BC_1100030_2020_P1D.csv"]
+      assert len(list_filenames(sDirectory, sManifestPath, None)) == 4
+      assert list_filenames(sDirectory, sManifestPath, "auto") == \
+             list_filenames(sDirectory, sManifestPath, "en")
+
+def test_language_of_the_files_by_default(tmp_path, capsys):
+   sDirectory = str(tmp_path)
+   create_tree(sDirectory)
+   for sFilename in os.listdir(os.path.join(sDirectory, "51", "daily")):
+      if sFilename.startswith("en_"):
+         os.remove(os.path.join(sDirectory, "51", "daily", sFilename))
+   with open(os.path.join(sDirectory, "51", "daily", "51.csv"), "w") as fileCsv:
+      fileCsv.write("a\n")
+
+   assert list_filenames(sDirectory, None, "auto") == \
+          ["51.csv", "fr_climate_daily_BC_1100030_2019_P1D.csv", "fr_climate_daily_BC_1100030_2020_P1D.csv"]
+   assert capsys.readouterr().err == ""
+   assert list_filenames(sDirectory, None, "en") == ["51.csv"]
+   assert "Warning: no daily file in 'en'" in capsys.readouterr().err
+
+def test_object_storage_manifest_is_rejected(tmp_path, capsys):
+   sManifestPath = str(tmp_path / "manifest.jsonl")
+   eccc_manifest.write_records(sManifestPath, [eccc_manifest.create_record(URL % ("e", 2020), \
+                                                  "s3://bucket/prefix/51/daily", \
+                                                  "en_climate_daily_BC_1100030_2020_P1D.csv")])
+   with pytest.raises(SystemExit):
+      eccc_manifest.list_downloaded_files(str(tmp_path), "daily", sManifestPath)
+   assert "object storage" in capsys.readouterr().out
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_reader.py
+Description: Tests of eccc_reader.py: filters on the files and on the rows,
+ columns kept, chunks and Arrow output.
+"""
+
+import os
+
+import pytest
+
+import eccc_reader
+
+def write_tree(sDirectory):
+   """
+   Daily files of stations 1 and 2 for 2019 and 2020, one row per day of January.
+   """
+
+   for sStation in ["1", "2"]:
+      sTimeFrameDirectory = os.path.join(sDirectory, sStation, "daily")
+      os.makedirs(sTimeFrameDirectory)
+      for sYear in ["2019", "2020"]:
+         sPath = os.path.join(sTimeFrameDirectory, "en_climate_daily_BC_%s_%s_P1D.csv" % (sStation, sYear))
+         with open(sPath, 'w', encoding='utf-8-sig') as fileDaily:
+            fileDaily.write('"Date/Time","Max Temp (°C)","Total Precip (mm)"\n')
+            for nDay in range(1, 32):
+               fileDaily.write('"%s-01-%02d","%d","%.1f"\n' % (sYear, nDay, nDay, nDay / 10.0))
+
+def test_file_period():
+   assert eccc_reader.get_file_period("a/en_climate_hourly_BC_1_03-2020_P1H.csv") == "2020-03"
+   assert eccc_reader.get_file_period("a/en_climate_daily_BC_1_2020_P1D.xml") == "2020"
+   assert eccc_reader.get_file_period("a/en_climate_monthly_BC_1_1990-2020_P1M.csv") is None
+   assert eccc_reader.overlaps("2020-03", "2020-02-15", "2020-03-01")
+   assert not eccc_reader.overlaps("2020-03", "2020-04", None)
+   assert not eccc_reader.overlaps("2019", None, "2018-12-31")
+   assert eccc_reader.overlaps(None, "2020", "2020")
+
+def test_files_outside_the_request_are_not_planned(tmp_path):
+   write_tree(str(tmp_path))
+   lFile = eccc_reader.plan_files(str(tmp_path), "daily", None, ["2"], "2020-01-10", None)
+   assert [(sStation, os.path.basename(sPath)) for (sStation, sPath) in lFile] == \
+          [("2", "en_climate_daily_BC_2_2020_P1D.csv")]
+
+@pytest.mark.parametrize("nWorkers", [1, 2])
+def test_read_columns_and_dates(tmp_path, nWorkers):
+   write_tree(str(tmp_path))
+   lFrame = list(eccc_reader.read_downloaded(str(tmp_path), "daily", lColumn=["Total Precip (mm)"], \
+                                             sStart="2019-01-30", sEnd="2020-01-02", nWorkers=nWorkers, \
+                                             nChunkRows=3))
+   assert [len(frame) for frame in lFrame] == [4, 4]
+   assert list(lFrame[0].columns) == ["ec_station_id", "Date/Time", "Total Precip (mm)"]
+   assert list(lFrame[0]["Date/Time"]) == ["2019-01-30", "2019-01-31", "2020-01-01", "2020-01-02"]
+   assert list(lFrame[1]["ec_station_id"]) == ["2"] * 4
+
+def test_arrow_output(tmp_path):
+   pytest.importorskip("pyarrow")
+   write_tree(str(tmp_path))
+   lBatch = list(eccc_reader.read_downloaded(str(tmp_path), "daily", lStation=["1"], nWorkers=1, \
+                                             sOutput="arrow"))
+   assert len(lBatch) == 1
+   assert lBatch[0].num_rows == 62
+   assert lBatch[0].schema.names == ["ec_station_id", "Date/Time", "Max Temp (°C)", "Total Precip (mm)"]
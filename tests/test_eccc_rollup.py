@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_rollup.py
+Description: Tests of eccc_rollup.py: the incremental update gives the same
+ rollups as a build from scratch, and the queries use them correctly.
+"""
+
+import os
+
+import eccc_rollup
+
+def write_daily(sPath, lRow):
+   """
+   Daily file with two variables, lRow: [(date, max temp, precip)]
+   """
+
+   with open(sPath, 'w', encoding='utf-8-sig') as fileDaily:
+      fileDaily.write('"Date/Time","Year","Max Temp (°C)","Max Temp Flag","Total Precip (mm)"\n')
+      for (sDate, sTemp, sPrecip) in lRow:
+         fileDaily.write('"%s","%s","%s","","%s"\n' % (sDate, sDate[0:4], sTemp, sPrecip))
+
+def dump_tables(conn):
+   """
+   Content of the rollup tables, sorted, without the path of the day rows.
+   """
+
+   dTable = {}
+   for sLevel in eccc_rollup.lLevel:
+      dTable[sLevel] = sorted((sSource, sStation, sProvince, sPeriod, sVariable, round(fSum, 9), \
+                               nCount, fMin, fMax) \
+                              for (sSource, sStation, sProvince, sPeriod, sVariable, sPath, fSum, \
+                                   nCount, fMin, fMax) \
+                              in conn.execute("select * from rollup_" + sLevel))
+   return dTable
+
+def make_files(sDirectory):
+   lFile = []
+   for (sStation, fOffset) in [("1", 0.0), ("2", 10.0)]:
+      os.makedirs(os.path.join(sDirectory, sStation))
+      for sYear in ["2019", "2020"]:
+         sPath = os.path.join(sDirectory, sStation, sYear + ".csv")
+         write_daily(sPath, [(sYear + "-01-%02d" % nDay, str(fOffset + nDay), str(nDay / 10.0)) \
+                             for nDay in range(1, 32)] + \
+                            [(sYear + "-02-01", "", "M")])
+         lFile.append((sStation, sPath, "daily"))
+   return lFile
+
+def test_query_from_rollups(tmp_path):
+   lFile = make_files(str(tmp_path))
+   conn = eccc_rollup.open_database(":memory:")
+   assert eccc_rollup.update_rollups(conn, lFile, { "1" : "BC", "2" : "BC" }) == [4, 0]
+
+   lRow = eccc_rollup.query(conn, "total_precip", "month", lStation=["1"], sStatistic="total")
+   assert [(sStation, sPeriod) for (sStation, sPeriod, fValue) in lRow] == [("1", "2019-01"), ("1", "2020-01")]
+   assert abs(lRow[0][2] - sum(range(1, 32)) / 10.0) < 1e-9
+
+   lRow = eccc_rollup.query(conn, "max_temp", "all", sProvince="BC", sStart="2019", sEnd="2020", \
+                            sStatistic="max")
+   assert lRow == [("*", "2019-01-01/2020-12-31", 41.0)]
+   # The flag columns and the missing values are not variables
+   assert eccc_rollup.query(conn, "max_temp_flag", "year") == []
+   lRow = eccc_rollup.query(conn, "max_temp", "year", lStation=["2"], sStatistic="n")
+   assert [fValue for (sStation, sPeriod, fValue) in lRow] == [31, 31]
+
+def test_incremental_update_matches_full_build(tmp_path):
+   lFile = make_files(str(tmp_path))
+   dProvince = { "1" : "BC", "2" : "AB" }
+   conn = eccc_rollup.open_database(":memory:")
+   eccc_rollup.update_rollups(conn, lFile, dProvince)
+
+   # One file changed, one removed
+   write_daily(lFile[1][1], [("2020-01-15", "-5.0", "20.0"), ("2020-03-01", "2.0", "1.0")])
+   os.utime(lFile[1][1], ns=(1, 1))
+   os.remove(lFile[2][1])
+   lCurrent = [lFile[0], lFile[1], lFile[3]]
+   assert eccc_rollup.update_rollups(conn, lCurrent, dProvince) == [1, 1]
+   assert eccc_rollup.update_rollups(conn, lCurrent, dProvince) == [0, 0]
+
+   connFull = eccc_rollup.open_database(":memory:")
+   eccc_rollup.update_rollups(connFull, lCurrent, dProvince)
+   assert dump_tables(conn) == dump_tables(connFull)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_schedule.py
+Description: Tests of eccc_schedule.py: history of the previous runs, order of
+ the downloads, pre-flight estimate and trimming to a size or time budget.
+"""
+
+import datetime
+
+import pytest
+
+import eccc_manifest
+import eccc_schedule
+
+URL = "https://climate.weather.gc.ca/climate_data/bulk_data_e.html?format=csv&stationID=%s&timeframe=%d&Year=%d&Month=%d"
+
+def daily(nYear, sStation="51"):
+   return [URL % (sStation, 2, nYear, 1), "/tmp/" + sStation + "_" + str(nYear) + ".csv"]
+
+def hourly(nYear, nMonth, sStation="51"):
+   return [URL % (sStation, 1, nYear, nMonth), "/tmp/" + sStation + "_" + str(nYear) + "_" + str(nMonth) + ".csv"]
+
+def whole(nTimeFrame, sStation="51"):
+   # Monthly (3) and climate (4) files, with dummy year and month
+   return [URL % (sStation, nTimeFrame, 2021, 1), "/tmp/" + sStation + "_" + str(nTimeFrame) + ".csv"]
+
+# Defaults without history: 1 s of latency and 500 kB/s, so a daily file costs 1.12 s and an hourly one 1.3 s
+dHistory = eccc_schedule.learn_history([])
+
+def test_learn_history():
+   assert dHistory == { "station" : {}, "timeframe" : {}, \
+                        "latency" : eccc_schedule.DEFAULT_LATENCY, \
+                        "throughput" : eccc_schedule.DEFAULT_THROUGHPUT }
+   # 1.5 s for 100 kB and 2.5 s for 300 kB: 1 s of latency and 200 kB/s
+   lRecord = [eccc_manifest.create_record(daily(2019)[0], "/tmp", "a.csv", 100000, 1.5), \
+              eccc_manifest.create_record(daily(2020)[0], "/tmp", "b.csv", 300000, 2.5), \
+              eccc_manifest.create_record(hourly(2020, 1, "52")[0], "/tmp", sStatus="planned")]
+   dLearned = eccc_schedule.learn_history(lRecord)
+   assert dLearned["station"] == { ("51", "daily") : 200000.0 }
+   assert dLearned["timeframe"] == { "daily" : 200000.0 }
+   assert dLearned["latency"] == pytest.approx(1.0)
+   assert dLearned["throughput"] == pytest.approx(200000.0)
+
+def test_order_by_cost():
+   lUrlPath = [daily(2019), hourly(2020, 1), daily(2020), hourly(2020, 2), daily(2018, "52")]
+   # Longest first, equal costs in the order of create_url
+   assert eccc_schedule.order_by_cost(lUrlPath, []) == \
+          [hourly(2020, 1), hourly(2020, 2), daily(2019), daily(2020), daily(2018, "52")]
+
+   # Sizes of each station seen in the previous runs
+   lRecord = [eccc_manifest.create_record(daily(2010, "52")[0], "/tmp", "a.csv", 1000000), \
+              eccc_manifest.create_record(daily(2010)[0], "/tmp", "b.csv", 10000)]
+   assert eccc_schedule.order_by_cost(lUrlPath, lRecord) == \
+          [daily(2018, "52"), hourly(2020, 1), hourly(2020, 2), daily(2019), daily(2020)]
+
+def is_recent(lUrlPath, timeNow):
+   return eccc_schedule.is_recent(eccc_manifest.parse_url_request(lUrlPath[0]), timeNow)
+
+def test_recent_in_january():
+   # The previous month is December of the previous year
+   timeNow = datetime.datetime(2021, 1, 15)
+   assert is_recent(hourly(2021, 1), timeNow)
+   assert is_recent(hourly(2020, 12), timeNow)
+   assert not is_recent(hourly(2020, 11), timeNow)
+   assert not is_recent(hourly(2021, 12), timeNow)
+   assert is_recent(daily(2021), timeNow)
+   assert is_recent(daily(2020), timeNow)
+   assert not is_recent(daily(2019), timeNow)
+   assert not is_recent(whole(3), timeNow)
+   assert not is_recent(whole(4), timeNow)
+
+def test_recent_in_march():
+   timeNow = datetime.datetime(2021, 3, 1)
+   assert is_recent(hourly(2021, 3), timeNow)
+   assert is_recent(hourly(2021, 2), timeNow)
+   assert not is_recent(hourly(2021, 1), timeNow)
+   assert is_recent(daily(2021), timeNow)
+   assert not is_recent(daily(2020), timeNow)
+
+def test_split_priority():
+   lUrlPath = [hourly(2021, 1, "2"), hourly(2021, 1), daily(2015), whole(3), daily(2021), \
+               daily(2021, "2"), whole(4)]
+   [lRecent, lBackfill] = eccc_schedule.split_priority(lUrlPath, set(["51"]), datetime.datetime(2021, 1, 15))
+   # Only the recent months of the active stations, in the order of create_url
+   assert lRecent == [hourly(2021, 1), daily(2021)]
+   assert lBackfill == [hourly(2021, 1, "2"), daily(2015), whole(3), daily(2021, "2"), whole(4)]
+
+def test_priority():
+   # Recent lane, then the files of the whole period, then the most recent periods
+   lPriority = [eccc_schedule.get_priority(hourly(2020, 1), True), \
+                eccc_schedule.get_priority(whole(3), False), \
+                eccc_schedule.get_priority(daily(2021), False), \
+                eccc_schedule.get_priority(hourly(2020, 5), False), \
+                eccc_schedule.get_priority(daily(2019), False)]
+   assert lPriority == sorted(lPriority, reverse=True)
+   assert len(set(lPriority)) == len(lPriority)
+
+def test_estimate_plan():
+   lUrlPath = [daily(2018), daily(2019), daily(2020), hourly(2020, 5)]
+   dEstimate = eccc_schedule.estimate_plan(lUrlPath, dHistory)
+   assert dEstimate["requests"] == 4
+   assert dEstimate["bytes"] == 3 * 60000 + 150000
+   assert dEstimate["timeframe"] == { "daily" : [3, 180000], "hourly" : [1, 150000] }
+   assert dEstimate["seconds"] == pytest.approx(3 * 1.12 + 1.3)
+   # With more workers, never shorter than the longest file
+   assert eccc_schedule.estimate_plan(lUrlPath, dHistory, 4)["seconds"] == pytest.approx(1.3)
+
+def test_no_budget():
+   lBackfill = [daily(nYear) for nYear in range(2000, 2010)]
+   assert eccc_schedule.trim_to_budget([], lBackfill, dHistory) == [[], lBackfill, []]
+
+def test_trim_to_max_bytes():
+   lRecent = [hourly(2020, 5)]
+   lBackfill = [daily(nYear) for nYear in range(2010, 2020)]
+   [lRecentKept, lBackfillKept, lTrimmed] = \
+      eccc_schedule.trim_to_budget(lRecent, lBackfill, dHistory, nMaxBytes=350000)
+   # The recent lane first, then the most recent years, in their original order
+   assert lRecentKept == lRecent
+   assert lBackfillKept == [daily(nYear) for nYear in range(2017, 2020)]
+   assert len(lTrimmed) == 7
+   assert eccc_schedule.estimate_plan(lRecentKept + lBackfillKept, dHistory)["bytes"] <= 350000
+
+def test_trim_to_max_time():
+   lBackfill = [daily(nYear) for nYear in range(2000, 2020)]
+   for nWorkers in [1, 4]:
+      [lRecentKept, lBackfillKept, lTrimmed] = \
+         eccc_schedule.trim_to_budget([], lBackfill, dHistory, nWorkers, fMaxTime=5.0)
+      assert eccc_schedule.estimate_plan(lBackfillKept, dHistory, nWorkers)["seconds"] <= 5.0
+      # One more file would not fit
+      lMore = lBackfillKept + [lTrimmed[0]]
+      assert eccc_schedule.estimate_plan(lMore, dHistory, nWorkers)["seconds"] > 5.0
+   assert len(lBackfillKept) == 17
+
+def test_interleave():
+   assert eccc_schedule.interleave([["a1", "a2", "a3"], ["b1", "b2"]]) == ["a1", "b1", "a2", "b2", "a3"]
+   assert eccc_schedule.interleave([[], ["b1"]]) == ["b1"]
+   assert eccc_schedule.interleave([]) == []
+
+def test_trim_without_holes():
+   # The hourly file is longer than the budget, even with many workers: everything after it is trimmed
+   lRecent = [hourly(2020, 5)]
+   lBackfill = [daily(2019)]
+   [lRecentKept, lBackfillKept, lTrimmed] = \
+      eccc_schedule.trim_to_budget(lRecent, lBackfill, dHistory, 8, fMaxTime=1.2)
+   assert [lRecentKept, lBackfillKept] == [[], []]
+   assert lTrimmed == lRecent + lBackfill
+
+def french(lUrlPath):
+   return [lUrlPath[0].replace("bulk_data_e.html", "bulk_data_f.html"), lUrlPath[1].replace("/tmp/", "/tmp/fr_")]
+
+def test_order_by_cost_keeps_languages_together():
+   lUrlPath = eccc_schedule.interleave([[daily(2019), hourly(2020, 1), daily(2020)], \
+                                        [french(daily(2019)), french(hourly(2020, 1)), french(daily(2020))]])
+   assert eccc_schedule.order_by_cost(lUrlPath, []) == \
+          [hourly(2020, 1), french(hourly(2020, 1)), daily(2019), french(daily(2019)), \
+           daily(2020), french(daily(2020))]
+
+def test_order_by_priority():
+   # Time-boxed lane: the most recent periods first whatever their size, the languages interleaved
+   lUrlPath = eccc_schedule.interleave([[daily(2019), hourly(2020, 1), daily(2020), whole(3)], \
+                                        [french(daily(2019)), french(hourly(2020, 1)), \
+                                         french(daily(2020)), french(whole(3))]])
+   assert eccc_schedule.order_by_priority(lUrlPath) == \
+          [whole(3), french(whole(3)), daily(2020), french(daily(2020)), hourly(2020, 1), \
+           french(hourly(2020, 1)), daily(2019), french(daily(2019))]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_search.py
+Description: Tests of eccc_search.py: exact, prefix, fuzzy and code matches,
+ order of the results and the output formats.
+"""
+
+import json
+
+import eccc_search
+
+def make_row(sStation, sName, sClimateID="", sWMO="", sTC="", sFirstYear="1950", sLastYear="2020"):
+   return { "Station ID" : sStation, "Name" : sName, "Province" : "QUEBEC", \
+            "Climate ID" : sClimateID, "WMO ID" : sWMO, "TC ID" : sTC, \
+            "Latitude (Decimal Degrees)" : "45.5", "Longitude (Decimal Degrees)" : "-73.6", \
+            "First Year" : sFirstYear, "Last Year" : sLastYear }
+
+lRow = [make_row("1", "MONTREAL/PIERRE ELLIOTT TRUDEAU INTL", "7025250", "71627", "YUL"), \
+        make_row("2", "MONTRÉAL MCTAVISH", "7024745"), \
+        make_row("3", "ABBOTSFORD A", "1100030", sFirstYear="1990", sLastYear="2000"), \
+        make_row("4", "QUEBEC/JEAN LESAGE INTL", "7016294", sTC="YQB")]
+dIndex = eccc_search.build_index(lRow)
+
+def test_normalize():
+   assert eccc_search.normalize("Montréal/Pierre-Elliott") == "MONTREAL PIERRE ELLIOTT"
+
+def test_every_word_must_match_without_accents():
+   assert sorted(eccc_search.search(dIndex, "montreal")) == ["1", "2"]
+   assert eccc_search.search(dIndex, "Montréal intl") == ["1"]
+   assert eccc_search.search(dIndex, "montreal quebec") == []
+
+def test_codes():
+   assert eccc_search.search(dIndex, "yqb") == ["4"]
+   assert eccc_search.search(dIndex, "7024745") == ["2"]
+   assert eccc_search.search(dIndex, "3") == ["3"]
+
+def test_prefix_and_fuzzy():
+   assert eccc_search.search(dIndex, "abbots") == []
+   assert eccc_search.search(dIndex, "abbots", bPrefix=True) == ["3"]
+   assert eccc_search.search(dIndex, "abotsford") == []
+   assert eccc_search.search(dIndex, "abotsford", bFuzzy=True) == ["3"]
+
+def test_exact_match_before_prefix():
+   dIndexPrefix = eccc_search.build_index([make_row("10", "LESAGE"), make_row("11", "LES CEDRES")])
+   assert eccc_search.search(dIndexPrefix, "les", bPrefix=True) == ["11", "10"]
+
+def test_active_in():
+   assert eccc_search.is_active_in(lRow[2], 1995)
+   assert not eccc_search.is_active_in(lRow[2], 2001)
+   assert not eccc_search.is_active_in(make_row("5", "X", sFirstYear=""), 2000)
+
+def test_formats():
+   lJson = json.loads(eccc_search.format_json(lRow[0:2]))
+   assert lJson[1]["Name"] == "MONTRÉAL MCTAVISH"
+   lLine = eccc_search.format_table(lRow[0:2]).splitlines()
+   assert len(lLine) == 3
+   assert lLine[0].startswith("Station ID")
+   assert lLine[2].split()[0:2] == ["2", "MONTRÉAL"]
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_storage.py
+Description: Tests of eccc_storage.py: ETag of single and multipart uploads,
+ and the comparison with the stored files, in a local directory and in an
+ object storage (mocked with moto).
+"""
+
+import os
+import hashlib
+
+import pytest
+
+import eccc_storage
+
+# Smallest part accepted by S3, except for the last one
+PART_SIZE = 5 * 1024 * 1024
+
+def test_etag():
+   assert eccc_storage.get_etag(b"abc", PART_SIZE) == hashlib.md5(b"abc").hexdigest()
+   content = b"a" * 4 + b"b" * 4 + b"c" * 2
+   sDigest = hashlib.md5(hashlib.md5(b"aaaa").digest() + hashlib.md5(b"bbbb").digest() + \
+                         hashlib.md5(b"cc").digest()).hexdigest()
+   assert eccc_storage.get_etag(content, 4) == sDigest + "-3"
+
+def test_local_change(tmp_path):
+   dStorage = eccc_storage.get_storage(str(tmp_path))
+   sPath = str(tmp_path / "a.csv")
+   assert eccc_storage.get_change(dStorage, sPath, b"a") == "new"
+   eccc_storage.write_file(dStorage, sPath, b"a")
+   assert eccc_storage.get_change(dStorage, sPath, b"a") == "unchanged"
+   assert eccc_storage.get_change(dStorage, sPath, b"b") == "changed"
+   assert eccc_storage.glob_paths(dStorage, str(tmp_path / "*.csv")) == [sPath]
+
+@pytest.fixture
+def s3(monkeypatch):
+   pytest.importorskip("boto3")
+   moto = pytest.importorskip("moto")
+   monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+   monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+   monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+   monkeypatch.delenv("AWS_ENDPOINT_URL", raising=False)
+   eccc_storage.dClient.clear()
+   eccc_storage.dListing.clear()
+   with moto.mock_aws():
+      dStorage = eccc_storage.get_storage("s3://bucket/prefix", nPartSize=PART_SIZE, nConcurrency=2)
+      eccc_storage.get_client(dStorage).create_bucket(Bucket="bucket")
+      yield dStorage
+   eccc_storage.dClient.clear()
+   eccc_storage.dListing.clear()
+
+def test_s3_write_and_change(s3):
+   dStorage = s3
+   contentSmall = b"a,b\n1,2\n"
+   contentLarge = os.urandom(2 * PART_SIZE + 1000)
+   sSmallPath = "s3://bucket/prefix/small.csv"
+   sLargePath = "s3://bucket/prefix/large.csv"
+   assert eccc_storage.is_writable(dStorage, "s3://bucket/prefix")
+   assert eccc_storage.get_change(dStorage, sSmallPath, contentSmall) == "new"
+   eccc_storage.write_file(dStorage, sSmallPath, contentSmall, "0" * 64)
+   eccc_storage.write_file(dStorage, sLargePath, contentLarge)
+
+   dObject = eccc_storage.get_client(dStorage).head_object(Bucket="bucket", Key="prefix/small.csv")
+   assert dObject["Metadata"]["sha256"] == "0" * 64
+
+   # The ETags computed from the content are the ones of the service, listed again
+   eccc_storage.dListing.clear()
+   dListing = eccc_storage.list_directory(dStorage, "s3://bucket/prefix/")
+   assert dListing[sSmallPath] == eccc_storage.get_etag(contentSmall, PART_SIZE)
+   assert dListing[sLargePath] == eccc_storage.get_etag(contentLarge, PART_SIZE)
+   assert dListing[sLargePath].endswith("-3")
+   assert eccc_storage.get_change(dStorage, sSmallPath, contentSmall) == "unchanged"
+   assert eccc_storage.get_change(dStorage, sLargePath, contentLarge) == "unchanged"
+   assert eccc_storage.get_change(dStorage, sLargePath, contentLarge[1:]) == "changed"
+
+   assert sorted(eccc_storage.glob_paths(dStorage, "s3://bucket/prefix/*.csv")) == [sLargePath, sSmallPath]
+   assert eccc_storage.glob_paths(dStorage, "s3://bucket/prefix/s*.csv") == [sSmallPath]
+
+def test_normalize_directory():
+   assert eccc_storage.normalize_directory("s3://bucket/prefix/") == "s3://bucket/prefix"
+   assert eccc_storage.normalize_directory("/tmp/") == "/tmp/"
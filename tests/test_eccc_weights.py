@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+"""
+Name:        test_eccc_weights.py
+Description: Tests of eccc_weights.py: correlations and reuse of the previous run.
+"""
+
+import numpy
+
+import eccc_weights
+
+def make_stations(nStation, nSeed=0):
+   """
+   Station rows and representative years of nStation stations, some days missing.
+   """
+
+   rand = numpy.random.RandomState(nSeed)
+   lStationRow = []
+   dYear = {}
+   for i in range(nStation):
+      sStation = str(100 + i)
+      lStationRow.append({ "Station ID" : sStation, \
+                           "Latitude (Decimal Degrees)" : "%.3f" % rand.uniform(45.0, 55.0), \
+                           "Longitude (Decimal Degrees)" : "%.3f" % rand.uniform(-125.0, -115.0) })
+      arrYear = rand.gamma(0.5, 4.0, len(eccc_weights.lDayIndex))
+      arrYear[rand.rand(len(arrYear)) < 0.1] = numpy.nan
+      dYear[sStation] = arrYear
+
+   return [lStationRow, dYear]
+
+def test_pairwise_correlation_matches_numpy():
+   rand = numpy.random.RandomState(1)
+   arrA = rand.rand(3, 50)
+   arrB = rand.rand(3, 50)
+   arrCorr = eccc_weights.pairwise_correlation(arrA, arrB)
+   for i in range(3):
+      assert abs(arrCorr[i] - numpy.corrcoef(arrA[i], arrB[i])[0, 1]) < 1e-12
+
+def test_pairwise_correlation_uses_complete_pairs():
+   arrA = numpy.array([[1.0, 2.0, numpy.nan, 4.0, 5.0]])
+   arrB = numpy.array([[2.0, 4.0, 100.0, 8.0, numpy.nan]])
+   arrCorr = eccc_weights.pairwise_correlation(arrA, arrB)
+   assert abs(arrCorr[0] - 1.0) < 1e-12
+
+   # Less than 2 complete days: no correlation
+   arrCorr = eccc_weights.pairwise_correlation(numpy.array([[1.0, numpy.nan]]), \
+                                               numpy.array([[1.0, 2.0]]))
+   assert numpy.isnan(arrCorr[0])
+
+def test_update_reuses_unchanged_pairs():
+   [lStationRow, dYear] = make_stations(12)
+   setActive = set(["100", "101", "102"])
+   [lRow, dFingerprint, nComputed] = eccc_weights.update_weights(lStationRow, dYear, setActive, {}, {}, 5)
+   assert len(lRow) == 15
+   assert nComputed == 15
+
+   dPreviousWeight = dict(((row["active_station"], row["station_id"]), row) for row in lRow)
+   [lRowAgain, dFingerprintAgain, nComputed] = \
+      eccc_weights.update_weights(lStationRow, dYear, setActive, dPreviousWeight, dFingerprint, 5)
+   assert nComputed == 0
+   assert lRowAgain == lRow
+   assert dFingerprintAgain == dFingerprint
+
+def test_update_recomputes_pairs_of_changed_station():
+   [lStationRow, dYear] = make_stations(12)
+   setActive = set(["100", "101", "102"])
+   [lRow, dFingerprint, nComputed] = eccc_weights.update_weights(lStationRow, dYear, setActive, {}, {}, 5)
+   dPreviousWeight = dict(((row["active_station"], row["station_id"]), row) for row in lRow)
+
+   dYear["101"] = numpy.roll(dYear["101"], 30)
+   [lRowIncremental, dFingerprint, nComputed] = \
+      eccc_weights.update_weights(lStationRow, dYear, setActive, dPreviousWeight, dFingerprint, 5)
+   [lRowFull, dFingerprintFull, nComputedFull] = \
+      eccc_weights.update_weights(lStationRow, dYear, setActive, {}, {}, 5)
+
+   nPairWithChanged = len([row for row in lRow if "101" in (row["active_station"], row["station_id"])])
+   assert nComputed == nPairWithChanged
+   assert 0 < nComputed < nComputedFull
+   assert lRowIncremental == lRowFull
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_eccc_xml.py
+Description: Tests of eccc_xml.py: rows of the daily and hourly XML files with
+ the columns of the CSV files, their conversion to CSV, a converted file
+ listed once, and the XML files read by the climatology and the rollups.
+"""
+
+import os
+import csv
+
+import eccc_xml
+import eccc_rollup
+import eccc_manifest
+import eccc_climatology
+
+STATION_INFORMATION = '<?xml version="1.0" encoding="UTF-8"?>\n<climatedata>\n<lang>FRA</lang>\n' + \
+                      '<stationinformation>\n<name>ABBOTSFORD A</name>\n<province>BRITISH COLUMBIA</province>\n' + \
+                      '<latitude>49.03</latitude>\n<longitude>-122.36</longitude>\n' + \
+                      '<climate_identifier>1100030</climate_identifier>\n</stationinformation>\n'
+
+def write_daily_xml(sPath):
+   with open(sPath, 'w', encoding='utf-8') as fileXml:
+      fileXml.write(STATION_INFORMATION + \
+                    '<stationdata day="1" month="1" year="2020" quality="">\n' + \
+                    '<maxtemp units="C">5.5</maxtemp>\n<totalprecipitation flag="T">0.0</totalprecipitation>\n' + \
+                    '<unknown>1</unknown>\n</stationdata>\n' + \
+                    '<stationdata day="2" month="1" year="2020" quality="">\n' + \
+                    '<maxtemp units="C"></maxtemp>\n</stationdata>\n</climatedata>\n')
+
+def write_hourly_xml(sPath):
+   with open(sPath, 'w', encoding='utf-8') as fileXml:
+      fileXml.write(STATION_INFORMATION + \
+                    '<stationdata day="3" month="2" year="2020" hour="7" minute="0">\n' + \
+                    '<temp>-1.5</temp>\n<weather>Snow</weather>\n</stationdata>\n</climatedata>\n')
+
+def test_station_information(tmp_path):
+   write_daily_xml(str(tmp_path / "a.xml"))
+   dStation = eccc_xml.read_station_information(str(tmp_path / "a.xml"))
+   assert dStation["name"] == "ABBOTSFORD A"
+   assert dStation["climate_identifier"] == "1100030"
+
+def test_daily_rows(tmp_path):
+   write_daily_xml(str(tmp_path / "a.xml"))
+   lRow = list(eccc_xml.iter_rows(str(tmp_path / "a.xml")))
+   assert len(lRow) == 2
+   [bHourly, dRow] = lRow[0]
+   assert not bHourly
+   assert dRow["Date/Time"] == "2020-01-01"
+   assert dRow["Max Temp (°C)"] == "5.5"
+   assert dRow["Total Precip Flag"] == "T"
+   assert dRow["Station Name"] == "ABBOTSFORD A"
+   assert set(dRow.keys()) <= set(eccc_xml.DAILY_COLUMNS)
+   assert lRow[1][1]["Max Temp (°C)"] == ""
+
+def test_hourly_rows(tmp_path):
+   write_hourly_xml(str(tmp_path / "h.xml"))
+   [[bHourly, dRow]] = list(eccc_xml.iter_rows(str(tmp_path / "h.xml")))
+   assert bHourly
+   assert dRow["Date/Time (LST)"] == "2020-02-03 07:00"
+   assert dRow["Temp (°C)"] == "-1.5"
+   assert dRow["Weather"] == "Snow"
+   assert set(dRow.keys()) <= set(eccc_xml.HOURLY_COLUMNS)
+
+def test_convert_file(tmp_path):
+   write_daily_xml(str(tmp_path / "a.xml"))
+   assert eccc_xml.convert_file(str(tmp_path / "a.xml"), str(tmp_path / "a.csv")) == 2
+   with open(str(tmp_path / "a.csv"), 'r', encoding='utf-8-sig') as fileCsv:
+      lRow = list(csv.DictReader(fileCsv))
+   assert list(lRow[0].keys()) == eccc_xml.DAILY_COLUMNS
+   assert lRow[0]["Total Precip (mm)"] == "0.0"
+   assert lRow[1]["Total Precip (mm)"] == ""
+
+def test_converted_file_is_listed_once(tmp_path):
+   sDirectory = str(tmp_path / "1100" / "daily")
+   os.makedirs(sDirectory)
+   sXmlPath = os.path.join(sDirectory, "en_climate_daily_BC_1100030_2020_P1D.xml")
+   write_daily_xml(sXmlPath)
+   write_daily_xml(os.path.join(sDirectory, "en_climate_daily_BC_1100030_2021_P1D.xml"))
+   eccc_xml.convert_file(sXmlPath, sXmlPath[0:-len(".xml")] + ".csv")
+
+   lFile = eccc_manifest.list_downloaded_files(str(tmp_path), "daily")
+   assert [os.path.basename(sPath) for (sStation, sPath) in lFile] == \
+          ["en_climate_daily_BC_1100030_2020_P1D.csv", "en_climate_daily_BC_1100030_2021_P1D.xml"]
+
+def test_table_of_csv_and_xml(tmp_path):
+   write_daily_xml(str(tmp_path / "a.xml"))
+   eccc_xml.convert_file(str(tmp_path / "a.xml"), str(tmp_path / "a.csv"))
+   assert list(eccc_xml.iter_table(str(tmp_path / "a.xml"))) == \
+          list(eccc_xml.iter_table(str(tmp_path / "a.csv")))
+
+def test_climatology_of_xml(tmp_path):
+   write_daily_xml(str(tmp_path / "a.xml"))
+   lRow = eccc_climatology.build_station("1", [str(tmp_path / "a.xml")])
+   assert [row["index"] for row in lRow] == ["1-1", "1-2"]
+   assert float(lRow[0]["mean_total_precip"]) == 0.0
+   assert lRow[1]["mean_total_precip"] == "NA"
+   assert lRow[0]["station_name"] == "ABBOTSFORD A"
+
+def test_rollup_of_xml(tmp_path):
+   write_hourly_xml(str(tmp_path / "h.xml"))
+   dDay = eccc_rollup.aggregate_file(str(tmp_path / "h.xml"))
+   assert dDay[("2020-02-03", eccc_rollup.clean_column_name("Temp (°C)"))] == [-1.5, 1, -1.5, -1.5]
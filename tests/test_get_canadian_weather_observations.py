@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see  <http://www.gnu.org/licenses/>.
+############################################################################
+
+
+"""
+Name:        test_get_canadian_weather_observations.py
+Description: Tests of get_canadian_weather_observations.py that do not need the
+ network nor the ECCC station list.
+"""
+
+import os
+import sys
+import zlib
+import datetime
+import subprocess
+
+import get_canadian_weather_observations
+
+def test_parse_shard():
+   assert get_canadian_weather_observations.parse_shard("1/1") == [1, 1]
+   assert get_canadian_weather_observations.parse_shard("3/4") == [3, 4]
+   for sShard in ["0/4", "5/4", "1/0", "-1/4", "a/4", "1/b", "4", "1/2/3", ""]:
+      assert get_canadian_weather_observations.parse_shard(sShard) is None
+
+def test_shards_split_the_stations_once():
+   lStation = [str(nStation) for nStation in range(1, 501)]
+   llShard = [get_canadian_weather_observations.select_shard(lStation, nShard, 4, "station") \
+              for nShard in range(1, 5)]
+   assert sorted(sum(llShard, []), key=int) == lStation
+   for (i, lShard) in enumerate(llShard):
+      assert len(lShard) > 0
+      assert all(zlib.crc32(sStation.encode()) % 4 == i for sStation in lShard)
+
+def test_shards_are_stable():
+   # crc32 gives the same split in every process and on every host, unlike hash()
+   lStation = [str(nStation) for nStation in range(1, 21)]
+   assert get_canadian_weather_observations.select_shard(lStation, 1, 3, "station") == \
+          ["7", "9", "10", "11", "12", "14", "16", "18", "20"]
+   assert get_canadian_weather_observations.select_shard(lStation, 2, 3, "station") == \
+          ["2", "3", "4", "5", "6", "15", "19"]
+   assert get_canadian_weather_observations.select_shard(lStation, 3, 3, "station") == \
+          ["1", "8", "13", "17"]
+
+def test_shards_by_province(monkeypatch):
+   dStationList = {}
+   for (sProvince, nCount) in [("BRITISH COLUMBIA", 6), ("ONTARIO", 4), ("QUEBEC", 3), ("ALBERTA", 2)]:
+      for i in range(nCount):
+         dStationList[str(len(dStationList) + 1)] = { "Province" : sProvince }
+   monkeypatch.setattr(get_canadian_weather_observations, "dStationList", dStationList)
+   monkeypatch.setattr(get_canadian_weather_observations, "dProvCode", \
+                       get_canadian_weather_observations.dProvEN)
+   lStation = sorted(dStationList.keys(), key=int)
+
+   # Largest province first, in the least loaded shard: BC, ON, then QC with ON and AB with BC
+   lFirst = get_canadian_weather_observations.select_shard(lStation, 1, 2, "province")
+   lSecond = get_canadian_weather_observations.select_shard(lStation, 2, 2, "province")
+   assert set(dStationList[sStation]["Province"] for sStation in lFirst) == \
+          set(["BRITISH COLUMBIA", "ALBERTA"])
+   assert set(dStationList[sStation]["Province"] for sStation in lSecond) == \
+          set(["ONTARIO", "QUEBEC"])
+   assert [len(lFirst), len(lSecond)] == [8, 7]
+   assert sorted(lFirst + lSecond, key=int) == lStation
+
+def test_active_stations_from_station_list(monkeypatch):
+   nYear = datetime.datetime.now().year
+   dStationList = { "1" : { "DLY Last Year" : str(nYear), "HLY Last Year" : "" }, \
+                    "2" : { "DLY Last Year" : str(nYear - 2), "HLY Last Year" : str(nYear - 1) }, \
+                    "3" : { "DLY Last Year" : str(nYear - 2), "HLY Last Year" : "" }, \
+                    "4" : { "DLY Last Year" : "", "HLY Last Year" : "" } }
+   monkeypatch.setattr(get_canadian_weather_observations, "dStationList", dStationList)
+   assert get_canadian_weather_observations.get_active_stations(["1", "2", "3", "4"], None) == \
+          set(["1", "2"])
+
+def test_active_stations_from_file(tmp_path):
+   sPath = str(tmp_path / "active.csv")
+   with open(sPath, "w") as fileActive:
+      fileActive.write("ec_station_id,name\n51,A\n 52 ,B\nx,C\n\n")
+   assert get_canadian_weather_observations.get_active_stations([], sPath) == set(["51", "52"])
+
+def test_slow_modules_not_imported():
+   sScriptDirectory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+   sCode = "import sys, get_canadian_weather_observations\n" + \
+           "print(' '.join(sorted(sModule for sModule in sys.modules)))"
+   sOutput = subprocess.check_output([sys.executable, "-c", sCode], cwd=sScriptDirectory, \
+                                     universal_newlines=True)
+   lModule = sOutput.split()
+   for sModule in ["urllib.request", "dateutil", "progress", "multiprocessing", "email.message"]:
+      assert sModule not in lModule
+
+def test_get_filename():
+   assert get_canadian_weather_observations.get_filename('attachment; filename="a b.csv"') == "a b.csv"
+   assert get_canadian_weather_observations.get_filename("attachment; filename=en_climate_daily.csv") == \
+          "en_climate_daily.csv"
+
+def test_parse_size():
+   assert get_canadian_weather_observations.parse_size("500M") == 500000000
+   assert get_canadian_weather_observations.parse_size("2.5g") == 2500000000
+   assert get_canadian_weather_observations.parse_size(" 1024 ") == 1024
+   assert get_canadian_weather_observations.parse_size("-1K") is None
+   assert get_canadian_weather_observations.parse_size("MB") is None
+
+def test_create_directories_once(tmp_path, monkeypatch):
+   import eccc_storage
+
+   lChecked = []
+   is_directory = eccc_storage.is_directory
+   def count_directory(dStorage, sDirectory):
+      lChecked.append(sDirectory)
+      return is_directory(dStorage, sDirectory)
+   monkeypatch.setattr(eccc_storage, "is_directory", count_directory)
+
+   lDirectory = [str(tmp_path / "1" / "daily"), str(tmp_path / "2" / "daily")] * 3
+   get_canadian_weather_observations.create_directories(lDirectory, True)
+   assert sorted(lChecked) == sorted(set(lDirectory))
+   assert not (tmp_path / "1").exists()
+
+   get_canadian_weather_observations.create_directories(lDirectory, False)
+   assert (tmp_path / "1" / "daily").is_dir() and (tmp_path / "2" / "daily").is_dir()
+
+def test_json_info_alone_on_stdout(tmp_path):
+   import json
+   import eccc_benchmark
+
+   sStationPath = str(tmp_path / "stations.csv")
+   eccc_benchmark.write_station_list(sStationPath, 5)
+   sScriptPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts", \
+                              "get_canadian_weather_observations.py")
+   # The unknown station prints a warning, which must not be mixed with the JSON
+   process = subprocess.run([sys.executable, sScriptPath, "--info", "--info-format", "json", "-v", \
+                             "-S", sStationPath, "2", "99999"], \
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+   assert process.returncode == 0
+   assert [dStation["Station ID"] for dStation in json.loads(process.stdout)] == ["2"]
+   assert "99999" in process.stderr